@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+лента изменений /api/feed/ работает только здесь, запуск:
+    uvicorn app.asgi:application --workers 1
+брокер ленты живет в памяти процесса, поэтому воркер один
+(или пишущие запросы и подписчики должны попадать в один процесс).
 """
 
 import os
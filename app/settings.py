@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # первым, чтобы время и запросы к БД остальных middleware тоже попадали в метрики
+    'tasks.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -54,6 +59,22 @@ MIDDLEWARE = [
 MEDIA_ROOT = BASE_DIR / "media"
 MEDIA_URL = "/media/"
 
+# файлы из MEDIA_ROOT отдает tasks.media: MEDIA_ACCEL = 'nginx' (X-Accel-Redirect на
+# internal-локацию MEDIA_ACCEL_PREFIX) или 'apache' (X-Sendfile), пусто - отдает сам Django
+MEDIA_ACCEL = os.environ.get('MEDIA_ACCEL', '')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_CACHE_MAX_AGE = 24 * 3600
+
+if MEDIA_ACCEL not in ('', 'nginx', 'apache'):
+    raise ImproperlyConfigured(f"MEDIA_ACCEL должен быть 'nginx', 'apache' или пустым, а не {MEDIA_ACCEL!r}")
+
+# превью картинок задач и комментариев: размер - наибольшая сторона в пикселях.
+# THUMBNAIL_WORKERS = 0 - делать превью сразу в запросе, без пула
+THUMBNAIL_SIZES = {'small': 160, 'medium': 640}
+THUMBNAIL_FORMATS = ('webp', 'jpeg')
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -79,13 +100,169 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# база выбирается переменными окружения. по умолчанию SQLite, DB_ENGINE=postgres -
+# PostgreSQL через psycopg. DB_SQLITE_WAL=1 переводит SQLite в WAL-режим, чтобы читатели
+# не ждали писателя. режим пишется в сам файл базы и рядом появляются -wal/-shm,
+# поэтому для db.sqlite3 из репозитория он выключен
+# тесты гоняются на обеих: DB_ENGINE=postgres DB_HOST=... python -m pytest
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'taskmanager'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('DB_POOL', '1') == '1':
+        # встроенный пул psycopg (Django 5.1+). с пулом CONN_MAX_AGE должен быть 0
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'OPTIONS': {
+                # timeout - это busy_timeout в секундах, IMMEDIATE берет блокировку
+                # на запись сразу и не ловит "database is locked" посреди транзакции
+                'timeout': int(os.environ.get('DB_TIMEOUT', 20)),
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+    if os.environ.get('DB_SQLITE_WAL', '0') == '1':
+        DATABASES['default']['OPTIONS']['init_command'] = 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;'
+else:
+    raise ImproperlyConfigured(f"DB_ENGINE должен быть 'sqlite' или 'postgres', а не {DB_ENGINE!r}")
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/pagination/
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'tasks.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+    # тот же JSON, что у JSONRenderer, но через orjson, если он установлен (pip install orjson)
+    'DEFAULT_RENDERER_CLASSES': [
+        'tasks.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# ASYNC_API=1: list/retrieve/stats/board/выгрузки вьюсетов - корутины (см. AsyncViewSetMixin).
+# по умолчанию выключено и под uvicorn: async ORM все равно ходит в БД из потока, и в
+# benchmark_asgi (в т.ч. с --idle 5000) корутины не быстрее sync view ни в одном режиме.
+# под WSGI не включать: там Django гоняет корутину через async_to_sync.
+# под ASGI у каждого запроса свой поток, постоянные соединения (DB_CONN_MAX_AGE) не
+# переиспользуются, а копятся - там DB_CONN_MAX_AGE=0 или пул psycopg (DB_POOL)
+ASYNC_API = os.environ.get('ASYNC_API', '0') == '1'
+
+# потолок для ?page_size=, чтобы один клиент не выкачал всю таблицу за раз
+API_MAX_PAGE_SIZE = 500
+
+# сколько элементов можно передать в /api/tasks/bulk/ за один запрос
+API_BULK_MAX_ITEMS = 500
+
+# сколько секунд живет закешированный /api/tasks/stats/ (сбрасывается и раньше, при изменении задач;
+# с locmem - только в том процессе, где была правка, в остальных не позже этого срока)
+TASK_STATS_CACHE_TTL = 30
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# CACHE_BACKEND=locmem (по умолчанию) | file | redis, CACHE_LOCATION - каталог или redis://...
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+
+CACHE_LOCATIONS = {
+    'locmem': 'taskmanager',
+    'file': str(BASE_DIR / '.cache'),
+    'redis': 'redis://127.0.0.1:6379/0',
+}
+
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    raise ImproperlyConfigured(f"CACHE_BACKEND должен быть одним из {sorted(CACHE_BACKENDS)}, а не {CACHE_BACKEND!r}")
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_LOCATIONS[CACHE_BACKEND]),
+        'OPTIONS': {'MAX_ENTRIES': 10000} if CACHE_BACKEND != 'redis' else {},
     }
 }
 
+# кеш ответов list/retrieve/board и ETag (CachedReadMixin). ответ устаревает по меткам
+# версий моделей в кеше, поэтому кеш должен быть общим для всех процессов: в locmem правка
+# в одном воркере (или в run_jobs, generate_data) не сдвинет метку в других, и они до
+# API_CACHE_TIMEOUT отдают старые 200 и 304. с locmem кеш ответов выключен, ETag тогда
+# считается по телу ответа и 304 по If-None-Match все равно отдается
+API_CACHE = CACHE_BACKEND != 'locmem'
+
+# сколько живут закешированные ответы list/retrieve (устаревают и раньше, по версиям моделей)
+API_CACHE_TIMEOUT = 300
+
+# лента изменений /api/feed/: пинг простаивающего соединения (сек) и сколько кадров
+# ждет медленного клиента, прежде чем ему уйдет resync
+FEED_HEARTBEAT = 15
+FEED_QUEUE_SIZE = 100
+
+# /api/sync/: сколько изменений максимум отдается дельтой (больше - клиенту reset)
+# и сколько дней хранятся надгробия удаленных строк (команда purge_tombstones)
+SYNC_MAX_CHANGES = 5000
+SYNC_TOMBSTONE_DAYS = 30
+
+# самый длинный период /api/timetracking/report/ в днях
+TIME_REPORT_MAX_DAYS = 2 * 366
+
+# фоновые задачи (/api/jobs/, команда run_jobs): очередь - таблица в БД, брокер не нужен.
+# результаты лежат вне MEDIA_ROOT (их отдает только /api/jobs/<id>/result/ владельцу)
+# и удаляются через JOB_RESULT_TTL секунд. JOB_LEASE - сколько секунд задача числится
+# за воркером без продления: упавший воркер отдает ее другому, но не больше JOB_MAX_ATTEMPTS раз
+JOB_RESULTS_ROOT = os.environ.get('JOB_RESULTS_ROOT', BASE_DIR / 'job_results')
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 24 * 3600))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_POLL_INTERVAL = 1.0
+JOB_LEASE = 5 * 60
+JOB_MAX_ATTEMPTS = 3
+
+# сессии читаются из кеша, в БД - только запись и промах кеша
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# вторая ступень (TOTP) - подписанная кука, проверяется без обращения к сессии
+SECOND_FACTOR_TTL = 10 * 60
+SECOND_FACTOR_COOKIE = 'second_factor'
+
+# запрос, сделавший больше стольких обращений к БД, пишется в лог tasks.metrics (признак N+1)
+METRICS_QUERY_THRESHOLD = int(os.environ.get('METRICS_QUERY_THRESHOLD', 30))
+
+# кому отдается /metrics (имена маршрутов, объем трафика, задержки): запросам с заголовком
+# Authorization: Bearer <METRICS_TOKEN> (bearer_token в scrape_config Prometheus), с адресов
+# METRICS_ALLOWED_IPS и сотрудникам (is_staff). остальным - 403. адреса сверяются с REMOTE_ADDR,
+# а за обратным прокси это адрес прокси - там хватит токена
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
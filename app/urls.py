@@ -3,7 +3,6 @@ from rest_framework.routers import DefaultRouter
 from tasks import views
 from django.conf import settings
 from django.contrib import admin
-from django.conf.urls.static import static
 
 from tasks.api import *
 
@@ -14,9 +13,15 @@ router.register(r'tasks', TaskViewSet)
 router.register(r'comments', CommentViewSet)
 router.register(r'timetracking', TimeTrackingViewSet)
 router.register(r'users', UserViewSet, basename='users')
+router.register(r'search', SearchViewSet, basename='search')
+router.register(r'feed', FeedViewSet, basename='feed')
+router.register(r'sync', SyncViewSet, basename='sync')
+router.register(r'jobs', JobViewSet, basename='jobs')
 
 urlpatterns = [
     path("", views.ShowTaskView.as_view(), name="tasks"),
     path("admin/", admin.site.urls),
+    path("metrics", views.MetricsView.as_view(), name="metrics"),
     path("api/", include(router.urls)),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", views.media, name="media"),
+]
\ No newline at end of file
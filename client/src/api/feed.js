@@ -0,0 +1,37 @@
+// лента изменений досок (/api/feed/, Server-Sent Events) вместо переопроса списков.
+// handlers: { 'task.created': fn(data), ..., resync: fn() }.
+// EventSource сам переподключается, после переподключения зовем resync -
+// пока соединения не было, события могли потеряться
+export function subscribeFeed(projectIds, handlers) {
+  const params = new URLSearchParams();
+  for (const id of projectIds) {
+    params.append('project', id);
+  }
+  const source = new EventSource(`/api/feed/?${params}`, { withCredentials: true });
+
+  let connected = false;
+  source.addEventListener('ready', () => {
+    if (connected && handlers.resync) {
+      handlers.resync();
+    }
+    connected = true;
+  });
+  for (const [event, handler] of Object.entries(handlers)) {
+    source.addEventListener(event, (e) => handler(JSON.parse(e.data)));
+  }
+  return source;
+}
+
+// вставить/заменить/убрать элемент списка по дельте из ленты
+export function applyDelta(list, action, data) {
+  const index = list.findIndex((item) => item.id === data.id);
+  if (action === 'deleted') {
+    return index === -1 ? list : list.filter((item) => item.id !== data.id);
+  }
+  if (index === -1) {
+    return [data, ...list];
+  }
+  const copy = [...list];
+  copy[index] = data;
+  return copy;
+}
@@ -0,0 +1,15 @@
+import axios from 'axios';
+
+// списки на бэке отдаются курсорными страницами ({next, previous, results}),
+// а экранам пока нужен весь список целиком (фильтрация идет на клиенте),
+// поэтому идем по ссылкам next до конца
+export async function fetchAll(url, client = axios) {
+  const results = [];
+  let r = await client.get(url, { params: { page_size: 500 } });
+  results.push(...r.data.results);
+  while (r.data.next) {
+    r = await client.get(r.data.next);
+    results.push(...r.data.results);
+  }
+  return results;
+}
@@ -1,20 +1,30 @@
 from django.contrib import admin
-from .models import Project, Column, Task, Comment, TimeTracking, UserProfile
+from .models import Project, Column, Task, Comment, TimeTracking, UserProfile, ProjectStats, Job
+from .signals import delete_cascade
+
+class CascadeDeleteAdmin(admin.ModelAdmin):
+    """удаление из админки тоже идет через delete_cascade"""
+
+    def delete_model(self, request, obj):
+        delete_cascade(type(obj).objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_cascade(queryset)
 
 @admin.register(Project)
-class ProjectAdmin(admin.ModelAdmin):
+class ProjectAdmin(CascadeDeleteAdmin):
     list_display = ['id', 'name', 'created_at']
     list_filter = ['created_at']
     search_fields = ['name', 'description']
 
 @admin.register(Column)
-class ColumnAdmin(admin.ModelAdmin):
+class ColumnAdmin(CascadeDeleteAdmin):
     list_display = ['id', 'name', 'project', 'order']
     list_filter = ['project']
     search_fields = ['name']
 
 @admin.register(Task)
-class TaskAdmin(admin.ModelAdmin):
+class TaskAdmin(CascadeDeleteAdmin):
     list_display = ['id', 'title', 'column', 'priority', 'status', 'created_at']
     list_filter = ['column', 'priority', 'status', 'created_at']
     search_fields = ['title', 'description']
@@ -40,4 +50,16 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_filter = ['type', 'created_at']
     search_fields = ['user__username', 'name']
     raw_id_fields = ['user']
-    readonly_fields = ['totp_key']
\ No newline at end of file
+    readonly_fields = ['totp_key']
+
+@admin.register(ProjectStats)
+class ProjectStatsAdmin(admin.ModelAdmin):
+    list_display = ['project', 'task_count', 'comment_count', 'time_entry_count', 'open_time_entries', 'tracked_seconds']
+    readonly_fields = [field.name for field in ProjectStats._meta.fields]
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'user', 'created_at', 'finished_at', 'attempts', 'worker']
+    list_filter = ['status', 'kind', 'created_at']
+    raw_id_fields = ['user']
+    readonly_fields = ['started_at', 'finished_at', 'locked_until', 'attempts', 'worker', 'result', 'summary', 'error']
@@ -0,0 +1,44 @@
+"""независимые запросы к БД одновременно, для async-обработчиков вьюсетов.
+
+асинхронный ORM Django (aget, acount, aaggregate, aiterator) - это тот же
+синхронный запрос в sync_to_async(thread_sensitive=True), то есть в одном потоке
+на HTTP-запрос. поэтому asyncio.gather по async ORM внутри одного запроса
+выполняет запросы все равно по очереди.
+
+gather() запускает каждый запрос в своем потоке со своим соединением (из пула
+psycopg или по CONN_MAX_AGE), и три запроса доски занимают время самого долгого,
+а не сумму. внутри транзакции (ATOMIC_REQUESTS, тесты) другие соединения не видят
+незакоммиченного - тогда запросы идут по очереди в потоке запроса.
+
+свое соединение запрос на время gather() отдает: с пулом psycopg на 10 соединений
+сотня запросов, каждый из которых держит одно и ждет еще три, разобрала бы пул
+целиком и ждала бы друг друга до PoolTimeout"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connection
+
+
+def run_in_transaction_or_release(queries):
+    if connection.in_atomic_block:
+        return [query() for query in queries]
+    connection.close()
+    return None
+
+
+def run_in_own_connection(query):
+    try:
+        return query()
+    finally:
+        # соединение этого потока: закрыть по CONN_MAX_AGE или вернуть в пул
+        close_old_connections()
+
+
+async def gather(*queries):
+    """результаты запросов (функций без аргументов) в том же порядке"""
+    results = await sync_to_async(run_in_transaction_or_release)(queries)
+    if results is not None:
+        return results
+    return await asyncio.gather(*(
+        sync_to_async(run_in_own_connection, thread_sensitive=False)(query) for query in queries
+    ))
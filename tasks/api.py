@@ -4,28 +4,44 @@ from rest_framework import mixins, serializers
 from rest_framework.permissions import IsAuthenticated, BasePermission
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
 from rest_framework import serializers
-from rest_framework.exceptions import PermissionDenied
-from tasks.permissions import SecondFactorPermission
+from rest_framework.exceptions import NotAuthenticated, PermissionDenied
+from tasks.permissions import SecondFactorPermission, grant_second_factor, revoke_second_factor, second_factor_expire
+from tasks.mixins import QueryPlanMixin, ExportMixin, CachedReadMixin, ValuesListMixin, AsyncViewSetMixin, CascadeDeleteMixin
+from tasks import exporters, jobs
+from tasks.stats import acached_task_stats, aproject_counter, cached_task_stats, project_counter, rebuild_project_stats
+from tasks.bulk import bulk_create_tasks, bulk_update_tasks, bulk_delete_tasks
+from tasks.ordering import move, move_anchor, next_positions
+from tasks.search import search
+from tasks.feed import EventStreamRenderer, feed_response, is_asgi, publish_change
+from tasks.sync import changes_since
+from tasks.timereport import report as time_report
+from tasks.board import aboard_snapshot, board_snapshot
+from tasks.caching import CachedResponse
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate, login, logout
-from django.http import HttpResponse
-import openpyxl
 from django.db.models import Count
+from django.http import FileResponse
 from django.utils import timezone
-from datetime import timedelta
 
 from .models import *
 from .serializers import (
     ProjectSerializer, ColumnSerializer, TaskSerializer, 
-    CommentSerializer, TimeTrackingSerializer, UserProfileSerializer
+    CommentSerializer, TimeTrackingSerializer, UserProfileSerializer,
+    ProjectStatsSerializer, MoveSerializer, SearchQuerySerializer, FeedQuerySerializer,
+    SyncQuerySerializer, TimeReportQuerySerializer, JobSerializer, ThumbnailJobSerializer
 )
 
 """вопрос: почему нет декоратора?
 ответ: потому что у нас уже есть CRUD. без С. следовательно мы назначаем пермишены, если юзер хочет сделать другие операции со страницей"""
 
-class ProjectViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, mixins.DestroyModelMixin):
+class ProjectViewSet(AsyncViewSetMixin, CascadeDeleteMixin, CachedReadMixin, ValuesListMixin, QueryPlanMixin, ExportMixin, GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, mixins.DestroyModelMixin):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
+    cache_dependencies = (Project,)
+    exporter = exporters.PROJECTS
+    ordering = ('-created_at', 'id')
     permission_classes = [IsAuthenticated]
 
     def get_permissions(self):
@@ -43,6 +59,7 @@ class ProjectViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModel
         if user_id:
             qs = qs.filter(user_id=user_id)
         
+        qs = qs.order_by(*self.ordering)
         return qs
 
 
@@ -68,41 +85,56 @@ class ProjectViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModel
         stats = Project.objects.aggregate(count = Count("*"))
         serializer = self.StatsSerializer(instance=stats)
         return Response(serializer.data)
-    
-    @action(detail=False, methods=["GET"], url_path="export-excel")
-    def export_excel(self, request, *args, **kwargs):
-        """экспорт проектов в файл Excel. для этого нам нужен опенпихл"""
-        projects = self.get_queryset()
-        
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Проекты"
-        
-        ws.append(["ID", "Название", "Описание", "Дата создания", "Пользователь"])
-        
-        for p in projects:
-            ws.append([
-                p.id,
-                p.name,
-                p.description or "",
-                p.created_at.strftime('%d.%m.%Y %H:%M') if p.created_at else "",
-                p.user.username if p.user else "",
-            ])
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
 
-        response['Content-Disposition'] = 'attachment; filename="projects.xlsx"'
-        
-        wb.save(response)
-        return response
+    async def aget_stats(self, request, *args, **kwargs):
+        stats = await Project.objects.aaggregate(count=Count("*"))
+        return Response(self.StatsSerializer(instance=stats).data)
+
+    @action(detail=True, methods=["GET"], url_path="stats")
+    def get_project_stats(self, request, *args, **kwargs):
+        """счетчики одного проекта из ProjectStats - одна строка по первичному ключу"""
+        project = self.get_object()
+        stats = ProjectStats.objects.filter(project=project).first()
+        if stats is None:
+            rebuild_project_stats([project.pk])
+            stats = ProjectStats.objects.get(project=project)
+        return Response(ProjectStatsSerializer(stats).data)
+
+    async def aget_project_stats(self, request, *args, **kwargs):
+        project = await self.aget_object()
+        stats = await ProjectStats.objects.filter(project=project).afirst()
+        if stats is None:
+            await sync_to_async(rebuild_project_stats)([project.pk])
+            stats = await ProjectStats.objects.aget(project=project)
+        return Response(ProjectStatsSerializer(stats).data)
+
+    board_dependencies = (Project, Column, Task, Comment, User)
+
+    @action(detail=True, methods=["GET"], url_path="board")
+    def board(self, request, *args, **kwargs):
+        """колонки проекта с задачами и числом комментариев - четыре запроса на всю доску.
+        ETag зависит от версий всех моделей доски, неизмененная доска отдает 304"""
+        project = self.get_object()
+        cached = CachedResponse(request, self.board_dependencies, "ProjectBoard")
+        return cached.respond(lambda: Response(board_snapshot(project, request)))
+
+    async def aboard(self, request, *args, **kwargs):
+        project = await self.aget_object()
+        cached = await CachedResponse.acreate(request, self.board_dependencies, "ProjectBoard")
+
+        async def render():
+            return Response(await aboard_snapshot(project, request))
+        return await cached.arespond(render)
     
-class ColumnViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMixin,mixins.RetrieveModelMixin, mixins.ListModelMixin, mixins.DestroyModelMixin):
+class ColumnViewSet(AsyncViewSetMixin, CascadeDeleteMixin, CachedReadMixin, ValuesListMixin, QueryPlanMixin, GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMixin,mixins.RetrieveModelMixin, mixins.ListModelMixin, mixins.DestroyModelMixin):
     queryset = Column.objects.all()
     serializer_class = ColumnSerializer
+    cache_dependencies = (Column, Project)
+    select_related_fields = ('project',)
+    # порядок доски. внутри проекта курсор листает OFFSET'ом, но колонок в проекте единицы
+    ordering = ('project_id', 'order', 'id')
     def get_permissions(self):
-        if self.action in ['update', 'partial_update', 'create', 'destroy']:
+        if self.action in ['update', 'partial_update', 'create', 'destroy', 'move']:
             permission_classes = [IsAuthenticated, SecondFactorPermission]
         else:
             permission_classes = []
@@ -119,7 +151,7 @@ class ColumnViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelM
             qs = qs.filter(project__user_id=user_id)
         if project_id:
             qs = qs.filter(project_id=project_id)
-        qs = qs.order_by('project', 'order')
+        qs = qs.order_by(*self.ordering)
         return qs
 
     def perform_create(self, serializer):
@@ -131,20 +163,44 @@ class ColumnViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelM
             )
         serializer.save()
 
+    @action(detail=True, methods=["POST"], url_path="move")
+    def move(self, request, *args, **kwargs):
+        """перетаскивание колонки: {"after": id колонки или null}. обычно это UPDATE одной строки"""
+        column = self.get_object()
+        params = MoveSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+
+        if not request.user.is_superuser and column.project.user_id != request.user.id:
+            raise PermissionDenied("вы не можете перемещать колонки в чужих проектах")
+
+        siblings = Column.objects.filter(project_id=column.project_id)
+        after = move_anchor(siblings.exclude(pk=column.pk), params.validated_data['after'])
+        renumbered = move(column, 'order', siblings, after, column.project_id)
+        publish_change(column, "updated", [column.project_id])
+        return Response({**self.get_serializer(column).data, "renumbered": renumbered})
+
     class StatsSerializer(serializers.Serializer):
         count = serializers.IntegerField()
     
     @action(detail=False, methods=["GET"], url_path="stats")
     def get_stats(self, request, *args, **kwargs):
-        stats = Column.objects.aggregate(count = Count("*"))
+        stats = {"count": project_counter("column_count", request.query_params.get('project_id'))}
         serializer = self.StatsSerializer(instance=stats)
         return Response(serializer.data)
 
-class TaskViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, mixins.DestroyModelMixin):
+    async def aget_stats(self, request, *args, **kwargs):
+        stats = {"count": await aproject_counter("column_count", request.query_params.get('project_id'))}
+        return Response(self.StatsSerializer(instance=stats).data)
+
+class TaskViewSet(AsyncViewSetMixin, CascadeDeleteMixin, CachedReadMixin, ValuesListMixin, QueryPlanMixin, ExportMixin, GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, mixins.DestroyModelMixin):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
+    cache_dependencies = (Task, Column, User)
+    exporter = exporters.TASKS
+    select_related_fields = ('column', 'creator', 'assignee')
+    ordering = ('-created_at', 'id')
     def get_permissions(self):
-        if self.action in ['update', 'partial_update', 'create', 'destroy']:
+        if self.action in ['update', 'partial_update', 'create', 'destroy', 'move', 'bulk_create', 'bulk_update', 'bulk_destroy']:
             permission_classes = [IsAuthenticated, SecondFactorPermission]
         else:
             permission_classes = []
@@ -165,7 +221,7 @@ class TaskViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMix
         if column_id:
             qs = qs.filter(column_id=column_id)
         
-        qs = qs.order_by('-created_at')
+        qs = qs.order_by(*self.ordering)
         return qs
 
     def perform_create(self, serializer):
@@ -180,7 +236,29 @@ class TaskViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMix
         if assigned_to and not self.request.user.is_superuser:
             pass
         
-        serializer.save()
+        serializer.save(position=next_positions([column.id])[column.id])
+
+    @action(detail=True, methods=["POST"], url_path="move")
+    def move(self, request, *args, **kwargs):
+        """перетаскивание задачи: {"column": id, "after": id задачи или null}. обычно это UPDATE одной строки"""
+        task = self.get_object()
+        params = MoveSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+
+        column = task.column
+        if params.validated_data.get('column') is not None:
+            column = Column.objects.select_related('project').filter(pk=params.validated_data['column']).first()
+            if column is None or column.project_id != task.column.project_id:
+                raise serializers.ValidationError({"column": "задачу можно перенести только в колонку той же доски"})
+        if not request.user.is_superuser and column.project.user_id != request.user.id:
+            raise PermissionDenied("вы не можете перемещать задачи в чужих проектах")
+
+        siblings = Task.objects.filter(column=column)
+        after = move_anchor(siblings.exclude(pk=task.pk), params.validated_data['after'])
+        renumbered = move(task, 'position', siblings, after, column.project_id, column_id=column.id)
+        task.column = column
+        publish_change(task, "updated", [column.project_id])
+        return Response({**self.get_serializer(task).data, "renumbered": renumbered})
 
     class StatsSerializer(serializers.Serializer):
         total = serializers.IntegerField()
@@ -189,35 +267,39 @@ class TaskViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMix
         overdue = serializers.IntegerField()
         created_week = serializers.IntegerField()
 
+    @action(detail=False, methods=["POST"], url_path="bulk")
+    def bulk_create(self, request, *args, **kwargs):
+        """POST [{...}, ...] - создать пачку задач, ответ по каждому элементу"""
+        return Response(bulk_create_tasks(request, request.data))
+
+    @bulk_create.mapping.patch
+    def bulk_update(self, request, *args, **kwargs):
+        """PATCH [{"id": 1, ...}, ...] - частично обновить пачку задач"""
+        return Response(bulk_update_tasks(request, request.data))
+
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request, *args, **kwargs):
+        """DELETE [1, 2, ...] - удалить пачку задач"""
+        return Response(bulk_delete_tasks(request, request.data))
+
     @action(detail=False, methods=["GET"], url_path="stats")
     def get_stats(self, request):
-        qs = Task.objects.all()
-        now = timezone.now()
-        week_ago = now - timedelta(days=7)
-
-        stats = {
-            "total": qs.count(),
-            "by_status": dict(
-                qs.values("status").annotate(c=Count("id")).values_list("status", "c")
-            ),
-            "by_priority": dict(
-                qs.values("priority").annotate(c=Count("id")).values_list("priority", "c")
-            ),
-            "overdue": qs.filter(
-                due_date__lt=now,
-                status__in=["todo", "in_progress", "review"]
-            ).count(),
-            "created_week": qs.filter(
-                created_at__gte=week_ago
-            ).count(),
-        }
-
+        """один агрегирующий запрос с теми же фильтрами, что у списка, плюс короткий кеш"""
+        stats = cached_task_stats(self.get_queryset(), request.query_params)
         serializer = self.StatsSerializer(instance=stats)
         return Response(serializer.data)
 
-class TimeTrackingViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMixin,mixins.RetrieveModelMixin, mixins.ListModelMixin, mixins.DestroyModelMixin):
+    async def aget_stats(self, request):
+        stats = await acached_task_stats(self.get_queryset(), request.query_params)
+        return Response(self.StatsSerializer(instance=stats).data)
+
+class TimeTrackingViewSet(AsyncViewSetMixin, CachedReadMixin, ValuesListMixin, QueryPlanMixin, ExportMixin, GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMixin,mixins.RetrieveModelMixin, mixins.ListModelMixin, mixins.DestroyModelMixin):
     queryset = TimeTracking.objects.all()
     serializer_class = TimeTrackingSerializer
+    cache_dependencies = (TimeTracking, Task, User)
+    exporter = exporters.TIME_TRACKING
+    select_related_fields = ('task', 'user')
+    ordering = ('-start_time', 'id')
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'create', 'destroy']:
             permission_classes = [IsAuthenticated, SecondFactorPermission]
@@ -240,7 +322,7 @@ class TimeTrackingViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.Update
         if project_id:
             qs = qs.filter(task__column__project_id=project_id)
 
-        qs = qs.order_by('-start_time')
+        qs = qs.order_by(*self.ordering)
         return qs
 
     def perform_create(self, serializer):
@@ -260,16 +342,22 @@ class TimeTrackingViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.Update
     
     @action(detail=False, methods=["GET"], url_path="stats")
     def get_stats(self, request, *args, **kwargs):
-        stats = TimeTracking.objects.aggregate(
-            count = Count("*"),
-        )
+        stats = {"count": project_counter("time_entry_count", request.query_params.get('project_id'))}
         serializer = self.StatsSerializer(instance=stats)
         return Response(serializer.data)
+
+    async def aget_stats(self, request, *args, **kwargs):
+        stats = {"count": await aproject_counter("time_entry_count", request.query_params.get('project_id'))}
+        return Response(self.StatsSerializer(instance=stats).data)
     
-class CommentViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMixin,
+class CommentViewSet(AsyncViewSetMixin, CachedReadMixin, ValuesListMixin, QueryPlanMixin, ExportMixin, GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMixin,
                      mixins.RetrieveModelMixin, mixins.ListModelMixin, mixins.DestroyModelMixin):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
+    cache_dependencies = (Comment, Task, User)
+    exporter = exporters.COMMENTS
+    select_related_fields = ('task', 'user')
+    ordering = ('-created_at', 'id')
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'create', 'destroy']:
             permission_classes = [IsAuthenticated, SecondFactorPermission]
@@ -291,7 +379,7 @@ class CommentViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModel
         if project_id:
             qs = qs.filter(task__column__project_id=project_id)
 
-        qs = qs.order_by('-created_at')
+        qs = qs.order_by(*self.ordering)
         return qs
 
     def perform_create(self, serializer):
@@ -313,15 +401,21 @@ class CommentViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModel
     
     @action(detail=False, methods=["GET"], url_path="stats")
     def get_stats(self, request, *args, **kwargs):
-        stats = Comment.objects.aggregate(
-            count = Count("*"),
-        )
+        stats = {"count": project_counter("comment_count", request.query_params.get('project_id'))}
         serializer = self.StatsSerializer(instance=stats)
         return Response(serializer.data)
 
-class TimeTrackingViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMixin,mixins.RetrieveModelMixin, mixins.ListModelMixin, mixins.DestroyModelMixin):
+    async def aget_stats(self, request, *args, **kwargs):
+        stats = {"count": await aproject_counter("comment_count", request.query_params.get('project_id'))}
+        return Response(self.StatsSerializer(instance=stats).data)
+
+class TimeTrackingViewSet(AsyncViewSetMixin, CachedReadMixin, ValuesListMixin, QueryPlanMixin, ExportMixin, GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMixin,mixins.RetrieveModelMixin, mixins.ListModelMixin, mixins.DestroyModelMixin):
     queryset = TimeTracking.objects.all()
     serializer_class = TimeTrackingSerializer
+    cache_dependencies = (TimeTracking, Task, User)
+    exporter = exporters.TIME_TRACKING
+    select_related_fields = ('task', 'user')
+    ordering = ('-start_time', 'id')
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'create', 'destroy']:
             permission_classes = [IsAuthenticated, SecondFactorPermission]
@@ -344,7 +438,7 @@ class TimeTrackingViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.Update
         if project_id:
             qs = qs.filter(task__column__project_id=project_id)
 
-        qs = qs.order_by('-start_time')
+        qs = qs.order_by(*self.ordering)
         return qs
 
     def perform_create(self, serializer):
@@ -364,17 +458,46 @@ class TimeTrackingViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.Update
     
     @action(detail=False, methods=["GET"], url_path="stats")
     def get_stats(self, request, *args, **kwargs):
-        stats = TimeTracking.objects.aggregate(
-            count = Count("*"),
-        )
+        stats = {"count": project_counter("time_entry_count", request.query_params.get('project_id'))}
         serializer = self.StatsSerializer(instance=stats)
         return Response(serializer.data)
 
-class UserViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMixin,
+    async def aget_stats(self, request, *args, **kwargs):
+        stats = {"count": await aproject_counter("time_entry_count", request.query_params.get('project_id'))}
+        return Response(self.StatsSerializer(instance=stats).data)
+
+    @action(detail=False, methods=["GET"], url_path="report")
+    def report(self, request, *args, **kwargs):
+        """часы по пользователям/задачам/проектам и дням/неделям/месяцам, см. timereport.py"""
+        params = TimeReportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        filters = {name: data[name] for name in ('user_id', 'task_id', 'project_id')}
+        return Response(time_report(data['start'], data['end'], data['group_by'], data['period'], filters))
+
+    @action(detail=False, methods=["POST"], url_path="report-job")
+    def report_job(self, request, *args, **kwargs):
+        """тот же отчет фоновой задачей - для больших периодов. параметры те же, в строке запроса"""
+        if not request.user.is_authenticated:
+            raise NotAuthenticated()
+        params = TimeReportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        job = jobs.submit("time_report", {
+            **{name: data[name] for name in ('group_by', 'period', 'user_id', 'task_id', 'project_id')},
+            'start': data['start'].isoformat(),
+            'end': data['end'].isoformat(),
+        }, request.user)
+        return jobs.accepted_response(job, request)
+
+class UserViewSet(CachedReadMixin, ValuesListMixin, QueryPlanMixin, GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMixin,
                   mixins.RetrieveModelMixin, mixins.ListModelMixin, mixins.DestroyModelMixin):
 
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
+    cache_dependencies = (UserProfile, User)
+    select_related_fields = ('user',)
+    ordering = ('id',)
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'create', 'destroy']:
             permission_classes = [IsAuthenticated, SecondFactorPermission]
@@ -393,6 +516,7 @@ class UserViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMix
         else:
             qs = qs.filter(user=self.request.user)
         
+        qs = qs.order_by(*self.ordering)
         return qs
 
     def get_object(self):
@@ -411,21 +535,9 @@ class UserViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMix
         }
         """вся эта конструкция нужна для корректного отображения плашки: по истечении времени экспайр идет на 0, как и секонд"""
         if self.request.user.is_authenticated:
-            second = self.request.session.get('second')
-            expire = self.request.session.get('second_expire')
-
-            if second and expire:
-                if timezone.now().timestamp() > expire:
-                    self.request.session.pop('second', None)
-                    self.request.session.pop('second_expire', None)
-                    second = False
-                    expire = None
-            else:
-                second = False
-                expire = None
-
+            expire = second_factor_expire(self.request)
             data.update({
-                'second': second,
+                'second': expire is not None,
                 'second_expire': expire,
             })
 
@@ -469,21 +581,21 @@ class UserViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMix
     def process_logout(self, *args, **kwargs):
         logout(self.request)
         
-        return Response({"status":"success"})
+        response = Response({"status":"success"})
+        revoke_second_factor(response)
+        return response
     
     @action(url_path="second-login", methods=["POST"], detail=False, permission_classes=[])
     def second_login(self, *args, **kwargs):
         key = self.request.user.userprofile.totp_key
         t = pyotp.totp.TOTP(key)
-        """позже о коде, сейчас мы приводим к инту время, к которому сессия истечёт. у нас это 10 мин"""
+        """позже о коде. вторая ступень живет SECOND_FACTOR_TTL (10 мин) в подписанной куке, см. tasks/permissions.py"""
         code = self.request.data.get('key')
 
         if code == t.now():
-            self.request.session['second'] = True;
-            self.request.session['second_expire'] = int(
-            (timezone.now() + timedelta(minutes=10)).timestamp()
-        )
-            return Response({"status":"success"})
+            response = Response({"status":"success"})
+            grant_second_factor(self.request, response)
+            return response
         
     @action(url_path="show-totp", methods=["POST"], detail=False, permission_classes=[])
     def show_totp(self, *args, **kwargs):
@@ -501,4 +613,92 @@ class UserViewSet(GenericViewSet, mixins.CreateModelMixin, mixins.UpdateModelMix
         
         return Response({
             "url": url
-        })
\ No newline at end of file
+        })
+
+
+class SearchViewSet(CachedReadMixin, GenericViewSet):
+    """полнотекстовый поиск по задачам и комментариям: /api/search/?q=...
+    выдача ранжирована, совпадения обернуты в <mark>, остальной текст экранирован"""
+    cache_dependencies = (Task, Comment, Column)
+    permission_classes = []
+
+    def list(self, request, *args, **kwargs):
+        params = SearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+
+        return self.cached_response(request, lambda: Response({
+            "results": search(data['q'], data['kind'], data['project_id'], data['limit'])
+        }))
+
+
+class FeedViewSet(GenericViewSet):
+    """лента изменений досок: /api/feed/?project=1&project=2 (Server-Sent Events).
+    события column.*, task.*, comment.* с created/updated/deleted и resync.
+    работает только под ASGI: под WSGI поток занял бы воркер целиком"""
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def list(self, request, *args, **kwargs):
+        params = FeedQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        project_ids = list(Project.objects.filter(pk__in=params.validated_data['project']).values_list('pk', flat=True))
+        if not project_ids:
+            raise serializers.ValidationError({"project": "проекты не найдены"})
+        if not is_asgi(request):
+            return Response({"detail": "лента доступна только при запуске через ASGI (app.asgi)"}, status=501)
+
+        return feed_response(project_ids)
+
+
+class SyncViewSet(GenericViewSet):
+    """изменения после версии: /api/sync/?since=<version>[&project=<id>...]"""
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request, *args, **kwargs):
+        params = SyncQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+
+        return Response(changes_since(data['since'], data['project'], self.get_serializer_context()))
+
+
+class JobViewSet(GenericViewSet, mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin):
+    """фоновые задачи пользователя (см. jobs.py): статус - /api/jobs/<id>/, файл - /api/jobs/<id>/result/.
+    ставятся через export-job у выгрузок, /api/timetracking/report-job/ и /api/jobs/thumbnails/"""
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    ordering = ('-created_at', 'id')
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user).order_by(*self.ordering)
+
+    def perform_destroy(self, instance):
+        jobs.delete(instance)
+
+    @action(detail=True, methods=["GET"], url_path="result")
+    def result(self, request, *args, **kwargs):
+        job = self.get_object()
+        if job.status != Job.Status.DONE or not job.result:
+            return Response({"detail": "результата нет", "status": job.status}, status=409)
+        if job.expires_at and job.expires_at < timezone.now():
+            return Response({"detail": "срок хранения результата истек"}, status=410)
+
+        name = job.result.name.rsplit('/', 1)[-1]
+        return FileResponse(
+            job.result.open('rb'),
+            as_attachment=True,
+            filename=name,
+            content_type=jobs.RESULT_TYPES.get(name.rsplit('.', 1)[-1], 'application/octet-stream'),
+        )
+
+    @action(detail=False, methods=["POST"], url_path="thumbnails")
+    def thumbnails(self, request, *args, **kwargs):
+        """превью для вложений без них (all - пересобрать все), как generate_thumbnails, но воркером"""
+        if not request.user.is_staff:
+            raise PermissionDenied()
+        params = ThumbnailJobSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        job = jobs.submit("thumbnails", {"all": params.validated_data['all']}, request.user)
+        return jobs.accepted_response(job, request)
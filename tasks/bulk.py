@@ -0,0 +1,187 @@
+"""массовые операции над задачами для /api/tasks/bulk/.
+
+права на всю пачку проверяются одним запросом, запись идет через
+bulk_create/bulk_update в одной транзакции, на каждый элемент - свой результат"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import Column, Comment, Task, TimeTracking, User
+from .serializers import TaskBulkSerializer, TaskSerializer
+from .ordering import GAP, next_positions
+from .signals import bulk_write
+
+FOREIGN_COLUMN = "вы не можете добавлять задачи в чужие колонки"
+FOREIGN_TASK = "вы не можете изменять чужие задачи"
+
+
+def _int_id(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _int_ids(values):
+    return {pk for pk in map(_int_id, values) if pk is not None}
+
+
+def check_items(items):
+    if not isinstance(items, list):
+        raise serializers.ValidationError({"non_field_errors": ["ожидается список"]})
+    limit = getattr(settings, 'API_BULK_MAX_ITEMS', 500)
+    if len(items) > limit:
+        raise serializers.ValidationError({"non_field_errors": [f"не больше {limit} элементов за раз"]})
+
+
+def prefetch_related_objects(items):
+    """колонки (вместе с владельцем проекта) и исполнители всей пачки - по запросу на модель"""
+    dicts = [item for item in items if isinstance(item, dict)]
+    column_ids = _int_ids(item['column'] for item in dicts if 'column' in item)
+    assignee_ids = _int_ids(item['assignee'] for item in dicts if item.get('assignee') is not None)
+
+    columns = Column.objects.select_related('project').in_bulk(column_ids) if column_ids else {}
+    users = User.objects.in_bulk(assignee_ids) if assignee_ids else {}
+    return {Column: columns, User: users}
+
+
+def can_write(user, column):
+    return user.is_superuser or column.project.user_id == user.pk
+
+
+def bulk_create_tasks(request, items):
+    check_items(items)
+    context = {'request': request, 'prefetched': prefetch_related_objects(items)}
+
+    results = [None] * len(items)
+    tasks, indexes = [], []
+    for index, item in enumerate(items):
+        serializer = TaskBulkSerializer(data=item, context=context)
+        if not serializer.is_valid():
+            results[index] = {"index": index, "status": "error", "errors": serializer.errors}
+            continue
+        if not can_write(request.user, serializer.validated_data['column']):
+            results[index] = {"index": index, "status": "error", "errors": {"column": [FOREIGN_COLUMN]}}
+            continue
+        tasks.append(Task(**serializer.validated_data, creator=request.user))
+        indexes.append(index)
+
+    if tasks:
+        positions = next_positions({task.column_id for task in tasks})
+        for task in tasks:
+            task.position = positions[task.column_id]
+            positions[task.column_id] += GAP
+
+        project_ids = {task.column.project_id for task in tasks}
+        with transaction.atomic(), bulk_write([Task], project_ids) as version:
+            for task in tasks:
+                task.version = version
+            Task.objects.bulk_create(tasks, batch_size=500)
+
+    for index, task in zip(indexes, tasks):
+        results[index] = {"index": index, "status": "created", "data": TaskSerializer(task, context=context).data}
+    return results
+
+
+def bulk_update_tasks(request, items):
+    check_items(items)
+    context = {'request': request, 'prefetched': prefetch_related_objects(items)}
+    ids = _int_ids(item.get('id') for item in items if isinstance(item, dict))
+
+    results = [None] * len(items)
+    tasks, indexes = [], []
+    # строки читаются под блокировкой (FOR UPDATE, по порядку id) в той же транзакции,
+    # что и запись: параллельная правка или /move/ не затрется значениями, прочитанными до нее
+    with transaction.atomic():
+        locked = (
+            Task.objects.select_related('column__project', 'creator', 'assignee')
+            .select_for_update(of=('self',)).filter(pk__in=ids).order_by('pk')
+        )
+        instances = {task.pk: task for task in locked}
+
+        changed, moved, project_ids = {}, [], set()
+        for index, item in enumerate(items):
+            task = instances.get(_int_id(item.get('id'))) if isinstance(item, dict) else None
+            if task is None:
+                results[index] = {"index": index, "status": "error", "errors": {"id": ["задача не найдена"]}}
+                continue
+            if not can_write(request.user, task.column):
+                results[index] = {"index": index, "status": "error", "errors": {"id": [FOREIGN_TASK]}}
+                continue
+
+            serializer = TaskBulkSerializer(task, data=item, partial=True, context=context)
+            if not serializer.is_valid():
+                results[index] = {"index": index, "status": "error", "errors": serializer.errors}
+                continue
+            new_column = serializer.validated_data.get('column')
+            if new_column is not None and not can_write(request.user, new_column):
+                results[index] = {"index": index, "status": "error", "errors": {"column": [FOREIGN_COLUMN]}}
+                continue
+
+            project_ids.add(task.column.project_id)
+            if new_column is not None and new_column.pk != task.column_id:
+                moved.append(task)
+            for name, value in serializer.validated_data.items():
+                setattr(task, name, value)
+            # пишем только поля этого элемента: у соседей по пачке они могут быть другими
+            changed.setdefault(task.pk, set()).update(serializer.validated_data)
+            project_ids.add(task.column.project_id)
+            tasks.append(task)
+            indexes.append(index)
+
+        if moved:
+            # перенесенные в другую колонку задачи встают в ее конец
+            positions = next_positions({task.column_id for task in moved})
+            for task in moved:
+                task.position = positions[task.column_id]
+                positions[task.column_id] += GAP
+                changed[task.pk].add('position')
+
+        groups = defaultdict(dict)
+        for task in tasks:
+            if changed[task.pk]:
+                groups[frozenset(changed[task.pk])][task.pk] = task
+        if groups:
+            with bulk_write([Task], project_ids) as version:
+                # один bulk_update на каждый набор полей - обычно пачка меняет одно и то же
+                for fields, group in groups.items():
+                    for task in group.values():
+                        task.version = version
+                    Task.objects.bulk_update(group.values(), sorted(fields | {'version'}), batch_size=500)
+
+    for index, task in zip(indexes, tasks):
+        results[index] = {"index": index, "status": "updated", "data": TaskSerializer(task, context=context).data}
+    return results
+
+
+def bulk_delete_tasks(request, ids):
+    check_items(ids)
+    owners = {
+        pk: (project_id, owner_id)
+        for pk, project_id, owner_id in Task.objects.filter(pk__in=_int_ids(ids)).values_list(
+            'pk', 'column__project_id', 'column__project__user_id'
+        )
+    }
+
+    results, allowed, project_ids = [], [], set()
+    for index, value in enumerate(ids):
+        pk = _int_id(value)
+        if pk not in owners:
+            results.append({"index": index, "id": value, "status": "error", "errors": {"id": ["задача не найдена"]}})
+            continue
+        project_id, owner_id = owners[pk]
+        if not request.user.is_superuser and owner_id != request.user.pk:
+            results.append({"index": index, "id": pk, "status": "error", "errors": {"id": [FOREIGN_TASK]}})
+            continue
+        allowed.append(pk)
+        project_ids.add(project_id)
+        results.append({"index": index, "id": pk, "status": "deleted"})
+
+    if allowed:
+        with transaction.atomic(), bulk_write([Task, Comment, TimeTracking], project_ids):
+            Task.objects.filter(pk__in=allowed).delete()
+    return results
@@ -0,0 +1,142 @@
+"""версионные метки моделей и кеш ответов на чтение.
+
+каждая модель имеет в кеше метку версии (time_ns последнего изменения),
+которую сигналы post_save/post_delete сдвигают. ключ закешированного ответа
+и ETag строятся из меток моделей, от которых зависит ответ, поэтому
+устаревшие записи просто перестают читаться, а 304 отдается без запросов в БД.
+
+метки работают, только если кеш общий для всех процессов (file, redis). без
+API_CACHE ответ не кешируется и каждый раз строится заново, а ETag - хеш его тела:
+304 экономит только передачу, зато не зависит от меток других процессов"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+def version_key(model):
+    return f"version:{model._meta.label_lower}"
+
+
+def bump_version(model):
+    cache.set(version_key(model), time.time_ns(), timeout=None)
+
+
+def bump_version_on_commit(model):
+    """сдвигаем сразу (чтобы этот же процесс не прочитал старое) и после коммита,
+    чтобы параллельный запрос не закешировал данные без еще не закоммиченной правки"""
+    bump_version(model)
+    transaction.on_commit(lambda: bump_version(model))
+
+
+def model_versions(models):
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+async def amodel_versions(models):
+    keys = [version_key(model) for model in models]
+    versions = await cache.aget_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        await cache.aset_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+class CachedResponse:
+    """ETag/Last-Modified и закешированные данные одного GET-запроса"""
+
+    def __init__(self, request, models, scope, versions=None):
+        self.request = request
+        self.enabled = settings.API_CACHE
+        if not self.enabled:
+            self.etag = self.last_modified = None
+            return
+        if versions is None:
+            versions = model_versions(models)
+        user = request.user.pk if request.user.is_authenticated else "anon"
+        params = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.lists()))
+        raw = f"{scope}|{request.get_host()}{request.path}|{params}|{user}|{versions}"
+
+        self.key = "response:" + hashlib.sha1(raw.encode()).hexdigest()
+        self.etag = quote_etag(self.key[len("response:"):])
+        self.last_modified = max(versions) // 1_000_000_000 if versions else None
+
+    def not_modified(self):
+        if_none_match = self.request.headers.get("If-None-Match")
+        if if_none_match:
+            return self.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+        if_modified_since = parse_http_date_safe(self.request.headers.get("If-Modified-Since", ""))
+        return if_modified_since is not None and self.last_modified is not None and if_modified_since >= self.last_modified
+
+    def finalize(self, response):
+        response["ETag"] = self.etag
+        if self.last_modified is not None:
+            response["Last-Modified"] = http_date(self.last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ("Cookie", "Authorization"))
+        return response
+
+    def by_body(self, response):
+        """условный GET без кеша: ETag считается по уже построенному ответу"""
+        if response.status_code != status.HTTP_200_OK or getattr(response, "data", None) is None:
+            return response
+        media_type = getattr(self.request, "accepted_media_type", "")
+        body = JSONRenderer().render(response.data)
+        self.etag = quote_etag(hashlib.sha1(media_type.encode() + b"|" + body).hexdigest())
+        if self.not_modified():
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        return self.finalize(response)
+
+    def respond(self, render):
+        if not self.enabled:
+            return self.by_body(render())
+        if self.not_modified():
+            return self.finalize(Response(status=status.HTTP_304_NOT_MODIFIED))
+
+        data = cache.get(self.key)
+        if data is not None:
+            return self.finalize(Response(data))
+
+        response = render()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(self.key, response.data, timeout=getattr(settings, "API_CACHE_TIMEOUT", 300))
+            self.finalize(response)
+        return response
+
+    @classmethod
+    async def acreate(cls, request, models, scope):
+        if not settings.API_CACHE:
+            return cls(request, models, scope)
+        return cls(request, models, scope, versions=await amodel_versions(models))
+
+    async def arespond(self, render):
+        """respond для async-вьюсетов: render - корутина-функция"""
+        if not self.enabled:
+            return self.by_body(await render())
+        if self.not_modified():
+            return self.finalize(Response(status=status.HTTP_304_NOT_MODIFIED))
+
+        data = await cache.aget(self.key)
+        if data is not None:
+            return self.finalize(Response(data))
+
+        response = await render()
+        if response.status_code == status.HTTP_200_OK:
+            await cache.aset(self.key, response.data, timeout=getattr(settings, "API_CACHE_TIMEOUT", 300))
+            self.finalize(response)
+        return response
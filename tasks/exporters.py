@@ -0,0 +1,187 @@
+"""выгрузки списков в xlsx/csv/jsonl. строки идут с сервера через iterator()
+(под ASGI - aiterator()), поэтому память воркера не растет вместе с таблицей"""
+import csv
+import json
+import tempfile
+from datetime import date, datetime
+
+import openpyxl
+from django.http import FileResponse, StreamingHttpResponse
+
+
+CONTENT_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class Echo:
+    """псевдо-буфер для csv.writer: write() просто возвращает строку"""
+
+    def write(self, value):
+        return value
+
+
+class Exporter:
+    chunk_size = 2000
+
+    def __init__(self, title, filename, columns, select_related=()):
+        self.title = title
+        self.filename = filename
+        self.columns = columns
+        self.select_related = select_related
+
+    @property
+    def headers(self):
+        return [header for _, header in self.columns]
+
+    def resolve(self, obj, path):
+        for attr in path.split('.'):
+            obj = getattr(obj, attr, None)
+            if obj is None:
+                return None
+        return obj
+
+    def prepare(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        return queryset
+
+    def iter_objects(self, queryset):
+        return self.prepare(queryset).iterator(chunk_size=self.chunk_size)
+
+    def row(self, obj):
+        """строка для таблиц: даты в привычном виде, None -> пустая строка"""
+        row = []
+        for path, _ in self.columns:
+            value = self.resolve(obj, path)
+            if isinstance(value, datetime):
+                value = value.strftime('%d.%m.%Y %H:%M')
+            elif isinstance(value, date):
+                value = value.strftime('%d.%m.%Y')
+            elif value is None:
+                value = ""
+            row.append(value)
+        return row
+
+    def record(self, obj):
+        """запись для jsonl: ключи - пути полей, даты в ISO"""
+        record = {}
+        for path, _ in self.columns:
+            value = self.resolve(obj, path)
+            if isinstance(value, (date, datetime)):
+                value = value.isoformat()
+            record[path.replace('.', '_')] = value
+        return record
+
+    def iter_rows(self, queryset):
+        return map(self.row, self.iter_objects(queryset))
+
+    def iter_lines(self, queryset, head, line):
+        yield from head
+        for obj in self.iter_objects(queryset):
+            yield line(obj)
+
+    async def aiter_lines(self, queryset, head, line):
+        for chunk in head:
+            yield chunk
+        async for obj in self.prepare(queryset).aiterator(chunk_size=self.chunk_size):
+            yield line(obj)
+
+    def stream(self, queryset, head, line, asynchronous=False):
+        """тело потокового ответа: строки head, потом line(obj) на каждую запись.
+        asynchronous - через aiterator, для ASGI (под WSGI Django async-поток
+        сначала собрал бы целиком в память)"""
+        if asynchronous:
+            return self.aiter_lines(queryset, head, line)
+        return self.iter_lines(queryset, head, line)
+
+    def write_xlsx(self, queryset, f):
+        # write_only держит в памяти одну строку, остальное пишется во временный файл
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(self.title)
+        ws.append(self.headers)
+        for row in self.iter_rows(queryset):
+            ws.append(row)
+        wb.save(f)
+
+    def csv_lines(self, queryset, asynchronous=False):
+        writer = csv.writer(Echo())
+        # BOM, чтобы Excel понял кириллицу
+        head = ['\ufeff', writer.writerow(self.headers)]
+        return self.stream(queryset, head, lambda obj: writer.writerow(self.row(obj)), asynchronous)
+
+    def jsonl_lines(self, queryset, asynchronous=False):
+        line = lambda obj: json.dumps(self.record(obj), ensure_ascii=False) + '\n'
+        return self.stream(queryset, [], line, asynchronous)
+
+    def write(self, fmt, queryset, f):
+        """выгрузка в формате fmt (xlsx/csv/jsonl) в бинарный файл f - для фоновых задач"""
+        if fmt == 'xlsx':
+            self.write_xlsx(queryset, f)
+            return
+        lines = self.csv_lines(queryset) if fmt == 'csv' else self.jsonl_lines(queryset)
+        for line in lines:
+            f.write(line.encode())
+
+    def xlsx_response(self, queryset):
+        tmp = tempfile.TemporaryFile()
+        self.write_xlsx(queryset, tmp)
+        tmp.seek(0)
+
+        return FileResponse(
+            tmp,
+            as_attachment=True,
+            filename=f"{self.filename}.xlsx",
+            content_type=CONTENT_TYPES['xlsx'],
+        )
+
+    def csv_response(self, queryset, asynchronous=False):
+        response = StreamingHttpResponse(self.csv_lines(queryset, asynchronous), content_type=CONTENT_TYPES['csv'])
+        response['Content-Disposition'] = f'attachment; filename="{self.filename}.csv"'
+        return response
+
+    def jsonl_response(self, queryset, asynchronous=False):
+        response = StreamingHttpResponse(self.jsonl_lines(queryset, asynchronous), content_type=CONTENT_TYPES['jsonl'])
+        response['Content-Disposition'] = f'attachment; filename="{self.filename}.jsonl"'
+        return response
+
+
+PROJECTS = Exporter("Проекты", "projects", [
+    ('id', "ID"),
+    ('name', "Название"),
+    ('description', "Описание"),
+    ('created_at', "Дата создания"),
+    ('user.username', "Пользователь"),
+], select_related=('user',))
+
+TASKS = Exporter("Задачи", "tasks", [
+    ('id', "ID"),
+    ('title', "Название"),
+    ('description', "Описание"),
+    ('column.name', "Колонка"),
+    ('priority', "Приоритет"),
+    ('status', "Статус"),
+    ('due_date', "Срок выполнения"),
+    ('created_at', "Дата создания"),
+    ('creator.username', "Создатель"),
+    ('assignee.username', "Исполнитель"),
+], select_related=('column', 'creator', 'assignee'))
+
+COMMENTS = Exporter("Комментарии", "comments", [
+    ('id', "ID"),
+    ('task.title', "Задача"),
+    ('text', "Текст комментария"),
+    ('created_at', "Дата создания"),
+    ('user.username', "Автор"),
+], select_related=('task', 'user'))
+
+TIME_TRACKING = Exporter("Учет времени", "timetracking", [
+    ('id', "ID"),
+    ('task.title', "Задача"),
+    ('user.username', "Пользователь"),
+    ('start_time', "Время начала"),
+    ('end_time', "Время окончания"),
+    ('description', "Описание работы"),
+], select_related=('task', 'user'))
@@ -0,0 +1,152 @@
+"""лента изменений доски (Server-Sent Events) под ASGI.
+
+все подписчики процесса висят на одном брокере: на каждый проект - множество
+очередей asyncio. изменение сериализуется и кодируется в SSE-кадр один раз
+(и только если на проект кто-то подписан), потом раскладывается по очередям.
+простаивающее соединение - это корутина, которая ждет свою очередь и раз в
+FEED_HEARTBEAT секунд шлет комментарий-пинг, чтобы прокси не рвали соединение.
+
+брокер живет в памяти процесса: изменения, сделанные другими воркерами,
+сюда не попадут, поэтому пишущие запросы должны идти в тот же ASGI-процесс"""
+import asyncio
+import itertools
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Column, Comment, Task
+from .serializers import ColumnSerializer, CommentSerializer, TaskSerializer
+
+FEED_SERIALIZERS = {
+    Column: ColumnSerializer,
+    Task: TaskSerializer,
+    Comment: CommentSerializer,
+}
+
+
+class EventStreamRenderer(BaseRenderer):
+    """чтобы DRF принял Accept: text/event-stream от EventSource.
+    сам поток отдается StreamingHttpResponse, сюда попадают только ошибки"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f"event: error\ndata: {json.dumps(data, cls=JSONEncoder, ensure_ascii=False)}\n\n".encode()
+
+
+def frame(event, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, cls=JSONEncoder, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class Broker:
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+
+    def has_subscribers(self, project_ids):
+        return any(self.subscribers.get(project_id) for project_id in project_ids)
+
+    def subscribe(self, project_ids):
+        queue = asyncio.Queue(maxsize=settings.FEED_QUEUE_SIZE)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self.lock:
+            for project_id in project_ids:
+                self.subscribers[project_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, project_ids, subscriber):
+        with self.lock:
+            for project_id in project_ids:
+                subscribers = self.subscribers.get(project_id)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.subscribers[project_id]
+
+    def publish(self, project_ids, event, data):
+        """можно звать из любого потока: кадр кладется в очереди через их event loop"""
+        with self.lock:
+            targets = set().union(*(self.subscribers.get(project_id, ()) for project_id in project_ids))
+        if not targets:
+            return
+        payload = frame(event, data, next(self.ids))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(deliver, queue, payload)
+            except RuntimeError:
+                # loop уже закрыт, подписчик отвалится сам
+                pass
+
+    async def stream(self, project_ids):
+        subscriber = self.subscribe(project_ids)
+        _, queue = subscriber
+        try:
+            yield "retry: 3000\n\n" + frame("ready", {"projects": project_ids})
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), settings.FEED_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+        finally:
+            self.unsubscribe(project_ids, subscriber)
+
+
+def deliver(queue, payload):
+    """медленный клиент не копит кадры бесконечно: при переполнении очередь
+    сбрасывается, и клиенту уходит resync - пусть перечитает список целиком"""
+    try:
+        queue.put_nowait(payload)
+    except asyncio.QueueFull:
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(frame("resync", {}))
+
+
+broker = Broker()
+
+
+def publish_change(instance, action, project_ids):
+    """Task/Column/Comment создан, изменен или удален - после коммита уходит в ленту"""
+    project_ids = [project_id for project_id in project_ids if project_id is not None]
+    if not broker.has_subscribers(project_ids):
+        return
+
+    model = type(instance)
+    name = model._meta.model_name
+    if action == "deleted":
+        data = {"id": instance.pk}
+    else:
+        data = FEED_SERIALIZERS[model](instance).data
+    transaction.on_commit(lambda: broker.publish(project_ids, f"{name}.{action}", data))
+
+
+def publish_resync(project_ids):
+    """после массовой записи дельты не шлем - клиенты просто перечитывают доску"""
+    project_ids = [project_id for project_id in project_ids if project_id is not None]
+    if broker.has_subscribers(project_ids):
+        transaction.on_commit(lambda: broker.publish(project_ids, "resync", {}))
+
+
+def is_asgi(request):
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def feed_response(project_ids):
+    response = StreamingHttpResponse(broker.stream(project_ids), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx не должен буферизовать поток
+    response['X-Accel-Buffering'] = 'no'
+    return response
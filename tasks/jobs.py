@@ -0,0 +1,229 @@
+"""фоновые задачи: выгрузки, отчет по учету времени, превью. очередь - таблица Job
+в той же БД, брокер не нужен.
+
+API ставит задачу (submit) и сразу отвечает 202 со ссылкой на /api/jobs/<id>/, клиент
+опрашивает статус и забирает файл с /api/jobs/<id>/result/.
+
+команда run_jobs берет задачи (claim) и выполняет их в пуле процессов: xlsx на сотни
+тысяч строк - это CPU и память, которым не место в потоке веб-воркера. взятая задача
+числится за воркером до locked_until, пока она выполняется, воркер продлевает срок
+(heartbeat). если воркер упал, после срока задачу возьмет другой - всего не больше
+JOB_MAX_ATTEMPTS попыток. на PostgreSQL воркеры не ждут друг друга (FOR UPDATE SKIP
+LOCKED), на SQLite их по очереди пропускает блокировка записи (transaction_mode IMMEDIATE).
+
+результат лежит в JOB_RESULTS_ROOT JOB_RESULT_TTL секунд, потом purge_expired удаляет
+и файл, и строку задачи - ее зовут воркер и команда purge_jobs"""
+import logging
+import shutil
+import tempfile
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+
+from .exporters import CONTENT_TYPES
+from .models import Job, job_storage
+from .renderers import FastJSONRenderer
+from .serializers import JobSerializer
+from .thumbnails import process_pending
+from .timereport import report as time_report
+
+logger = logging.getLogger(__name__)
+
+# вьюсеты выгрузок по Exporter.filename: задача строит ту же выборку, что и export-*
+EXPORT_VIEWSETS = {
+    "projects": "tasks.api.ProjectViewSet",
+    "tasks": "tasks.api.TaskViewSet",
+    "comments": "tasks.api.CommentViewSet",
+    "timetracking": "tasks.api.TimeTrackingViewSet",
+}
+
+RESULT_TYPES = {**CONTENT_TYPES, "json": "application/json"}
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """регистрирует функцию (job) -> итог (словарь) для задач типа kind. файл
+    результата она кладет в job.result сама, с save=False"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def submit(kind, params, user=None):
+    if kind not in HANDLERS:
+        raise ValueError(f"неизвестный тип задачи: {kind}")
+    return Job.objects.create(kind=kind, params=params, user=user if user is not None and user.is_authenticated else None)
+
+
+def accepted_response(job, request):
+    """202 на постановку задачи: ее состояние и Location, по которому его опрашивать"""
+    location = reverse("jobs-detail", args=[job.pk], request=request)
+    return Response(JobSerializer(job, context={"request": request}).data, status=202, headers={"Location": location})
+
+
+def export_view(resource, query, user):
+    """вьюсет выгрузки с GET-запросом, у которого те же параметры строки, что были у POST"""
+    http_request = HttpRequest()
+    http_request.method = "GET"
+    http_request.GET = QueryDict(urlencode(query, doseq=True))
+    request = Request(http_request)
+    request.user = user or AnonymousUser()
+    viewset = import_string(EXPORT_VIEWSETS[resource])
+    return viewset(request=request, args=(), kwargs={}, format_kwarg=None, action="export_job")
+
+
+@handler("export")
+def run_export(job):
+    view = export_view(job.params["resource"], job.params["query"], job.user)
+    fmt = job.params["format"]
+    # во временный файл, а не в память: выгрузка может быть на сотни мегабайт
+    with tempfile.TemporaryFile() as tmp:
+        view.exporter.write(fmt, view.get_export_queryset(), tmp)
+        tmp.seek(0)
+        job.result.save(f"{view.exporter.filename}.{fmt}", File(tmp), save=False)
+    return {"bytes": job.result.size}
+
+
+@handler("time_report")
+def run_time_report(job):
+    params = job.params
+    data = time_report(
+        date.fromisoformat(params["start"]),
+        date.fromisoformat(params["end"]),
+        params["group_by"],
+        params["period"],
+        {name: params[name] for name in ("user_id", "task_id", "project_id")},
+    )
+    # те же байты, что отдал бы /api/timetracking/report/
+    job.result.save("time_report.json", ContentFile(FastJSONRenderer().render(data)), save=False)
+    return {"rows": len(data["rows"]), "total_seconds": data["total_seconds"], "entries": data["entries"]}
+
+
+@handler("thumbnails")
+def run_thumbnails(job):
+    return process_pending(everything=job.params.get("all", False))
+
+
+def lease_until(now):
+    return now + timedelta(seconds=settings.JOB_LEASE)
+
+
+def claim(worker):
+    """следующая задача из очереди (или брошенная упавшим воркером), уже за worker. None - пусто"""
+    now = timezone.now()
+    available = Q(status=Job.Status.QUEUED) | Q(
+        status=Job.Status.RUNNING, locked_until__lt=now, attempts__lt=settings.JOB_MAX_ATTEMPTS
+    )
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(available).order_by("created_at", "pk").first()
+        if job is None:
+            return None
+        job.status = Job.Status.RUNNING
+        job.started_at = now
+        job.locked_until = lease_until(now)
+        job.attempts += 1
+        job.worker = worker
+        job.save(update_fields=["status", "started_at", "locked_until", "attempts", "worker"])
+    return job
+
+
+def heartbeat(job_ids, worker):
+    """продлевает задачи, которые worker еще выполняет"""
+    return Job.objects.filter(pk__in=job_ids, status=Job.Status.RUNNING, worker=worker).update(
+        locked_until=lease_until(timezone.now())
+    )
+
+
+def release(job_ids, worker):
+    """вернуть задачи в очередь сразу, не дожидаясь конца срока (например, умер процесс пула)"""
+    return Job.objects.filter(pk__in=job_ids, status=Job.Status.RUNNING, worker=worker).update(
+        locked_until=timezone.now()
+    )
+
+
+def finish(job, attempt, status, summary=None, error=""):
+    now = timezone.now()
+    updated = Job.objects.filter(pk=job.pk, status=Job.Status.RUNNING, attempts=attempt).update(
+        status=status,
+        result=job.result.name or None,
+        summary=summary or {},
+        error=error,
+        finished_at=now,
+        expires_at=now + timedelta(seconds=settings.JOB_RESULT_TTL),
+        locked_until=None,
+    )
+    if not updated or status != Job.Status.DONE:
+        # задачу удалили или отдали другому воркеру, пока она шла, - или она упала
+        delete_result(job)
+
+
+def run(job_id, attempt):
+    """выполняет взятую задачу. итог записывается, только если это все еще та же попытка"""
+    job = Job.objects.select_related("user").filter(pk=job_id, status=Job.Status.RUNNING, attempts=attempt).first()
+    if job is None:
+        return
+    try:
+        summary = HANDLERS[job.kind](job)
+    except Exception as exc:
+        logger.exception("фоновая задача %s (%s) не выполнена", job.pk, job.kind)
+        # трассировка - в лог, владельцу задачи - только суть
+        finish(job, attempt, Job.Status.FAILED, error=f"{type(exc).__name__}: {exc}")
+    else:
+        finish(job, attempt, Job.Status.DONE, summary)
+
+
+def run_in_process(job_id, attempt):
+    """run для пула процессов: соединение процесса закрывается по CONN_MAX_AGE, как после запроса"""
+    try:
+        run(job_id, attempt)
+    finally:
+        close_old_connections()
+
+
+def fail_abandoned():
+    """задачи, брошенные воркерами JOB_MAX_ATTEMPTS раз, больше не ждут в очереди"""
+    now = timezone.now()
+    return Job.objects.filter(
+        status=Job.Status.RUNNING, locked_until__lt=now, attempts__gte=settings.JOB_MAX_ATTEMPTS
+    ).update(
+        status=Job.Status.FAILED,
+        error="воркер не завершил задачу",
+        finished_at=now,
+        expires_at=now + timedelta(seconds=settings.JOB_RESULT_TTL),
+        locked_until=None,
+    )
+
+
+def delete_result(job):
+    if job.result:
+        job.result.delete(save=False)
+
+
+def delete(job):
+    """строка задачи и ее каталог <pk>/ целиком - с файлами прерванных попыток"""
+    directory = job_storage().path(str(job.pk))
+    job.delete()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def purge_expired():
+    """удаляет задачи с истекшим сроком хранения вместе с файлами. сколько удалено"""
+    count = 0
+    for job in Job.objects.filter(expires_at__lt=timezone.now()).only("pk").iterator():
+        delete(job)
+        count += 1
+    return count
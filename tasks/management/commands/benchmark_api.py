@@ -0,0 +1,250 @@
+import io
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from tasks.models import Column, Comment, Project, Task, TimeTracking, UserProfile
+from tasks.search import install_search_schema
+
+
+class DisableMigrations:
+    """схема создается по моделям, как у тестов с --nomigrations"""
+
+    def __contains__(self, item):
+        return True
+
+    def __getitem__(self, item):
+        return None
+
+
+def percentile(sorted_values, pct):
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон REST API на наборах из 10k/100k/1M задач: перцентили времени ответа, '
+            'число запросов к БД и пик памяти для всех list/retrieve/stats/export эндпоинтов. '
+            'Данные создаются generate_data в отдельной тестовой БД, рабочая база не трогается')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10_000, 100_000, 1_000_000],
+            help='Размеры наборов по числу задач (по умолчанию: 10000 100000 1000000)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Сколько раз вызывать каждый эндпоинт (выгрузки - в 10 раз реже, по умолчанию: 20)'
+        )
+        parser.add_argument(
+            '--warm',
+            action='store_true',
+            help='Не чистить кеш между вызовами (по умолчанию меряется ответ без кеша)'
+        )
+        parser.add_argument(
+            '--only',
+            action='append',
+            help='Мерить только эндпоинты, в имени которых есть эта подстрока (можно несколько раз)'
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Не удалять тестовую БД после прогона и переиспользовать уже засеянные данные'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для JSON-отчета (по умолчанию: stdout)'
+        )
+
+    def handle(self, *args, **options):
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            # миллион задач в памяти держать незачем
+            test_settings['NAME'] = str(settings.BASE_DIR / 'benchmark.sqlite3')
+
+        with override_settings(MIGRATION_MODULES=DisableMigrations()):
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb']
+            )
+        try:
+            install_search_schema(connection, backfill=False)
+            report = {"meta": self.meta(options), "datasets": []}
+            # DEBUG копит все запросы в connection.queries - это искажает и время, и память
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                for size in sorted(options['sizes']):
+                    report["datasets"].append(self.run_dataset(size, options))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+            self.stderr.write(f"Отчет записан в {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "started_at": datetime.now(dt_timezone.utc).isoformat(),
+            "database": connection.vendor,
+            "cache": settings.CACHES['default']['BACKEND'],
+            "api_cache": settings.API_CACHE,
+            "django": django.get_version(),
+            "python": platform.python_version(),
+            "repeat": options['repeat'],
+            "warm_cache": options['warm'],
+        }
+
+    def seed(self, size):
+        """generate_data дописывает данные до нужного размера, поэтому наборы растут один из другого"""
+        started = time.perf_counter()
+        if Task.objects.count() < size:
+            call_command('generate_data', tasks=size, projects=max(50, size // 200), stdout=io.StringIO())
+            call_command('rebuild_project_stats', stdout=io.StringIO())
+        return round(time.perf_counter() - started, 3)
+
+    def endpoints(self):
+        project = Project.objects.order_by('pk').first()
+        column = Column.objects.filter(project=project).order_by('pk').first()
+        task = Task.objects.filter(column__project=project).order_by('pk').first()
+        comment = Comment.objects.order_by('pk').first()
+        entry = TimeTracking.objects.exclude(user=None).order_by('pk').first()
+        profile = UserProfile.objects.order_by('pk').first()
+
+        endpoints = {
+            "projects.list": "/api/projects/",
+            "projects.retrieve": f"/api/projects/{project.pk}/",
+            "projects.stats": "/api/projects/stats/",
+            "projects.project_stats": f"/api/projects/{project.pk}/stats/",
+            "columns.list": "/api/columns/",
+            "columns.list_by_project": f"/api/columns/?project_id={project.pk}",
+            "columns.retrieve": f"/api/columns/{column.pk}/",
+            "columns.stats": "/api/columns/stats/",
+            "tasks.list": "/api/tasks/",
+            "tasks.list_by_project": f"/api/tasks/?project_id={project.pk}",
+            "tasks.list_by_column": f"/api/tasks/?column_id={column.pk}",
+            "tasks.retrieve": f"/api/tasks/{task.pk}/",
+            "tasks.stats": "/api/tasks/stats/",
+            "tasks.stats_by_project": f"/api/tasks/stats/?project_id={project.pk}",
+            "comments.list": "/api/comments/",
+            "comments.list_by_task": f"/api/comments/?task_id={task.pk}",
+            "comments.retrieve": f"/api/comments/{comment.pk}/",
+            "comments.stats": "/api/comments/stats/",
+            "timetracking.list": "/api/timetracking/",
+            "timetracking.list_by_user": f"/api/timetracking/?user_id={entry.user_id}",
+            "timetracking.retrieve": f"/api/timetracking/{entry.pk}/",
+            "timetracking.stats": "/api/timetracking/stats/",
+            "users.list": "/api/users/",
+            "users.retrieve": f"/api/users/{profile.pk}/",
+            "users.stats": "/api/users/stats/",
+            "search": "/api/search/?" + urlencode({"q": task.title.split()[0]}),
+        }
+        for prefix in ("projects", "tasks", "comments", "timetracking"):
+            for fmt in ("excel", "csv", "jsonl"):
+                endpoints[f"{prefix}.export_{fmt}"] = f"/api/{prefix}/export-{fmt}/"
+        return endpoints
+
+    def request(self, client, url):
+        response = client.get(url)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        response.close()
+        return response.status_code, size
+
+    def measure(self, client, url, repeat, warm):
+        # отдельный прогон для счетчика запросов и памяти, чтобы они не искажали время
+        if not warm:
+            cache.clear()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            status, size = self.request(client, url)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # следующие запросы сбросят connection.queries (reset_queries на request_started)
+        query_count = len(queries)
+        db_ms = sum(float(q['time']) for q in queries.captured_queries) * 1000
+
+        timings = []
+        for _ in range(repeat):
+            if not warm:
+                cache.clear()
+            started = time.perf_counter()
+            self.request(client, url)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+
+        return {
+            "status": status,
+            "bytes": size,
+            "queries": query_count,
+            "db_ms": round(db_ms, 3),
+            "peak_memory_kb": round(peak / 1024, 1),
+            "repeat": repeat,
+            "ms": {
+                "min": round(timings[0], 3),
+                "p50": round(percentile(timings, 50), 3),
+                "p90": round(percentile(timings, 90), 3),
+                "p95": round(percentile(timings, 95), 3),
+                "p99": round(percentile(timings, 99), 3),
+                "max": round(timings[-1], 3),
+                "mean": round(sum(timings) / len(timings), 3),
+            },
+        }
+
+    def run_dataset(self, size, options):
+        self.stderr.write(f"Набор {size} задач...")
+        seed_seconds = self.seed(size)
+
+        user, _ = User.objects.get_or_create(username='benchmark', defaults={'is_superuser': True, 'is_staff': True})
+        client = Client()
+        client.force_login(user)
+
+        results = {}
+        for name, url in self.endpoints().items():
+            if options['only'] and not any(part in name for part in options['only']):
+                continue
+            repeat = options['repeat'] if '.export_' not in name else max(1, options['repeat'] // 10)
+            results[name] = self.measure(client, url, repeat, options['warm'])
+            self.stderr.write(f"  {name}: p50 {results[name]['ms']['p50']} ms, {results[name]['queries']} запросов")
+
+        return {
+            "tasks": size,
+            "seed_seconds": seed_seconds,
+            "rows": {
+                "projects": Project.objects.count(),
+                "columns": Column.objects.count(),
+                "tasks": Task.objects.count(),
+                "comments": Comment.objects.count(),
+                "timetracking": TimeTracking.objects.count(),
+            },
+            "endpoints": results,
+        }
@@ -0,0 +1,353 @@
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from tasks.models import Project, Task
+from tasks.search import install_search_schema
+
+from .benchmark_api import DisableMigrations, percentile
+
+# как запускается приложение: (аргументы uvicorn, переменные окружения)
+MODES = {
+    # WSGI-приложение в пуле из 10 потоков на процесс (как gunicorn --threads 10)
+    "wsgi": (["app.wsgi:application", "--interface", "wsgi"], {"ASYNC_API": "0"}),
+    # ASGI, но вьюсеты обычные: каждый запрос в своем потоке через sync_to_async.
+    # поток на запрос новый, постоянное соединение ему не достанется
+    "asgi-sync": (["app.asgi:application"], {"ASYNC_API": "0", "DB_CONN_MAX_AGE": "0"}),
+    # ASGI с корутинами вьюсетов (AsyncViewSetMixin)
+    "asgi-async": (["app.asgi:application"], {"ASYNC_API": "1", "DB_CONN_MAX_AGE": "0"}),
+}
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = Counter()
+        self.errors = Counter()
+
+    def report(self, seconds):
+        everything = sorted(value for values in self.latencies.values() for value in values)
+        return {
+            "requests": len(everything),
+            "rps": round(len(everything) / seconds, 1),
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "errors": dict(self.errors),
+            "ms": summary(everything),
+            "endpoints": {name: summary(sorted(values)) for name, values in sorted(self.latencies.items())},
+        }
+
+
+def summary(timings):
+    if not timings:
+        return None
+    return {
+        "p50": round(percentile(timings, 50), 2),
+        "p90": round(percentile(timings, 90), 2),
+        "p99": round(percentile(timings, 99), 2),
+        "max": round(timings[-1], 2),
+        "mean": round(sum(timings) / len(timings), 2),
+    }
+
+
+async def read_response(reader):
+    """статус и нужно ли закрыть соединение; тело (Content-Length или chunked) вычитывается"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    return status, headers.get('connection') == 'close'
+
+
+async def client_loop(port, requests, deadline, stats, timeout):
+    """одно keep-alive соединение: запрос за запросом до deadline"""
+    loop = asyncio.get_running_loop()
+    reader = writer = None
+    while loop.time() < deadline:
+        name, raw = random.choice(requests)()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+            started = loop.time()
+            writer.write(raw)
+            status, close = await asyncio.wait_for(read_response(reader), timeout)
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError) as exc:
+            stats.errors[type(exc).__name__] += 1
+            close = True
+        else:
+            stats.latencies[name].append((loop.time() - started) * 1000)
+            stats.statuses[status] += 1
+        if close and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def idle_loop(port, deadline, stats, timeout):
+    """соединение, которое открыто, но запросов не шлет (медленный или ждущий клиент)"""
+    loop = asyncio.get_running_loop()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    except (OSError, asyncio.TimeoutError) as exc:
+        stats.errors[f"idle.{type(exc).__name__}"] += 1
+        return
+    await asyncio.sleep(max(0, deadline - loop.time()))
+    writer.close()
+
+
+async def run_load(port, requests, connections, seconds, timeout, idle=0):
+    stats = LoadStats()
+    deadline = asyncio.get_running_loop().time() + seconds
+    await asyncio.gather(
+        *(client_loop(port, requests, deadline, stats, timeout) for _ in range(connections)),
+        *(idle_loop(port, deadline, stats, timeout) for _ in range(idle)),
+    )
+    return stats
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = ('Пропускная способность API под WSGI и ASGI (обычные и async-вьюсеты) при сотнях '
+            'одновременных keep-alive соединений: RPS, перцентили задержки и ошибки. '
+            'Сервер - uvicorn в отдельном процессе, данные создаются generate_data в тестовой БД')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tasks',
+            type=int,
+            default=10_000,
+            help='Размер набора по числу задач (по умолчанию: 10000)'
+        )
+        parser.add_argument(
+            '--connections',
+            type=int,
+            default=500,
+            help='Одновременных соединений (по умолчанию: 500)'
+        )
+        parser.add_argument(
+            '--idle',
+            type=int,
+            default=0,
+            help='Дополнительно держать столько открытых соединений без запросов (по умолчанию: 0)'
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=20,
+            help='Сколько секунд мерить каждый режим (по умолчанию: 20)'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=float,
+            default=3,
+            help='Сколько секунд прогревать сервер перед замером (по умолчанию: 3)'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=30,
+            help='Таймаут одного запроса в секундах, после него соединение считается ошибкой (по умолчанию: 30)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Процессов uvicorn (по умолчанию: 1)'
+        )
+        parser.add_argument(
+            '--mode',
+            action='append',
+            choices=sorted(MODES),
+            help='Мерить только этот режим (можно несколько раз; по умолчанию все)'
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Не удалять тестовую БД после прогона и переиспользовать уже засеянные данные'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для JSON-отчета (по умолчанию: stdout)'
+        )
+
+    def handle(self, *args, **options):
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            # серверу нужен файл, база в памяти ему не видна
+            test_settings['NAME'] = str(settings.BASE_DIR / 'benchmark.sqlite3')
+
+        with override_settings(MIGRATION_MODULES=DisableMigrations()):
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb']
+            )
+        try:
+            install_search_schema(connection, backfill=False)
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                self.seed(options['tasks'])
+                session = self.session()
+            requests = self.requests(session)
+            database = connection.settings_dict['NAME']
+            # сервер открывает базу сам - наше соединение не должно держать блокировок
+            connection.close()
+
+            report = {"meta": self.meta(options), "modes": {}}
+            for mode in options['mode'] or MODES:
+                report["modes"][mode] = self.run_mode(mode, database, requests, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+            self.stderr.write(f"Отчет записан в {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "started_at": datetime.now(dt_timezone.utc).isoformat(),
+            "database": connection.vendor,
+            "cache": settings.CACHES['default']['BACKEND'],
+            "api_cache": settings.API_CACHE,
+            "django": django.get_version(),
+            "python": platform.python_version(),
+            "tasks": Task.objects.count(),
+            "connections": options['connections'],
+            "idle": options['idle'],
+            "duration": options['duration'],
+            "workers": options['workers'],
+        }
+
+    def seed(self, size):
+        if Task.objects.count() < size:
+            self.stderr.write(f"Создаю {size} задач...")
+            call_command('generate_data', tasks=size, projects=max(50, size // 200), stdout=io.StringIO())
+            call_command('rebuild_project_stats', stdout=io.StringIO())
+
+    def session(self):
+        user, _ = User.objects.get_or_create(username='benchmark', defaults={'is_superuser': True, 'is_staff': True})
+        client = Client()
+        client.force_login(user)
+        return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def requests(self, session):
+        """генераторы (имя, сырой HTTP-запрос): чтение отдельной задачи, список и статистика
+        по проекту, доска проекта - то, что клиент запрашивает чаще всего"""
+        projects = list(Project.objects.values_list('pk', flat=True))
+        tasks = list(Task.objects.values_list('pk', flat=True))
+
+        def get(name, path):
+            return name, (
+                f"GET {path} HTTP/1.1\r\n"
+                f"Host: 127.0.0.1\r\n"
+                f"Cookie: {settings.SESSION_COOKIE_NAME}={session}\r\n"
+                f"Accept: application/json\r\n"
+                f"\r\n"
+            ).encode()
+
+        return [
+            lambda: get("tasks.retrieve", f"/api/tasks/{random.choice(tasks)}/"),
+            lambda: get("tasks.retrieve", f"/api/tasks/{random.choice(tasks)}/"),
+            lambda: get("tasks.list_by_project", f"/api/tasks/?project_id={random.choice(projects)}"),
+            lambda: get("tasks.stats_by_project", f"/api/tasks/stats/?project_id={random.choice(projects)}"),
+            lambda: get("projects.project_stats", f"/api/projects/{random.choice(projects)}/stats/"),
+            lambda: get("projects.board", f"/api/projects/{random.choice(projects)}/board/"),
+        ]
+
+    def run_mode(self, mode, database, requests, options):
+        arguments, mode_env = MODES[mode]
+        port = free_port()
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'app.settings'),
+            'DB_NAME': str(database),
+            # benchmark.sqlite3 не в репозитории, WAL ему можно
+            'DB_SQLITE_WAL': os.environ.get('DB_SQLITE_WAL', '1'),
+            **mode_env,
+        }
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', *arguments, '--host', '127.0.0.1', '--port', str(port),
+             '--workers', str(options['workers']), '--log-level', 'warning', '--no-access-log',
+             '--backlog', str(max(2048, options['connections'] * 2))],
+            cwd=settings.BASE_DIR, env=env,
+        )
+        try:
+            self.wait_for_server(server, port)
+            self.stderr.write(f"{mode}: прогрев {options['warmup']} с...")
+            asyncio.run(run_load(port, requests, options['connections'], options['warmup'], options['timeout']))
+            self.stderr.write(
+                f"{mode}: {options['connections']} соединений (+{options['idle']} без запросов), {options['duration']} с..."
+            )
+            stats = asyncio.run(run_load(
+                port, requests, options['connections'], options['duration'], options['timeout'], options['idle']
+            ))
+        finally:
+            server.terminate()
+            try:
+                server.wait(10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+
+        result = stats.report(options['duration'])
+        self.stderr.write(
+            f"  {result['rps']} RPS, p50 {result['ms'] and result['ms']['p50']} ms, "
+            f"p99 {result['ms'] and result['ms']['p99']} ms, ошибок {sum(result['errors'].values())}"
+        )
+        return result
+
+    def wait_for_server(self, server, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"uvicorn завершился с кодом {server.returncode}")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f"uvicorn не ответил на порту {port} за {timeout} с")
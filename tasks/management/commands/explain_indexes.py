@@ -0,0 +1,107 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from tasks.models import Comment, Task, TimeTracking
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Планы и время запросов из get_queryset без составных индексов и с ними. '
+            'Индексы удаляются внутри транзакции, которая потом откатывается')
+
+    index_models = [Task, Comment, TimeTracking]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Сколько раз выполнять каждый запрос (по умолчанию: 20)'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Вывести результат в JSON'
+        )
+
+    def access_patterns(self):
+        """те же фильтры и сортировки, что в get_queryset вьюсетов"""
+        task = Task.objects.order_by('?').first()
+        entry = TimeTracking.objects.exclude(user=None).order_by('?').first()
+        if task is None or entry is None:
+            raise CommandError("Нет данных, сначала запустите generate_data")
+
+        project_id = task.column.project_id
+        return {
+            "tasks by project": Task.objects.filter(column__project_id=project_id).order_by('-created_at', 'id')[:50],
+            "tasks by column": Task.objects.filter(column_id=task.column_id).order_by('-created_at', 'id')[:50],
+            "overdue tasks": Task.objects.filter(
+                status__in=['todo', 'in_progress', 'review'], due_date__lt=timezone.now().date()
+            ).order_by(),
+            "comments by task": Comment.objects.filter(task_id=task.id).order_by('-created_at', 'id')[:50],
+            "comments by project": Comment.objects.filter(
+                task__column__project_id=project_id
+            ).order_by('-created_at', 'id')[:50],
+            "time by user": TimeTracking.objects.filter(user_id=entry.user_id).order_by('-start_time', 'id')[:50],
+            "time by task": TimeTracking.objects.filter(task_id=entry.task_id).order_by('-start_time', 'id')[:50],
+            "time by project": TimeTracking.objects.filter(
+                task__column__project_id=project_id
+            ).order_by('-start_time', 'id')[:50],
+        }
+
+    def measure(self, patterns, repeat):
+        result = {}
+        for name, qs in patterns.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(qs.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            result[name] = {
+                "plan": qs.explain(),
+                "median_ms": round(statistics.median(timings), 3),
+            }
+        return result
+
+    def drop_indexes(self):
+        with connection.cursor() as cursor:
+            for model in self.index_models:
+                for index in model._meta.indexes:
+                    cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+
+    def handle(self, *args, **options):
+        patterns = self.access_patterns()
+
+        before = {}
+        try:
+            with transaction.atomic():
+                self.drop_indexes()
+                before = self.measure(patterns, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+        after = self.measure(patterns, options['repeat'])
+
+        report = {
+            name: {"before": before[name], "after": after[name]}
+            for name in patterns
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+
+        for name, data in report.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for label in ("before", "after"):
+                self.stdout.write(f"  {label}: {data[label]['median_ms']} ms")
+                for line in data[label]['plan'].splitlines():
+                    self.stdout.write(f"    {line}")
@@ -1,13 +1,45 @@
-from django.core.management.base import BaseCommand
+import os
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
 from faker import Faker
-import random
-from datetime import timedelta
-from tasks.models import Project, Column, Task, Comment, TimeTracking, UserProfile
+
+from tasks import seeding
+from tasks.caching import bump_version
+from tasks.models import Project, Column, Task, Comment, TimeTracking, UserProfile, next_version
+from tasks.sync import reset_clients
+from tasks.ordering import GAP, next_positions
+from tasks.stats import compute_task_stats, rebuild_project_stats
+from tasks.timereport import invalidate_all
+
+
+@contextmanager
+def keep_created_at(*models):
+    """auto_now_add перезаписал бы сгенерированные даты создания текущим временем"""
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
 
 class Command(BaseCommand):
     help = 'Генерация тестовых данных для приложения задач'
-    
+
+    chunk_size = 5000
+    batch_size = 1000
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--projects',
@@ -21,189 +53,273 @@ class Command(BaseCommand):
             default=1000,
             help='Минимальное количество задач для создания (по умолчанию: 1000)'
         )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=20,
+            help='Минимальное количество пользователей (по умолчанию: 20)'
+        )
+        parser.add_argument(
+            '--comments-per-task',
+            type=float,
+            default=3,
+            help='Сколько комментариев в среднем на задачу (по умолчанию: 3)'
+        )
+        parser.add_argument(
+            '--time-per-task',
+            type=float,
+            default=2,
+            help='Сколько записей учета времени в среднем на задачу (по умолчанию: 2)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Зерно генератора: с одним и тем же зерном на пустой базе получаются одни и те же данные (даты - относительно момента запуска)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=min(4, os.cpu_count() or 1),
+            help='Сколько процессов генерируют строки (по умолчанию: до 4, 1 - без пула)'
+        )
 
     def handle(self, *args, **options):
+        self.seed = options['seed']
+        self.workers = max(1, options['workers'])
+        self.rnd = random.Random(self.seed)
+        self.now = timezone.now()
         fake = Faker(['ru_RU'])
-        
-        users = self.create_users(fake)
-        self.create_user_profiles(fake, users)
-        projects = self.create_projects(fake, users, options['projects'])
-        columns = self.create_columns(fake, projects)
-        tasks = self.create_tasks(fake, users, columns, options['tasks'])
-        self.create_comments(fake, users, tasks)
-        self.create_time_trackings(fake, users, tasks)
+        if self.seed is not None:
+            fake.seed_instance(self.seed)
+
+        self.pools = self.create_text_pools()
+        # одна версия изменения на весь прогон. строки пишутся во многих транзакциях
+        # (и процессах), поэтому в конце клиентам /api/sync/ все равно уходит reset
+        with transaction.atomic():
+            self.version = next_version()
+
+        with keep_created_at(Task, Comment):
+            users = self.create_users(fake, options['users'])
+            self.create_user_profiles(fake)
+            projects = self.create_projects(fake, users, options['projects'])
+            self.create_columns(projects)
+            self.create_tasks(users, options['tasks'])
+            self.create_comments(users, int(options['tasks'] * options['comments_per_task']))
+            self.create_time_trackings(users, int(options['tasks'] * options['time_per_task']))
+
+        # bulk_create не шлет сигналов: счетчики, итоги учета времени и версии кеша обновляем сами
+        rebuild_project_stats()
+        invalidate_all()
+        for model in (User, UserProfile, Project, Column, Task, Comment, TimeTracking):
+            bump_version(model)
+        reset_clients()
         self.print_statistics()
 
-    def create_users(self, fake):
+    def run_parallel(self, func, jobs, context=None):
+        """результаты в порядке jobs. в пуле одновременно не больше 2 кусков на воркер,
+        чтобы не держать в памяти весь объем сразу"""
+        if self.workers == 1:
+            seeding.init_worker(context or {})
+            yield from map(func, jobs)
+            return
+
+        with ProcessPoolExecutor(self.workers, initializer=seeding.init_worker, initargs=(context or {},)) as pool:
+            pending = deque()
+            for job in jobs:
+                pending.append(pool.submit(func, job))
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def worker_context(self, users, **extra):
+        return {
+            "seed": self.seed,
+            "now": self.now,
+            "user_ids": [user.pk for user in users],
+            **self.pools,
+            **extra,
+        }
+
+    def create_text_pools(self):
+        """тексты Faker генерируются один раз кусками в пуле, строки потом берут их из пулов"""
+        pools = {kind: [] for kind in seeding.POOL_SIZES}
+        for kind, texts in self.run_parallel(seeding.text_pool_part, seeding.text_pool_jobs(self.seed)):
+            pools[kind].extend(texts)
+        self.stdout.write(f"Сгенерировано текстов: {sum(map(len, pools.values()))}")
+        return pools
+
+    def create_users(self, fake, min_users):
         """создание тестовых пользователей"""
-        users = list(User.objects.all())
-        
-        if len(users) < 20:
-            for i in range(20 - len(users)):
+        users = list(User.objects.order_by('pk'))
+        missing = min_users - len(users)
+
+        if missing > 0:
+            taken = set(User.objects.values_list('username', flat=True))
+            # хеш пароля считается долго, а пароль у всех тестовых пользователей один
+            password = make_password('testpassword123')
+            new_users = []
+            while len(new_users) < missing:
                 username = fake.user_name()
-                email = fake.email()
-                
-                if not User.objects.filter(username=username).exists():
-                    user = User.objects.create_user(
-                        username=username,
-                        email=email,
-                        password='testpassword123',
-                        first_name=fake.first_name(),
-                        last_name=fake.last_name()
-                    )
-                    users.append(user)
-        
+                if username in taken:
+                    username = f"{username}{len(taken)}"
+                if username in taken:
+                    continue
+                taken.add(username)
+                new_users.append(User(
+                    username=username,
+                    email=fake.email(),
+                    password=password,
+                    first_name=fake.first_name(),
+                    last_name=fake.last_name()
+                ))
+            users.extend(User.objects.bulk_create(new_users, batch_size=self.batch_size))
+
         self.stdout.write(f"Создано/получено {len(users)} пользователей")
         return users
 
-    def create_user_profiles(self, fake, users):
-        """создание профилей для пользователей"""
-        
+    def create_user_profiles(self, fake):
+        """профили для пользователей, у которых их нет (bulk_create не вызывает create_user_profile)"""
         profile_types = ['admin', 'manager', 'developer', 'viewer']
-        
-        for user in users:
-            if not hasattr(user, 'userprofile'):
-                UserProfile.objects.create(
-                    user=user,
-                    name=f"{user.first_name} {user.last_name}",
-                    birthday=fake.date_of_birth(minimum_age=18, maximum_age=60),
-                    type=random.choice(profile_types)
-                )
-        
+        profiles = [
+            UserProfile(
+                user=user,
+                name=f"{user.first_name} {user.last_name}",
+                birthday=fake.date_of_birth(minimum_age=18, maximum_age=60),
+                type=self.rnd.choice(profile_types)
+            )
+            for user in User.objects.filter(userprofile__isnull=True).order_by('pk')
+        ]
+        UserProfile.objects.bulk_create(profiles, batch_size=self.batch_size)
+
         self.stdout.write(f"Создано {UserProfile.objects.count()} профилей")
 
     def create_projects(self, fake, users, num_projects):
         """создание проектов"""
-        
-        projects = list(Project.objects.all())
-        
+        projects = list(Project.objects.order_by('pk'))
+
         if len(projects) < num_projects:
-            for _ in range(num_projects - len(projects)):
-                project = Project.objects.create(
+            new_projects = [
+                Project(
                     name=fake.catch_phrase(),
                     description=fake.text(max_nb_chars=500),
-                    user=random.choice(users)
+                    user=self.rnd.choice(users),
+                    version=self.version
                 )
-                projects.append(project)
-        
+                for _ in range(num_projects - len(projects))
+            ]
+            projects.extend(Project.objects.bulk_create(new_projects, batch_size=self.batch_size))
+
         self.stdout.write(f"Создано/получено {len(projects)} проектов")
         return projects
 
     def create_columns(self, projects):
-        """создание колонок для проектов"""
-        
-        columns = list(Column.objects.all())
+        """колонки для проектов, где их меньше 4 - один GROUP BY вместо count() на проект"""
         column_names = ['Бэклог', 'К выполнению', 'В работе', 'На проверке', 'Выполнено', 'Архив']
-        
-        for project in projects:
-            existing_columns = Column.objects.filter(project=project).count()
-            if existing_columns < 4:
-                for i, name in enumerate(random.sample(column_names, min(4, len(column_names)))):
-                    column = Column.objects.create(
-                        name=name,
-                        project=project,
-                        order=i
-                    )
-                    columns.append(column)
-        
-        self.stdout.write(f"  Создано/получено {len(columns)} колонок")
-        return columns
-
-    def create_tasks(self, fake, users, columns, min_tasks):
-        """создание задач"""
-        
-        tasks = list(Task.objects.all())
-
-        if len(tasks) < min_tasks:
-            for _ in range(min_tasks - len(tasks)):
-                created_at = fake.date_time_between(start_date='-1y', end_date='now')
-                due_date = created_at + timedelta(days=random.randint(1, 30))
-                
-                task = Task.objects.create(
-                    title=fake.sentence(nb_words=6),
-                    description=fake.text(max_nb_chars=random.randint(100, 1000)),
-                    column=random.choice(columns),
-                    priority=random.choice(['low', 'medium', 'high']),
-                    status=random.choice(['todo', 'in_progress', 'review', 'done']),
-                    due_date=due_date.date() if random.random() > 0.3 else None,
-                    created_at=created_at,
-                    updated_at=created_at + timedelta(hours=random.randint(1, 100)),
-                    creator=random.choice(users),
-                    assignee=random.choice(users) if random.random() > 0.2 else None
-                )
-                tasks.append(task)
-        
-        self.stdout.write(f"  Создано/получено {len(tasks)} задач")
-        return tasks
+        sparse = (
+            Project.objects.annotate(column_total=Count('column'))
+            .filter(column_total__lt=4).order_by('pk').values_list('pk', flat=True)
+        )
+
+        columns = [
+            Column(name=name, project_id=project_id, order=(i + 1) * GAP, version=self.version)
+            for project_id in sparse
+            for i, name in enumerate(self.rnd.sample(column_names, 4))
+        ]
+        Column.objects.bulk_create(columns, batch_size=self.batch_size)
+
+        self.stdout.write(f"  Создано/получено {Column.objects.count()} колонок")
+
+    def create_tasks(self, users, min_tasks):
+        """создание задач: строки генерирует пул, позиции в колонках раздаются здесь по порядку"""
+        missing = min_tasks - Task.objects.count()
+        if missing > 0:
+            column_ids = list(Column.objects.order_by('pk').values_list('pk', flat=True))
+            positions = next_positions(column_ids)
+            jobs = [
+                (index, min(self.chunk_size, missing - start))
+                for index, start in enumerate(range(0, missing, self.chunk_size))
+            ]
+            context = self.worker_context(users, column_ids=column_ids)
 
-    def create_comments(self, fake, users, tasks):
+            for rows in self.run_parallel(seeding.task_rows, jobs, context):
+                tasks = []
+                for title, description, column_id, priority, status, due_date, created_at, creator_id, assignee_id in rows:
+                    tasks.append(Task(
+                        title=title,
+                        description=description,
+                        column_id=column_id,
+                        priority=priority,
+                        status=status,
+                        due_date=due_date,
+                        position=positions[column_id],
+                        created_at=created_at,
+                        creator_id=creator_id,
+                        assignee_id=assignee_id,
+                        version=self.version
+                    ))
+                    positions[column_id] += GAP
+                with transaction.atomic():
+                    Task.objects.bulk_create(tasks, batch_size=self.batch_size)
+
+        self.stdout.write(f"  Создано/получено {Task.objects.count()} задач")
+
+    def task_chunks(self, total):
+        """задачи кусками (id, created_at) и сколько строк на кусок приходится из total.
+        куски берутся по id > последнего, а не одним курсором - между ними идут вставки"""
+        count = Task.objects.count()
+        done, placed, last_id = 0, 0, 0
+        while True:
+            chunk = list(
+                Task.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', 'created_at')[:self.chunk_size]
+            )
+            if not chunk:
+                return
+            done += len(chunk)
+            last_id = chunk[-1][0]
+            share = total * min(done, count) // count - placed
+            placed += share
+            yield chunk, share
+
+    def create_related(self, users, total, func, build, model):
+        if total <= 0 or not Task.objects.exists():
+            return
+        jobs = (
+            (index, chunk, share)
+            for index, (chunk, share) in enumerate(self.task_chunks(total))
+            if share
+        )
+        for rows in self.run_parallel(func, jobs, self.worker_context(users)):
+            with transaction.atomic():
+                model.objects.bulk_create([build(*row) for row in rows], batch_size=self.batch_size)
+
+    def create_comments(self, users, target_comments):
         """создание комментариев к задачам"""
-        
-        target_comments = 3000
-        current_comments = Comment.objects.count()
-        
-        if current_comments < target_comments:
-            comments_to_create = target_comments - current_comments
-            new_comments = []
-            
-            for _ in range(comments_to_create):
-                task = random.choice(tasks)
-                created_at = fake.date_time_between(
-                    start_date=task.created_at, 
-                    end_date='now'
-                )
-                
-                comment = Comment(
-                    task=task,
-                    text=fake.text(max_nb_chars=random.randint(50, 500)),
-                    created_at=created_at,
-                    user=random.choice(users)
-                )
-                new_comments.append(comment)
-            
-            Comment.objects.bulk_create(new_comments, batch_size=1000)
-        
+        self.create_related(
+            users, target_comments - Comment.objects.count(), seeding.comment_rows,
+            lambda task_id, text, created_at, user_id: Comment(
+                task_id=task_id, text=text, created_at=created_at, user_id=user_id, version=self.version
+            ),
+            Comment,
+        )
         self.stdout.write(f"  Создано {Comment.objects.count()} комментариев")
 
-    def create_time_trackings(self, fake, users, tasks):
+    def create_time_trackings(self, users, target_trackings):
         """создание учета времени"""
-        
-        target_trackings = 2000
-        current_trackings = TimeTracking.objects.count()
-        
-        if current_trackings < target_trackings:
-            trackings_to_create = target_trackings - current_trackings
-            new_trackings = []
-            
-            for _ in range(trackings_to_create):
-                task = random.choice(tasks)
-                user = random.choice(users)
-                start_time = fake.date_time_between(
-                    start_date=task.created_at, 
-                    end_date='now'
-                )
-                
-                if random.random() > 0.2:
-                    end_time = start_time + timedelta(hours=random.randint(1, 8))
-                else:
-                    end_time = None
-                
-                tracking = TimeTracking(
-                    task=task,
-                    user=user,
-                    start_time=start_time,
-                    end_time=end_time,
-                    description=fake.text(max_nb_chars=random.randint(50, 200)) if random.random() > 0.3 else ''
-                )
-                new_trackings.append(tracking)
-            
-            TimeTracking.objects.bulk_create(new_trackings, batch_size=1000)
-        
+        self.create_related(
+            users, target_trackings - TimeTracking.objects.count(), seeding.time_rows,
+            lambda task_id, user_id, start_time, end_time, description: TimeTracking(
+                task_id=task_id, user_id=user_id, start_time=start_time, end_time=end_time,
+                description=description, version=self.version
+            ),
+            TimeTracking,
+        )
         self.stdout.write(f"  Создано {TimeTracking.objects.count()} записей учета времени")
 
     def print_statistics(self):
         """вывод статистики по данным"""
-        
+
         self.stdout.write(f"Пользователи: {User.objects.count()}")
         self.stdout.write(f"Профили пользователей: {UserProfile.objects.count()}")
         self.stdout.write(f"Проекты: {Project.objects.count()}")
@@ -211,14 +327,15 @@ class Command(BaseCommand):
         self.stdout.write(f"Задачи: {Task.objects.count()}")
         self.stdout.write(f"Комментарии: {Comment.objects.count()}")
         self.stdout.write(f"Учет времени: {TimeTracking.objects.count()}")
-        
+
+        stats = compute_task_stats(Task.objects.all())
         self.stdout.write("\nСтатистика по задачам:")
-        self.stdout.write(f"  Высокий приоритет: {Task.objects.filter(priority='high').count()}")
-        self.stdout.write(f"  Средний приоритет: {Task.objects.filter(priority='medium').count()}")
-        self.stdout.write(f"  Низкий приоритет: {Task.objects.filter(priority='low').count()}")
-        
-        self.stdout.write(f"  К выполнению: {Task.objects.filter(status='todo').count()}")
-        self.stdout.write(f"  В работе: {Task.objects.filter(status='in_progress').count()}")
-        self.stdout.write(f"  На проверке: {Task.objects.filter(status='review').count()}")
-        self.stdout.write(f"  Выполнено: {Task.objects.filter(status='done').count()}")
-        """6 задание, то есть факер/фейкер"""
\ No newline at end of file
+        self.stdout.write(f"  Высокий приоритет: {stats['by_priority'].get('high', 0)}")
+        self.stdout.write(f"  Средний приоритет: {stats['by_priority'].get('medium', 0)}")
+        self.stdout.write(f"  Низкий приоритет: {stats['by_priority'].get('low', 0)}")
+
+        self.stdout.write(f"  К выполнению: {stats['by_status'].get('todo', 0)}")
+        self.stdout.write(f"  В работе: {stats['by_status'].get('in_progress', 0)}")
+        self.stdout.write(f"  На проверке: {stats['by_status'].get('review', 0)}")
+        self.stdout.write(f"  Выполнено: {stats['by_status'].get('done', 0)}")
+        """6 задание, то есть факер/фейкер"""
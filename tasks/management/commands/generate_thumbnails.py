@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from tasks.models import Comment, Task
+from tasks.thumbnails import process_pending
+
+
+class Command(BaseCommand):
+    help = ('Превью для картинок, загруженных до появления превью или потерянных при падении пула. '
+            'Уже готовые варианты (по хешу содержимого) не пересчитываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пройти и по строкам, у которых превью уже есть (например, после смены THUMBNAIL_SIZES)'
+        )
+
+    def handle(self, *args, **options):
+        # в этой команде пул не нужен: она сама и есть фоновая работа
+        counts = process_pending(everything=options['all'])
+        for model in (Task, Comment):
+            self.stdout.write(f"{model._meta.verbose_name_plural}: обработано {counts[model._meta.model_name]}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from tasks.jobs import purge_expired
+
+
+class Command(BaseCommand):
+    help = ('Удаление фоновых задач с истекшим сроком хранения (JOB_RESULT_TTL) вместе с файлами. '
+            'Воркер run_jobs делает то же сам, команда - для cron, если воркер запущен не всегда')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Удалено задач: {purge_expired()}")
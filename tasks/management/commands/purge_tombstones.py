@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tasks.sync import purge_tombstones
+
+
+class Command(BaseCommand):
+    help = ('Удаление старых надгробий для /api/sync/. Клиенты, которые не синхронизировались '
+            'дольше этого срока, получат reset и перечитают данные целиком')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.SYNC_TOMBSTONE_DAYS,
+            help=f'Сколько дней хранить надгробия (по умолчанию: {settings.SYNC_TOMBSTONE_DAYS})'
+        )
+
+    def handle(self, *args, **options):
+        count = purge_tombstones(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(f"Удалено надгробий: {count}")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from tasks.stats import rebuild_project_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчет таблицы ProjectStats с нуля (после миграции или при расхождении счетчиков)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project',
+            type=int,
+            action='append',
+            dest='projects',
+            help='ID проекта для пересчета, можно указать несколько раз (по умолчанию: все)'
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_project_stats(options['projects'])
+        self.stdout.write(f"Пересчитано проектов: {count}")
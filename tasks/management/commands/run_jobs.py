@@ -0,0 +1,147 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from tasks import jobs
+
+logger = logging.getLogger(__name__)
+
+# как часто чистить просроченные результаты и задачи, брошенные JOB_MAX_ATTEMPTS раз
+MAINTENANCE_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = ('Воркер фоновых задач (выгрузки, отчеты, превью) из таблицы Job. '
+            'Задачи выполняются в пуле процессов, воркеров можно запускать сколько угодно')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=settings.JOB_WORKERS,
+            help=(f'Процессов в пуле (по умолчанию: {settings.JOB_WORKERS}). '
+                  '0 - выполнять задачи в самом воркере, по одной и без продления срока, для отладки')
+        )
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=settings.JOB_POLL_INTERVAL,
+            help=f'Раз в сколько секунд проверять очередь (по умолчанию: {settings.JOB_POLL_INTERVAL})'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить то, что уже есть в очереди, и выйти'
+        )
+
+    def handle(self, *args, **options):
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = False
+        self.completed = 0
+        self.maintained_at = None
+
+        # SIGTERM (systemd, docker stop): новые задачи не берем, начатые доделываем
+        previous = signal.signal(signal.SIGTERM, self.stop)
+        try:
+            if options['processes'] > 0:
+                self.run_pool(options['processes'], options['poll'], options['once'])
+            else:
+                self.run_inline(options['poll'], options['once'])
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+
+        self.stdout.write(f"Выполнено задач: {self.completed}")
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def maintain(self):
+        now = time.monotonic()
+        if self.maintained_at is not None and now - self.maintained_at < MAINTENANCE_INTERVAL:
+            return
+        self.maintained_at = now
+        jobs.fail_abandoned()
+        jobs.purge_expired()
+
+    def run_inline(self, poll, once):
+        while not self.stopping:
+            self.maintain()
+            job = jobs.claim(self.worker)
+            if job is None:
+                if once:
+                    break
+                time.sleep(poll)
+                continue
+            jobs.run(job.pk, job.attempts)
+            self.completed += 1
+
+    def make_pool(self, processes):
+        # spawn, а не fork: форк унаследовал бы открытые соединения с БД и потоки родителя
+        return ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup
+        )
+
+    def run_pool(self, processes, poll, once):
+        executor = self.make_pool(processes)
+        running = {}  # future -> id задачи
+        heartbeat_at = time.monotonic()
+        try:
+            while not (self.stopping and not running):
+                # между итерациями соединение живет по CONN_MAX_AGE, как между запросами
+                close_old_connections()
+                self.maintain()
+
+                while not self.stopping and len(running) < processes:
+                    job = jobs.claim(self.worker)
+                    if job is None:
+                        break
+                    running[executor.submit(jobs.run_in_process, job.pk, job.attempts)] = job.pk
+
+                if not running:
+                    if once:
+                        break
+                    time.sleep(poll)
+                    continue
+
+                done, _ = wait(running, timeout=poll, return_when=FIRST_COMPLETED)
+                broken = []
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        future.result()
+                    except BrokenProcessPool:
+                        broken.append(job_id)
+                    except Exception:
+                        # ошибки самой задачи run записывает в Job, сюда доходят только ошибки БД
+                        logger.exception("фоновая задача %s: ошибка вне обработчика", job_id)
+                    else:
+                        self.completed += 1
+
+                if broken:
+                    # процесс пула убит (OOM killer, падение в Pillow) - пул непригоден целиком.
+                    # его задачи сразу возвращаются в очередь, попытка засчитана
+                    broken += running.values()
+                    logger.error("пул фоновых задач сломан, задачи %s возвращены в очередь", broken)
+                    jobs.release(broken, self.worker)
+                    running.clear()
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = self.make_pool(processes)
+
+                if running and time.monotonic() - heartbeat_at > settings.JOB_LEASE / 3:
+                    jobs.heartbeat(list(running.values()), self.worker)
+                    heartbeat_at = time.monotonic()
+        finally:
+            if running:
+                # прервали не по SIGTERM (Ctrl+C, исключение): не держим задачи до конца срока
+                jobs.release(list(running.values()), self.worker)
+            executor.shutdown(wait=False, cancel_futures=True)
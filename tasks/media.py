@@ -0,0 +1,157 @@
+"""раздача загруженных файлов (MEDIA_ROOT) вместо debug-only django.conf.urls.static.
+
+каждый ответ несет ETag и Last-Modified по mtime и размеру файла (как у nginx),
+условный GET получает 304 без чтения файла. без прокси файл отдается самим Django,
+с поддержкой Range (одного диапазона) - видео и большие картинки можно докачивать.
+
+с MEDIA_ACCEL = 'nginx' или 'apache' Django только проверяет путь и заголовки,
+а сами байты отдает прокси (X-Accel-Redirect / X-Sendfile), воркер Python сразу
+освобождается. для nginx нужна internal-локация на MEDIA_ACCEL_PREFIX:
+
+    location /protected-media/ {
+        internal;
+        alias /path/to/media/;
+    }
+
+Range и If-Range в этом режиме обрабатывает уже прокси"""
+import mimetypes
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .thumbnails import THUMBNAIL_DIR
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def media_path(path):
+    try:
+        full = Path(safe_join(settings.MEDIA_ROOT, path))
+    except (SuspiciousFileOperation, ValueError):
+        raise Http404
+    if not full.is_file():
+        raise Http404
+    return full
+
+
+def file_etag(stat):
+    return quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+
+
+def not_modified(request, etag, mtime):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+    if_modified_since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def parse_range(header, size):
+    """(start, end) включительно, None - отдать файл целиком, ValueError - диапазон вне файла.
+    несколько диапазонов (multipart/byteranges) не поддерживаются - отдается весь файл"""
+    match = RANGE_RE.match(header.replace(" ", ""))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-500 - последние 500 байт
+        length = int(last)
+        if length == 0:
+            raise ValueError
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError
+    return start, end
+
+
+def read_range(full, start, length):
+    with open(full, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def cache_policy(path, response):
+    if path.startswith(f"{THUMBNAIL_DIR}/"):
+        # превью лежат по хешу содержимого и никогда не меняются
+        patch_cache_control(response, public=True, max_age=365 * 24 * 3600, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+
+
+def accel_response(full, path):
+    response = HttpResponse()
+    if settings.MEDIA_ACCEL == "nginx":
+        response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+    else:
+        response["X-Sendfile"] = str(full)
+    # тип пусть определяет прокси по расширению, а не Django
+    del response["Content-Type"]
+    return response
+
+
+def serve(request, path):
+    full = media_path(path)
+    stat = full.stat()
+    etag = file_etag(stat)
+
+    if not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+    elif settings.MEDIA_ACCEL:
+        response = accel_response(full, path)
+    else:
+        response = file_response(request, full, stat, etag)
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    cache_policy(path, response)
+    return response
+
+
+def file_response(request, full, stat, etag):
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    # If-Range: диапазон только если у клиента та же версия файла, иначе весь файл
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(full, "rb"))
+    else:
+        start, end = byte_range
+        content_type, encoding = mimetypes.guess_type(full.name)
+        response = StreamingHttpResponse(
+            read_range(full, start, end - start + 1),
+            status=206,
+            content_type=content_type or "application/octet-stream",
+        )
+        if encoding:
+            response["Content-Encoding"] = encoding
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,204 @@
+"""метрики запросов: время ответа, число и время запросов к БД, размер ответа.
+
+MetricsMiddleware меряет каждый запрос, кладет итог в заголовок Server-Timing
+(его видно во вкладке Network браузера) и в гистограммы по маршруту.
+маршрут - это имя url (task-list, task-detail, project-stats...), а не путь,
+чтобы id не плодили отдельные ряды. гистограммы отдаются на /metrics
+в текстовом формате Prometheus.
+
+запросы к БД считаются через execute_wrapper на соединениях, так что счетчик
+работает и с DEBUG=False, и под ASGI. запрос, сделавший больше METRICS_QUERY_THRESHOLD
+обращений к БД, пишется в лог tasks.metrics - так ловятся N+1.
+
+гистограммы живут в памяти процесса: при нескольких воркерах у каждого свои,
+Prometheus надо натравливать на каждый воркер отдельно"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+METRICS = {
+    "http_request_duration_seconds": ("Время ответа", DURATION_BUCKETS),
+    "http_request_db_queries": ("Запросов к БД на один HTTP-запрос", QUERY_BUCKETS),
+    "http_request_db_duration_seconds": ("Время в БД на один HTTP-запрос", DURATION_BUCKETS),
+    "http_response_size_bytes": ("Размер тела ответа (без потоковых)", SIZE_BUCKETS),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(METRICS[name][1])
+            histogram.observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def render(self):
+        with self.lock:
+            items = sorted(
+                (key, list(h.counts), h.sum, h.count) for key, h in self.histograms.items()
+            )
+
+        lines = []
+        for name, (help_text, buckets) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), counts, total, count in items:
+                if metric != name:
+                    continue
+                base = ",".join(f'{key}="{escape(value)}"' for key, value in labels)
+                cumulative = 0
+                for bound, bucket_count in zip((*buckets, "+Inf"), counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{base},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{base}}} {total}")
+                lines.append(f"{name}_count{{{base}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+
+
+class QueryCounter:
+    """считает запросы к БД и время в них. запросы одного HTTP-запроса могут идти из
+    нескольких потоков (sync_to_async, aio.gather), поэтому под замком"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.seconds += elapsed
+                self.count += 1
+
+
+# счетчик текущего HTTP-запроса. ContextVar, а не обертка на соединениях этого потока:
+# под ASGI запросы к БД идут из потоков sync_to_async со своими соединениями,
+# а контекст туда копируется
+current_counter = ContextVar("metrics_query_counter", default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    counter = current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+def instrument(connection, **kwargs):
+    """вешает count_query на соединение - при его создании (connection_created)
+    и на уже открытые соединения потока в начале запроса"""
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+connection_created.connect(instrument)
+
+
+def route_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.view_name or match.route
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        for connection in connections.all():
+            instrument(connection)
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        return self.record(request, response, counter, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        return self.record(request, response, counter, time.perf_counter() - started)
+
+    def record(self, request, response, counter, elapsed):
+        route = route_name(request)
+        labels = {"method": request.method, "route": route}
+        registry.observe("http_request_duration_seconds", {**labels, "status": response.status_code}, elapsed)
+        registry.observe("http_request_db_queries", labels, counter.count)
+        registry.observe("http_request_db_duration_seconds", labels, counter.seconds)
+        if not response.streaming:
+            registry.observe("http_response_size_bytes", labels, len(response.content))
+
+        response["Server-Timing"] = (
+            f'app;dur={elapsed * 1000:.1f}, '
+            f'db;dur={counter.seconds * 1000:.1f};desc="{counter.count} queries"'
+        )
+
+        if counter.count > settings.METRICS_QUERY_THRESHOLD:
+            logger.warning(
+                "%s %s (%s): %d запросов к БД за %.1f ms, всего %.1f ms",
+                request.method, request.get_full_path(), route,
+                counter.count, counter.seconds * 1000, elapsed * 1000,
+            )
+        return response
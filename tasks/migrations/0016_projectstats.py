@@ -0,0 +1,87 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+
+
+def fill_project_stats(apps, schema_editor):
+    """счетчики для уже существующих проектов - те же GROUP BY, что в rebuild_project_stats,
+    но на исторических моделях: без строки проекта stats-эндпоинты отдавали бы 0"""
+    Project = apps.get_model("tasks", "Project")
+    Column = apps.get_model("tasks", "Column")
+    Task = apps.get_model("tasks", "Task")
+    Comment = apps.get_model("tasks", "Comment")
+    TimeTracking = apps.get_model("tasks", "TimeTracking")
+    ProjectStats = apps.get_model("tasks", "ProjectStats")
+
+    rows = {pk: ProjectStats(project_id=pk) for pk in Project.objects.values_list("pk", flat=True)}
+
+    for item in Column.objects.values("project_id").order_by().annotate(n=Count("id")):
+        if item["project_id"] in rows:
+            rows[item["project_id"]].column_count = item["n"]
+
+    task_aggregates = {"task_count": Count("id")}
+    for status, _ in Task._meta.get_field("status").choices:
+        task_aggregates[f"status_{status}"] = Count("id", filter=Q(status=status))
+    for priority, _ in Task._meta.get_field("priority").choices:
+        task_aggregates[f"priority_{priority}"] = Count("id", filter=Q(priority=priority))
+    for item in Task.objects.values("column__project_id").order_by().annotate(**task_aggregates):
+        stats = rows.get(item.pop("column__project_id"))
+        if stats:
+            for name, value in item.items():
+                setattr(stats, name, value)
+
+    for item in Comment.objects.values("task__column__project_id").order_by().annotate(n=Count("id")):
+        stats = rows.get(item["task__column__project_id"])
+        if stats:
+            stats.comment_count = item["n"]
+
+    duration = ExpressionWrapper(F("end_time") - F("start_time"), output_field=DurationField())
+    time_rows = TimeTracking.objects.values("task__column__project_id").order_by().annotate(
+        n=Count("id"),
+        open=Count("id", filter=Q(end_time__isnull=True)),
+        tracked=Sum(duration, filter=Q(end_time__isnull=False)),
+    )
+    for item in time_rows:
+        stats = rows.get(item["task__column__project_id"])
+        if stats:
+            stats.time_entry_count = item["n"]
+            stats.open_time_entries = item["open"]
+            stats.tracked_seconds = int(item["tracked"].total_seconds()) if item["tracked"] else 0
+
+    ProjectStats.objects.bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0015_remove_task_updated_at_remove_userprofile_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectStats',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='tasks.project', verbose_name='Проект')),
+                ('column_count', models.IntegerField(default=0, verbose_name='Колонок')),
+                ('task_count', models.IntegerField(default=0, verbose_name='Задач')),
+                ('status_todo', models.IntegerField(default=0, verbose_name='К выполнению')),
+                ('status_in_progress', models.IntegerField(default=0, verbose_name='В работе')),
+                ('status_review', models.IntegerField(default=0, verbose_name='На проверке')),
+                ('status_done', models.IntegerField(default=0, verbose_name='Выполнено')),
+                ('priority_low', models.IntegerField(default=0, verbose_name='Низкий приоритет')),
+                ('priority_medium', models.IntegerField(default=0, verbose_name='Средний приоритет')),
+                ('priority_high', models.IntegerField(default=0, verbose_name='Высокий приоритет')),
+                ('comment_count', models.IntegerField(default=0, verbose_name='Комментариев')),
+                ('time_entry_count', models.IntegerField(default=0, verbose_name='Записей учета времени')),
+                ('open_time_entries', models.IntegerField(default=0, verbose_name='Незакрытых записей')),
+                ('tracked_seconds', models.BigIntegerField(default=0, verbose_name='Учтено секунд')),
+            ],
+            options={
+                'verbose_name': 'Статистика проекта',
+                'verbose_name_plural': 'Статистика проектов',
+            },
+        ),
+        migrations.RunPython(fill_project_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0016_projectstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['task', 'created_at'], name='comment_task_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['column', '-created_at'], name='task_column_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'due_date'], name='task_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timetracking',
+            index=models.Index(fields=['user', '-start_time'], name='timetrack_user_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timetracking',
+            index=models.Index(fields=['task', '-start_time'], name='timetrack_task_start_idx'),
+        ),
+    ]
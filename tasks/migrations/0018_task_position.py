@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_positions(apps, schema_editor):
+    """существующие задачи встают в колонках по дате создания с шагом 1024"""
+    Task = apps.get_model("tasks", "Task")
+    batch = []
+    column_id, position = None, 0
+    for task in Task.objects.order_by('column_id', 'created_at', 'id').only('id', 'column_id').iterator():
+        if task.column_id != column_id:
+            column_id, position = task.column_id, 0
+        position += 1024
+        task.position = position
+        batch.append(task)
+        if len(batch) >= 1000:
+            Task.objects.bulk_update(batch, ['position'])
+            batch = []
+    Task.objects.bulk_update(batch, ['position'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0017_task_comment_timetracking_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='position',
+            field=models.IntegerField(default=0, verbose_name='Позиция в колонке'),
+        ),
+        migrations.RunPython(fill_positions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['column', 'position'], name='task_column_position_idx'),
+        ),
+    ]
@@ -0,0 +1,170 @@
+from django.db import migrations
+
+# SQL скопирован из tasks/search.py на момент миграции: правки search.py не должны
+# менять то, что эта миграция делает на новой базе
+
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS tasks_search USING fts5(
+        kind UNINDEXED, object_id UNINDEXED, task_id UNINDEXED, title, body,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_search_task_ai AFTER INSERT ON tasks_task BEGIN
+        INSERT INTO tasks_search (rowid, kind, object_id, task_id, title, body)
+        VALUES (new.id * 2, 'task', new.id, new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_search_task_au AFTER UPDATE OF title, description ON tasks_task BEGIN
+        DELETE FROM tasks_search WHERE rowid = old.id * 2;
+        INSERT INTO tasks_search (rowid, kind, object_id, task_id, title, body)
+        VALUES (new.id * 2, 'task', new.id, new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_search_task_ad AFTER DELETE ON tasks_task BEGIN
+        DELETE FROM tasks_search WHERE rowid = old.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_search_comment_ai AFTER INSERT ON tasks_comment BEGIN
+        INSERT INTO tasks_search (rowid, kind, object_id, task_id, title, body)
+        VALUES (new.id * 2 + 1, 'comment', new.id, new.task_id, '', new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_search_comment_au AFTER UPDATE OF text, task_id ON tasks_comment BEGIN
+        DELETE FROM tasks_search WHERE rowid = old.id * 2 + 1;
+        INSERT INTO tasks_search (rowid, kind, object_id, task_id, title, body)
+        VALUES (new.id * 2 + 1, 'comment', new.id, new.task_id, '', new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_search_comment_ad AFTER DELETE ON tasks_comment BEGIN
+        DELETE FROM tasks_search WHERE rowid = old.id * 2 + 1;
+    END
+    """,
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS tasks_search_task_ai",
+    "DROP TRIGGER IF EXISTS tasks_search_task_au",
+    "DROP TRIGGER IF EXISTS tasks_search_task_ad",
+    "DROP TRIGGER IF EXISTS tasks_search_comment_ai",
+    "DROP TRIGGER IF EXISTS tasks_search_comment_au",
+    "DROP TRIGGER IF EXISTS tasks_search_comment_ad",
+    "DROP TABLE IF EXISTS tasks_search",
+]
+
+POSTGRES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS tasks_search (
+        id bigint PRIMARY KEY,
+        kind varchar(10) NOT NULL,
+        object_id bigint NOT NULL,
+        task_id bigint NOT NULL,
+        title text NOT NULL DEFAULT '',
+        body text NOT NULL DEFAULT '',
+        document tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')
+        ) STORED
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS tasks_search_document_idx ON tasks_search USING GIN (document)",
+    """
+    CREATE OR REPLACE FUNCTION tasks_search_task_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM tasks_search WHERE id = OLD.id * 2;
+            RETURN OLD;
+        END IF;
+        INSERT INTO tasks_search (id, kind, object_id, task_id, title, body)
+        VALUES (NEW.id * 2, 'task', NEW.id, NEW.id, NEW.title, NEW.description)
+        ON CONFLICT (id) DO UPDATE SET title = EXCLUDED.title, body = EXCLUDED.body;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION tasks_search_comment_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM tasks_search WHERE id = OLD.id * 2 + 1;
+            RETURN OLD;
+        END IF;
+        INSERT INTO tasks_search (id, kind, object_id, task_id, title, body)
+        VALUES (NEW.id * 2 + 1, 'comment', NEW.id, NEW.task_id, '', NEW.text)
+        ON CONFLICT (id) DO UPDATE SET task_id = EXCLUDED.task_id, body = EXCLUDED.body;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS tasks_search_task ON tasks_task",
+    """
+    CREATE TRIGGER tasks_search_task AFTER INSERT OR UPDATE OF title, description OR DELETE ON tasks_task
+    FOR EACH ROW EXECUTE FUNCTION tasks_search_task_sync()
+    """,
+    "DROP TRIGGER IF EXISTS tasks_search_comment ON tasks_comment",
+    """
+    CREATE TRIGGER tasks_search_comment AFTER INSERT OR UPDATE OF text, task_id OR DELETE ON tasks_comment
+    FOR EACH ROW EXECUTE FUNCTION tasks_search_comment_sync()
+    """,
+]
+
+POSTGRES_DROP = [
+    "DROP TRIGGER IF EXISTS tasks_search_task ON tasks_task",
+    "DROP TRIGGER IF EXISTS tasks_search_comment ON tasks_comment",
+    "DROP FUNCTION IF EXISTS tasks_search_task_sync()",
+    "DROP FUNCTION IF EXISTS tasks_search_comment_sync()",
+    "DROP TABLE IF EXISTS tasks_search",
+]
+
+SQLITE_BACKFILL = [
+    "DELETE FROM tasks_search",
+    "INSERT INTO tasks_search (rowid, kind, object_id, task_id, title, body) "
+    "SELECT id * 2, 'task', id, id, title, description FROM tasks_task",
+    "INSERT INTO tasks_search (rowid, kind, object_id, task_id, title, body) "
+    "SELECT id * 2 + 1, 'comment', id, task_id, '', text FROM tasks_comment",
+]
+
+POSTGRES_BACKFILL = [
+    "DELETE FROM tasks_search",
+    "INSERT INTO tasks_search (id, kind, object_id, task_id, title, body) "
+    "SELECT id * 2, 'task', id, id, title, description FROM tasks_task",
+    "INSERT INTO tasks_search (id, kind, object_id, task_id, title, body) "
+    "SELECT id * 2 + 1, 'comment', id, task_id, '', text FROM tasks_comment",
+]
+
+
+class VendorRunSQL(migrations.RunSQL):
+    """RunSQL, который выполняется только на одной СУБД (на остальных поиска нет)"""
+
+    def __init__(self, vendor, *args, **kwargs):
+        self.vendor = vendor
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, args, kwargs = super().deconstruct()
+        return name, [self.vendor, *args], kwargs
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0018_task_position'),
+    ]
+
+    operations = [
+        VendorRunSQL('sqlite', SQLITE_SCHEMA + SQLITE_BACKFILL, SQLITE_DROP),
+        VendorRunSQL('postgresql', POSTGRES_SCHEMA + POSTGRES_BACKFILL, POSTGRES_DROP),
+    ]
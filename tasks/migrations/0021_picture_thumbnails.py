@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0020_sync_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='picture_digest',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Хеш изображения'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='picture_digest',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Хеш изображения'),
+        ),
+    ]
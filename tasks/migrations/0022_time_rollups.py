@@ -0,0 +1,58 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0021_picture_thumbnails'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('seconds', models.BigIntegerField(verbose_name='Секунд')),
+                ('entries', models.IntegerField(verbose_name='Записей')),
+            ],
+            options={
+                'verbose_name': 'Итог учета времени за день',
+                'verbose_name_plural': 'Итоги учета времени за день',
+            },
+        ),
+        migrations.CreateModel(
+            name='TimeRollupDay',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False, verbose_name='День')),
+                ('built_at', models.DateTimeField(auto_now_add=True, verbose_name='Посчитан')),
+            ],
+            options={
+                'verbose_name': 'Посчитанный день учета времени',
+                'verbose_name_plural': 'Посчитанные дни учета времени',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timetracking',
+            index=models.Index(condition=models.Q(('end_time__isnull', True)), fields=['start_time'], name='timetrack_open_start_idx'),
+        ),
+        migrations.AddField(
+            model_name='timerollup',
+            name='task',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tasks.task', verbose_name='Задача'),
+        ),
+        migrations.AddField(
+            model_name='timerollup',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddIndex(
+            model_name='timerollup',
+            index=models.Index(fields=['day', 'task'], name='timerollup_day_task_idx'),
+        ),
+    ]
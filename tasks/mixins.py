@@ -0,0 +1,353 @@
+import threading
+from functools import update_wrapper
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.http import Http404
+from rest_framework import serializers
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotAuthenticated
+from rest_framework.response import Response
+
+from . import jobs
+from .caching import CachedResponse
+from .feed import is_asgi
+from .rows import compile_rows
+from .serializers import ExportJobSerializer
+from .signals import delete_cascade
+
+
+def serializer_query_plan(serializer, model=None, prefix=()):
+    """(поля для QuerySet.only(), связи для select_related()), которые реально читает
+    сериализатор, включая вложенные из ?expand=. связь, от которой нужен только id,
+    в select_related не попадает. None, если вывести план нельзя (source='*',
+    свойства модели, m2m и т.п.)"""
+    model = model or serializer.Meta.model
+    only = {'__'.join((*prefix, model._meta.pk.name))}
+    related = set()
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*' or isinstance(field, serializers.ListSerializer):
+            return None
+
+        current = model
+        path = list(prefix)
+        for index, attr in enumerate(field.source_attrs):
+            try:
+                model_field = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                return None
+            if model_field.many_to_many or model_field.one_to_many:
+                return None
+
+            path.append(attr)
+            only.add('__'.join(path))
+            if not model_field.is_relation:
+                break
+            current = model_field.related_model
+            if index + 1 < len(field.source_attrs):
+                related.add('__'.join(path))
+
+        if isinstance(field, serializers.BaseSerializer):
+            nested = serializer_query_plan(field, current, tuple(path))
+            if nested is None:
+                return None
+            related.add('__'.join(path))
+            only |= nested[0]
+            related |= nested[1]
+
+    return only, related
+
+
+def split_param(value):
+    return [name.strip() for name in value.split(',') if name.strip()] if value else None
+
+
+class QueryPlanMixin:
+    """вьюсет объявляет связи, которые читает его сериализатор, а миксин
+    навешивает select_related/prefetch_related. для чтения план берется из самого
+    сериализатора с учетом ?fields=, ?omit= и ?expand=: only() по прочитанным полям
+    и select_related только по связям, поля которых попали в ответ.
+    ?expand= только для вошедших: чтение задач, комментариев и учета времени открыто
+    анонимам, а раскрытие отдало бы проекты, которые /api/projects/ им не показывает"""
+
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    read_actions = ('list', 'retrieve')
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.read_actions:
+            params = self.request.query_params
+            kwargs.setdefault('fields', split_param(params.get('fields')))
+            kwargs.setdefault('omit', split_param(params.get('omit')))
+            kwargs.setdefault('expand', split_param(params.get('expand')))
+            if kwargs['expand'] and not self.request.user.is_authenticated:
+                raise NotAuthenticated("?expand= доступен только после входа")
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+
+        plan = None
+        if self.action in self.read_actions:
+            plan = serializer_query_plan(self.get_serializer())
+        # None - сериализатор может догружать поля отдельными запросами
+        self.query_plan = plan
+
+        if plan is not None:
+            only, related = plan
+            # по полям сортировки считается курсор страницы - их нельзя откладывать
+            model = qs.model
+            for name in getattr(self, 'ordering', None) or ():
+                only.add(model._meta.get_field(name.lstrip('-')).name)
+            if related:
+                qs = qs.select_related(*sorted(related))
+            qs = qs.only(*sorted(only))
+        elif self.select_related_fields:
+            qs = qs.select_related(*self.select_related_fields)
+
+        if self.prefetch_related_fields:
+            qs = qs.prefetch_related(*self.prefetch_related_fields)
+
+        return qs
+
+
+class ValuesListMixin:
+    """list строится из QuerySet.values() по скомпилированному сериализатору
+    (см. rows.py), а не через to_representation на каждую строку. если сериализатор
+    так не скомпилировать (например, ?expand=), работает обычный list"""
+
+    def values_queryset(self, plan):
+        queryset = self.filter_queryset(self.get_queryset())
+        # по полям сортировки пагинация строит курсор - они нужны в строках
+        ordering = [name.lstrip('-') for name in getattr(self, 'ordering', None) or ()]
+        return queryset.values(*plan.lookups, *[name for name in ordering if name not in plan.lookups])
+
+    def list(self, request, *args, **kwargs):
+        plan = compile_rows(self.get_serializer())
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.values_queryset(plan)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.rows(page, request))
+        return Response(plan.rows(queryset, request))
+
+    async def alist(self, request, *args, **kwargs):
+        plan = compile_rows(self.get_serializer())
+        if plan is None:
+            return await sync_to_async(super().list)(request, *args, **kwargs)
+
+        queryset = self.values_queryset(plan)
+        if self.paginator is None:
+            return Response(plan.rows([row async for row in queryset], request))
+        # курсорная пагинация DRF читает страницу синхронно - в потоке запроса,
+        # как это делает и сам async ORM
+        page = await sync_to_async(self.paginate_queryset)(queryset)
+        return self.get_paginated_response(plan.rows(page, request))
+
+
+class ExportMixin:
+    """выгрузка текущей выборки вьюсета (с теми же фильтрами, что у списка)
+    в xlsx, csv или jsonl. сама выгрузка описывается Exporter'ом"""
+
+    exporter = None
+
+    def get_export_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    @action(detail=False, methods=["GET"], url_path="export-excel")
+    def export_excel(self, request, *args, **kwargs):
+        return self.exporter.xlsx_response(self.get_export_queryset())
+
+    @action(detail=False, methods=["GET"], url_path="export-csv")
+    def export_csv(self, request, *args, **kwargs):
+        return self.exporter.csv_response(self.get_export_queryset())
+
+    @action(detail=False, methods=["GET"], url_path="export-jsonl")
+    def export_jsonl(self, request, *args, **kwargs):
+        return self.exporter.jsonl_response(self.get_export_queryset())
+
+    # под ASGI csv и jsonl читаются через aiterator и поток не держат, xlsx
+    # собирается целиком во временный файл - в потоке
+    async def aexport_excel(self, request, *args, **kwargs):
+        return await sync_to_async(self.exporter.xlsx_response)(self.get_export_queryset())
+
+    async def aexport_csv(self, request, *args, **kwargs):
+        return self.exporter.csv_response(self.get_export_queryset(), asynchronous=is_asgi(request))
+
+    async def aexport_jsonl(self, request, *args, **kwargs):
+        return self.exporter.jsonl_response(self.get_export_queryset(), asynchronous=is_asgi(request))
+
+    @action(detail=False, methods=["POST"], url_path="export-job")
+    def export_job(self, request, *args, **kwargs):
+        """та же выгрузка фоновой задачей (jobs.py): фильтры - в строке запроса, как у
+        export-*, формат - в теле. ответ 202, файл потом - с /api/jobs/<id>/result/"""
+        # у задачи есть владелец, и забрать результат может только он
+        if not request.user.is_authenticated:
+            raise NotAuthenticated()
+        params = ExportJobSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        job = jobs.submit("export", {
+            "resource": self.exporter.filename,
+            "format": params.validated_data["format"],
+            "query": dict(request.query_params.lists()),
+        }, request.user)
+        return jobs.accepted_response(job, request)
+
+
+class CascadeDeleteMixin:
+    """DELETE проекта, колонки или задачи через delete_cascade: счетчики, надгробия
+    и итоги времени обновляются один раз на все строки каскада"""
+
+    def perform_destroy(self, instance):
+        delete_cascade(type(instance).objects.filter(pk=instance.pk))
+
+
+# модели ответа по (вьюсет, ?expand=). как и планы в rows.py, кеш ограничен
+# и при переполнении просто сбрасывается
+MAX_EXPANDED_DEPENDENCIES = 1024
+
+_expanded_dependencies = {}
+_expanded_dependencies_lock = threading.Lock()
+
+
+def serializer_models(serializer):
+    """модели, поля которых попадают в ответ: Meta.model, вложенные сериализаторы
+    и связи плоских полей (column_name -> Column)"""
+    model = serializer.Meta.model
+    models = {model}
+    for field in serializer.fields.values():
+        if isinstance(field, serializers.BaseSerializer) and hasattr(field, 'Meta'):
+            models |= serializer_models(field)
+            continue
+        current = model
+        for attr in field.source_attrs[:-1]:
+            try:
+                model_field = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                break
+            if not model_field.is_relation:
+                break
+            current = model_field.related_model
+            models.add(current)
+    return models
+
+
+class CachedReadMixin:
+    """list и retrieve отдаются из кеша и поддерживают условные GET (ETag/Last-Modified).
+    cache_dependencies - модели, изменение которых меняет ответ; для ?expand= к ним
+    добавляются модели вложенных сериализаторов"""
+
+    cache_dependencies = ()
+
+    def get_cache_dependencies(self, request):
+        expand = split_param(request.query_params.get('expand'))
+        if not expand:
+            return self.cache_dependencies
+        key = (type(self), tuple(expand))
+        try:
+            return _expanded_dependencies[key]
+        except KeyError:
+            pass
+        try:
+            models = serializer_models(self.get_serializer_class()(expand=expand))
+        except serializers.ValidationError:
+            # неизвестное поле в ?expand= - ответом будет 400, его не кешируют
+            return self.cache_dependencies
+        extra = sorted(models - set(self.cache_dependencies), key=lambda model: model._meta.label)
+        dependencies = (*self.cache_dependencies, *extra)
+        with _expanded_dependencies_lock:
+            if len(_expanded_dependencies) >= MAX_EXPANDED_DEPENDENCIES:
+                _expanded_dependencies.clear()
+            _expanded_dependencies[key] = dependencies
+        return dependencies
+
+    def cached_response(self, request, render):
+        return CachedResponse(request, self.get_cache_dependencies(request), self.__class__.__name__).respond(render)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedReadMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedReadMixin, self).retrieve(request, *args, **kwargs))
+
+    async def acached_response(self, request, render):
+        cached = await CachedResponse.acreate(request, self.get_cache_dependencies(request), self.__class__.__name__)
+        return await cached.arespond(render)
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.acached_response(request, lambda: super(CachedReadMixin, self).alist(request, *args, **kwargs))
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self.acached_response(request, lambda: super(CachedReadMixin, self).aretrieve(request, *args, **kwargs))
+
+
+class AsyncViewSetMixin:
+    """при ASYNC_API (по умолчанию выключен, см. settings) view вьюсета - корутина.
+    действие, у которого есть корутина a<действие> (alist, aretrieve, aget_stats...),
+    выполняется в event loop, остальные (запись и т.п.) - обычным DRF через
+    sync_to_async. без ASYNC_API - обычный sync view"""
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if not settings.ASYNC_API:
+            return view
+        sync_view = sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            if 'get' in actions and 'head' not in actions:
+                actions['head'] = actions['get']
+            handler = getattr(cls, f"a{actions.get(request.method.lower())}", None)
+            # Basic-авторизация проверяет пароль синхронным запросом - обычным путем
+            if not iscoroutinefunction(handler) or 'HTTP_AUTHORIZATION' in request.META:
+                return await sync_view(request, *args, **kwargs)
+
+            self = cls(**initkwargs)
+            self.action_map = actions
+            for method, name in actions.items():
+                setattr(self, method, getattr(self, name))
+            self.request = request
+            self.args = args
+            self.kwargs = kwargs
+            return await self.adispatch(request, *args, **kwargs)
+
+        return update_wrapper(async_view, view)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """APIView.dispatch для корутин"""
+        # SessionAuthentication DRF читает request.user синхронно - загружаем заранее
+        request.user = await request.auser()
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            self.initial(request, *args, **kwargs)
+            response = await getattr(self, f"a{self.action}")(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            # то же сообщение, что у get_object_or_404
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def aretrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(await self.aget_object())
+        if getattr(self, 'query_plan', None) is None:
+            return Response(await sync_to_async(lambda: serializer.data)())
+        # only()/select_related уже по всем полям сериализатора - без запросов
+        return Response(serializer.data)
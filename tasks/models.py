@@ -1,11 +1,100 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings 
 from django.dispatch import receiver 
 from django.db.models.signals import post_save
 from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
+from django.utils.functional import cached_property
 import pyotp
 
-class Project(models.Model):
+class SyncState(models.Model):
+    """одна строка: последний выданный номер изменения (version, только на SQLite) и номер,
+    до которого надгробия уже вычищены (horizon) - клиенты старше него качают все заново"""
+    version = models.BigIntegerField(default=0)
+    horizon = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Состояние синхронизации"
+        verbose_name_plural = "Состояние синхронизации"
+
+
+# на PostgreSQL номер изменения - id пишущей транзакции плюс это смещение: номера
+# со счетчика SyncState (до перехода на id транзакций) заведомо меньше
+XID_VERSION_BASE = 1 << 40
+
+
+def next_version():
+    """номер изменения для строк, которые пишет текущая транзакция. вызывать внутри
+    той же транзакции, что и запись: номер годится для ?since=, только пока она не закоммичена.
+
+    на PostgreSQL это id транзакции (pg_current_xact_id): ни одной общей строки, пишущие
+    транзакции друг друга не ждут. номера раздаются в порядке начала, а не коммита, поэтому
+    клиенту отдается только committed_version() - номер, ниже которого незавершенных нет.
+    на SQLite запись и так идет по одной, там остается счетчик в SyncState"""
+    connection = transaction.get_connection()
+    if connection.vendor == 'postgresql':
+        if not connection.in_atomic_block:
+            raise transaction.TransactionManagementError("next_version() вызван вне транзакции записи")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_current_xact_id()::text::bigint")
+            return cursor.fetchone()[0] + XID_VERSION_BASE
+
+    table = SyncState._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"UPDATE {table} SET version = version + 1 WHERE id = 1 RETURNING version")
+        row = cursor.fetchone()
+        if row is None:
+            SyncState.objects.get_or_create(pk=1)
+            cursor.execute(f"UPDATE {table} SET version = version + 1 WHERE id = 1 RETURNING version")
+            row = cursor.fetchone()
+    return row[0]
+
+
+def committed_version():
+    """номер, до которого (включительно) все изменения уже закоммичены или откачены.
+    на PostgreSQL - перед самой старой незавершенной транзакцией: долгая пишущая
+    транзакция задерживает его, но строка, закоммиченная позже, не потеряется"""
+    connection = transaction.get_connection()
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+            return cursor.fetchone()[0] - 1 + XID_VERSION_BASE
+    return SyncState.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+
+class VersionedModel(models.Model):
+    """каждое сохранение получает новый номер изменения для /api/sync/.
+    запись мимо save() (update(), bulk_*) должна проставлять version сама"""
+    version = models.BigIntegerField("Версия изменения", default=0, db_index=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version'}
+        with transaction.atomic():
+            self.version = next_version()
+            super().save(*args, **kwargs)
+
+
+class Tombstone(models.Model):
+    """след удаленной строки, чтобы /api/sync/ мог сообщить клиенту об удалении"""
+    model = models.CharField("Модель", max_length=32)
+    object_id = models.BigIntegerField("ID объекта")
+    version = models.BigIntegerField("Версия изменения", db_index=True)
+    deleted_at = models.DateTimeField("Дата удаления", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Удаленный объект"
+        verbose_name_plural = "Удаленные объекты"
+
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
+
+
+class Project(VersionedModel):
     name = models.CharField("Название", max_length=255)
     description = models.TextField("Описание", blank=True)
     created_at = models.DateTimeField("Дата создания", auto_now_add=True)
@@ -18,7 +107,7 @@ class Project(models.Model):
     def __str__(self):
         return self.name
 
-class Column(models.Model):
+class Column(VersionedModel):
     name = models.CharField("Название колонки", max_length=100)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, verbose_name="Проект")
     order = models.IntegerField("Порядок", default=0)
@@ -31,7 +120,7 @@ class Column(models.Model):
     def __str__(self):
         return f"{self.project.name} - {self.name}"
 
-class Task(models.Model):
+class Task(VersionedModel):
     PRIORITY_CHOICES = [
         ('low', 'Низкий'),
         ('medium', 'Средний'),
@@ -51,8 +140,10 @@ class Task(models.Model):
     priority = models.CharField("Приоритет", max_length=10, choices=PRIORITY_CHOICES, default='medium')
     status = models.CharField("Статус", max_length=15, choices=STATUS_CHOICES, default='todo')
     due_date = models.DateField("Срок выполнения", null=True, blank=True)
+    position = models.IntegerField("Позиция в колонке", default=0)
     created_at = models.DateTimeField("Дата создания", auto_now_add=True)
     picture = models.ImageField("Изображение", null=True, upload_to="tasks")
+    picture_digest = models.CharField("Хеш изображения", max_length=64, blank=True, default="", editable=False)
     creator = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, verbose_name="Создатель", null=True, blank=True, related_name='created_tasks')
     assignee = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, verbose_name="Исполнитель", null=True, blank=True, related_name='assigned_tasks')
 
@@ -60,19 +151,28 @@ class Task(models.Model):
         verbose_name = "Задача"
         verbose_name_plural = "Задачи"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['column', '-created_at'], name='task_column_created_idx'),
+            models.Index(fields=['status', 'due_date'], name='task_status_due_idx'),
+            models.Index(fields=['column', 'position'], name='task_column_position_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
-class Comment(models.Model):
+class Comment(VersionedModel):
     task = models.ForeignKey(Task, on_delete=models.CASCADE, verbose_name="Задача")
     text = models.TextField("Текст комментария")
     created_at = models.DateTimeField("Дата создания", auto_now_add=True)
     picture = models.ImageField("Изображение", null=True, upload_to="tasks")
+    picture_digest = models.CharField("Хеш изображения", max_length=64, blank=True, default="", editable=False)
     class Meta:
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['task', 'created_at'], name='comment_task_created_idx'),
+        ]
 
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Автор", related_name="comments",null=True, blank=True)
@@ -80,7 +180,7 @@ class Comment(models.Model):
     def __str__(self):
         return f"Комментарий к задаче {self.task.title}"
 
-class TimeTracking(models.Model):
+class TimeTracking(VersionedModel):
     task = models.ForeignKey(Task, on_delete=models.CASCADE, verbose_name="Задача")
     start_time = models.DateTimeField("Время начала")
     end_time = models.DateTimeField("Время окончания", null=True, blank=True)
@@ -89,12 +189,133 @@ class TimeTracking(models.Model):
     class Meta:
         verbose_name = "Учет времени"
         verbose_name_plural = "Учет времени"
+        indexes = [
+            models.Index(fields=['user', '-start_time'], name='timetrack_user_start_idx'),
+            models.Index(fields=['task', '-start_time'], name='timetrack_task_start_idx'),
+            # незакрытые записи отчет считает вживую - их мало, индекс маленький
+            models.Index(fields=['start_time'], condition=models.Q(end_time__isnull=True), name='timetrack_open_start_idx'),
+        ]
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Пользователь", related_name="time_trackings", null=True, blank=True)
 
     def __str__(self):
         return f"Время по задаче {self.task.title}"
+
+
+class TimeRollup(models.Model):
+    """дневной итог закрытых записей учета времени: (день начала, задача, пользователь).
+    строится лениво отчетом /api/timetracking/report/ для прошедших дней, см. timereport.py"""
+    day = models.DateField("День")
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, verbose_name="Задача", related_name="+")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Пользователь", related_name="+", null=True)
+    seconds = models.BigIntegerField("Секунд")
+    entries = models.IntegerField("Записей")
+
+    class Meta:
+        verbose_name = "Итог учета времени за день"
+        verbose_name_plural = "Итоги учета времени за день"
+        indexes = [
+            models.Index(fields=['day', 'task'], name='timerollup_day_task_idx'),
+        ]
+
+
+class TimeRollupDay(models.Model):
+    """день, для которого итоги TimeRollup уже посчитаны"""
+    day = models.DateField("День", primary_key=True)
+    built_at = models.DateTimeField("Посчитан", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Посчитанный день учета времени"
+        verbose_name_plural = "Посчитанные дни учета времени"
     
+class ProjectStats(models.Model):
+    """денормализованные счетчики проекта. обновляются сигналами через F(),
+    пересобираются командой rebuild_project_stats"""
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, primary_key=True, related_name="stats", verbose_name="Проект")
+    column_count = models.IntegerField("Колонок", default=0)
+    task_count = models.IntegerField("Задач", default=0)
+    status_todo = models.IntegerField("К выполнению", default=0)
+    status_in_progress = models.IntegerField("В работе", default=0)
+    status_review = models.IntegerField("На проверке", default=0)
+    status_done = models.IntegerField("Выполнено", default=0)
+    priority_low = models.IntegerField("Низкий приоритет", default=0)
+    priority_medium = models.IntegerField("Средний приоритет", default=0)
+    priority_high = models.IntegerField("Высокий приоритет", default=0)
+    comment_count = models.IntegerField("Комментариев", default=0)
+    time_entry_count = models.IntegerField("Записей учета времени", default=0)
+    open_time_entries = models.IntegerField("Незакрытых записей", default=0)
+    tracked_seconds = models.BigIntegerField("Учтено секунд", default=0)
+
+    class Meta:
+        verbose_name = "Статистика проекта"
+        verbose_name_plural = "Статистика проектов"
+
+    def __str__(self):
+        return f"Статистика {self.project_id}"
+
+
+class JobStorage(FileSystemStorage):
+    """каталог - JOB_RESULTS_ROOT, а не MEDIA_ROOT: /media/ отдается всем без проверки прав.
+    как и MEDIA_ROOT у обычного хранилища, настройка перечитывается при ее смене"""
+
+    @cached_property
+    def base_location(self):
+        return settings.JOB_RESULTS_ROOT
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == "JOB_RESULTS_ROOT":
+            self.__dict__.pop("base_location", None)
+            self.__dict__.pop("location", None)
+
+
+JOB_STORAGE = JobStorage()
+
+
+def job_storage():
+    return JOB_STORAGE
+
+
+def job_result_path(instance, filename):
+    return f"{instance.pk}/{filename}"
+
+
+class Job(models.Model):
+    """фоновая задача (выгрузка, отчет, превью) в очереди на таблице. берет и выполняет
+    команда run_jobs, см. jobs.py"""
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'В очереди'
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Готово'
+        FAILED = 'failed', 'Ошибка'
+
+    kind = models.CharField("Тип", max_length=32)
+    params = models.JSONField("Параметры", default=dict)
+    status = models.CharField("Статус", max_length=16, choices=Status, default=Status.QUEUED)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Пользователь", related_name="+", null=True, blank=True)
+    created_at = models.DateTimeField("Создана", auto_now_add=True)
+    started_at = models.DateTimeField("Начата", null=True, blank=True)
+    finished_at = models.DateTimeField("Завершена", null=True, blank=True)
+    expires_at = models.DateTimeField("Хранится до", null=True, blank=True)
+    locked_until = models.DateTimeField("Занята воркером до", null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    worker = models.CharField("Воркер", max_length=255, blank=True)
+    result = models.FileField("Результат", upload_to=job_result_path, storage=job_storage, null=True, blank=True)
+    summary = models.JSONField("Итог", default=dict, blank=True)
+    error = models.TextField("Ошибка", blank=True)
+
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_status_created_idx'),
+            models.Index(fields=['user', '-created_at'], name='job_user_created_idx'),
+            models.Index(fields=['expires_at'], name='job_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.pk}"
+
 class TimestampModel(models.Model):
     created_at = models.DateTimeField(auto_created=True, auto_now_add=True,null=True)
     class Meta:
@@ -0,0 +1,97 @@
+"""разреженная (gap-based) сортировка колонок и задач.
+
+порядковые номера идут с шагом GAP, поэтому перетаскивание элемента - это
+UPDATE одной строки со значением посередине между соседями. когда между
+соседями места не осталось, перенумеровываются только элементы этого же
+списка (колонки одного проекта или задачи одной колонки)"""
+from django.db import transaction
+from django.db.models import Max, Q
+from rest_framework import serializers
+
+from .caching import bump_version_on_commit
+from .models import Project, Task, next_version
+
+GAP = 1024
+
+
+def renumber(siblings, field):
+    items = list(siblings.order_by(field, 'id'))
+    version = next_version()
+    for index, item in enumerate(items, start=1):
+        setattr(item, field, index * GAP)
+        item.version = version
+    siblings.model.objects.bulk_update(items, [field, 'version'], batch_size=500)
+
+
+def neighbours(siblings, field, after):
+    """значения поля у соседей, между которыми встает элемент"""
+    if after is None:
+        following = siblings.order_by(field, 'id').first()
+        return None, getattr(following, field, None)
+
+    prev_value = getattr(after, field)
+    following = siblings.filter(
+        Q(**{f"{field}__gt": prev_value}) | Q(**{field: prev_value, "id__gt": after.id})
+    ).order_by(field, 'id').first()
+    return prev_value, getattr(following, field, None)
+
+
+def free_slot(siblings, field, after):
+    """номер между соседями или None, если места нет"""
+    prev_value, next_value = neighbours(siblings, field, after)
+    if prev_value is None and next_value is None:
+        return GAP
+    if prev_value is None:
+        return next_value - GAP
+    if next_value is None:
+        return prev_value + GAP
+    if next_value - prev_value < 2:
+        return None
+    return (prev_value + next_value) // 2
+
+
+def move_anchor(siblings, after_id):
+    """элемент, после которого встанет перемещаемый (None - в начало списка)"""
+    if after_id is None:
+        return None
+    after = siblings.filter(pk=after_id).first()
+    if after is None:
+        raise serializers.ValidationError({"after": "элемент не найден в этом списке"})
+    return after
+
+
+def move(instance, field, siblings, after, project_id, **changes):
+    """ставит instance в siblings сразу после after (None - в начало).
+    блокируется только строка проекта, так что перемещения на разных досках не ждут друг друга"""
+    model = type(instance)
+    with transaction.atomic():
+        Project.objects.select_for_update().filter(pk=project_id).first()
+
+        siblings = siblings.exclude(pk=instance.pk)
+        if after is not None:
+            after = siblings.get(pk=after.pk)
+
+        value = free_slot(siblings, field, after)
+        renumbered = value is None
+        if renumbered:
+            renumber(siblings, field)
+            if after is not None:
+                after.refresh_from_db(fields=[field])
+            value = free_slot(siblings, field, after)
+
+        changes['version'] = next_version()
+        model.objects.filter(pk=instance.pk).update(**{field: value}, **changes)
+        bump_version_on_commit(model)
+
+    for name, change in {field: value, **changes}.items():
+        setattr(instance, name, change)
+    return renumbered
+
+
+def next_positions(column_ids):
+    """позиция для новой задачи в конце каждой колонки - один GROUP BY на все колонки"""
+    last = dict(
+        Task.objects.filter(column_id__in=column_ids).values('column_id')
+        .annotate(last=Max('position')).values_list('column_id', 'last')
+    )
+    return {column_id: (last.get(column_id) or 0) + GAP for column_id in column_ids}
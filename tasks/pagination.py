@@ -0,0 +1,22 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """курсорная пагинация. позиция страницы берется из ordering вьюсета, поэтому N-ая
+    страница стоит столько же, сколько первая. DRF кладет в курсор только первое поле
+    ordering, а среди строк с одинаковым значением листает OFFSET'ом (и не дальше
+    offset_cutoff) - так что первым должно идти уникальное или почти уникальное поле"""
+
+    ordering = ('-created_at', 'id')
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'ordering', None) or self.ordering
+        if isinstance(ordering, str):
+            return (ordering,)
+        return tuple(ordering)
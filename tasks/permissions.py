@@ -1,21 +1,52 @@
+"""вторая ступень хранится не в сессии, а в подписанной куке: проверка - это
+разбор подписи без похода в хранилище сессий. кука привязана к пользователю и
+ключу сессии, так что после выхода или в чужом браузере она бесполезна"""
+from django.conf import settings
+from django.core import signing
 from django.utils import timezone
 from rest_framework.permissions import BasePermission
 
-class SecondFactorPermission(BasePermission):
-    def has_permission(self, request, view):
-        if not request.user.is_authenticated:
-            return False
+SECOND_FACTOR_SALT = 'tasks.second-factor'
+
+
+def grant_second_factor(request, response):
+    """ставит куку второй ступени на SECOND_FACTOR_TTL секунд, возвращает время истечения"""
+    expire = int(timezone.now().timestamp()) + settings.SECOND_FACTOR_TTL
+    token = signing.dumps(
+        {"user": request.user.pk, "session": request.session.session_key, "expire": expire},
+        salt=SECOND_FACTOR_SALT,
+    )
+    response.set_cookie(
+        settings.SECOND_FACTOR_COOKIE, token,
+        max_age=settings.SECOND_FACTOR_TTL, httponly=True, samesite='Lax', secure=request.is_secure(),
+    )
+    return expire
+
 
-        second = request.session.get('second')
-        expire = request.session.get('second_expire')
+def revoke_second_factor(response):
+    response.delete_cookie(settings.SECOND_FACTOR_COOKIE, samesite='Lax')
 
-        if not second or not expire:
-            return False
 
-        if timezone.now().timestamp() > expire:
-            
-            request.session.pop('second', None)
-            request.session.pop('second_expire', None)
-            return False
+def second_factor_expire(request):
+    """время истечения второй ступени или None, если ее нет или она истекла"""
+    if not request.user.is_authenticated:
+        return None
 
-        return True
\ No newline at end of file
+    token = request.COOKIES.get(settings.SECOND_FACTOR_COOKIE)
+    if not token:
+        return None
+    try:
+        grant = signing.loads(token, salt=SECOND_FACTOR_SALT, max_age=settings.SECOND_FACTOR_TTL)
+    except signing.BadSignature:
+        return None
+
+    if grant.get("user") != request.user.pk or grant.get("session") != request.session.session_key:
+        return None
+    if timezone.now().timestamp() > grant.get("expire", 0):
+        return None
+    return grant["expire"]
+
+
+class SecondFactorPermission(BasePermission):
+    def has_permission(self, request, view):
+        return second_factor_expire(request) is not None
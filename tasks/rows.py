@@ -0,0 +1,185 @@
+"""быстрый путь для списков: строки из QuerySet.values() превращаются в словари
+ответа без DRF-сериализатора.
+
+профиль /api/tasks/ показывает, что основное время уходит не в БД, а в
+to_representation каждого поля каждой строки: get_attribute по цепочке
+source, проверки на None, PKOnlyObject и т.п. compile_rows один раз разбирает
+сериализатор (с учетом ?fields=/?omit=) в список шагов: ключ ответа, поле
+values() и преобразование. дальше на строку - только чтение словаря.
+
+формат тот же, что у сериализатора, включая его особенности: плоское поле через
+пустую связь (creator.username без создателя) пропадает из ответа, если у него нет
+allow_null. то, что так не выразить (вложенные сериализаторы из ?expand=,
+SerializerMethodField, свои форматы дат, свой to_representation), не компилируется -
+compile_rows вернет None, и список отдаст обычный сериализатор"""
+import threading
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from rest_framework import fields as drf_fields, relations, serializers
+from rest_framework.fields import empty
+from rest_framework.settings import ISO_8601, api_settings
+
+from .serializers import ThumbnailsField
+from .thumbnails import variant_names
+
+SKIP = object()
+
+# планы по (класс, ?fields=, ?omit=, ?expand=). перестановок полей много, поэтому
+# кеш ограничен и при переполнении просто сбрасывается
+MAX_PLANS = 1024
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def iso_datetime(value, tz=None):
+    """как DateTimeField DRF: в текущей зоне (или tz), UTC пишется как Z"""
+    if not value:
+        return None
+    value = timezone.localtime(value, tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def iso_date(value):
+    return value.isoformat() if value else None
+
+
+def media_url(request, name):
+    if not name:
+        return None
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def thumbnails(request, digest):
+    if not digest:
+        return None
+    return {
+        size: {fmt: media_url(request, name) for fmt, name in formats.items()}
+        for size, formats in variant_names(digest).items()
+    }
+
+
+class RowPlan:
+    """скомпилированный сериализатор: lookups - поля для values(), rows() - ответ по строкам.
+    шаг - (ключ ответа, поле values(), преобразование, поля пустых связей по дороге, allow_null)"""
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.lookups = sorted({lookup for _, lookup, _, guards, _ in steps for lookup in (lookup, *guards)})
+
+    def row(self, row, request, tz):
+        data = {}
+        for key, lookup, convert, guards, nullable in self.steps:
+            if guards and None in [row[guard] for guard in guards]:
+                # связь по дороге пустая: как в Field.get_attribute - None или поля нет
+                if nullable:
+                    data[key] = None
+                continue
+            value = row[lookup]
+            if convert is not None and value is not None:
+                value = convert(value, request, tz)
+            data[key] = value
+        return data
+
+    def rows(self, rows, request):
+        # зона одна на весь ответ, а не timezone.localtime() с поиском текущей зоны на каждую дату
+        tz = timezone.get_current_timezone()
+        return [self.row(row, request, tz) for row in rows]
+
+
+def converter(field):
+    """функция (значение, request, зона) для поля сериализатора; None - значение как есть;
+    SKIP - поле так не отдать"""
+    if isinstance(field, serializers.BaseSerializer) or isinstance(field, relations.ManyRelatedField):
+        return SKIP
+    if isinstance(field, ThumbnailsField):
+        return lambda digest, request, tz: thumbnails(request, digest)
+    if isinstance(field, drf_fields.DateTimeField):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        if output_format is None or output_format.lower() != ISO_8601 or getattr(field, 'timezone', None) is not None:
+            return SKIP
+        return lambda value, request, tz: iso_datetime(value, tz)
+    if isinstance(field, drf_fields.DateField):
+        output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+        if output_format is None or output_format.lower() != ISO_8601:
+            return SKIP
+        return lambda value, request, tz: iso_date(value)
+    if isinstance(field, drf_fields.FileField):
+        if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+            return lambda value, request, tz: value or None
+        return lambda value, request, tz: media_url(request, value)
+    if isinstance(field, relations.PrimaryKeyRelatedField):
+        return SKIP if field.pk_field is not None else None
+    if isinstance(field, drf_fields.ChoiceField):
+        # строковые choices отдаются как есть
+        return None if all(isinstance(key, str) for key in field.choices) else SKIP
+    if type(field) in (drf_fields.CharField, drf_fields.EmailField, drf_fields.IntegerField,
+                       drf_fields.BooleanField, drf_fields.ReadOnlyField):
+        return None
+    return SKIP
+
+
+def compile_steps(serializer):
+    model = serializer.Meta.model
+    steps = []
+
+    for key, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if field.source == '*' or field.default is not empty:
+            return None
+        convert = converter(field)
+        if convert is SKIP:
+            return None
+
+        current = model
+        path = []
+        guards = []
+        for index, attr in enumerate(field.source_attrs):
+            try:
+                model_field = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                return None
+            if model_field.many_to_many or model_field.one_to_many or not model_field.concrete:
+                return None
+            path.append(attr)
+            last = index + 1 == len(field.source_attrs)
+            if model_field.is_relation and not last:
+                if model_field.null:
+                    guards.append('__'.join(path))
+                current = model_field.related_model
+            elif not last:
+                return None
+            elif model_field.is_relation and not isinstance(field, relations.PrimaryKeyRelatedField):
+                return None
+
+        steps.append((key, '__'.join(path), convert, tuple(guards), field.allow_null))
+
+    return RowPlan(steps)
+
+
+def compile_rows(serializer):
+    """RowPlan для сериализатора (уже с ?fields=/?omit=/?expand=) или None"""
+    if type(serializer).to_representation is not serializers.ModelSerializer.to_representation:
+        return None
+    key = (
+        type(serializer),
+        tuple(getattr(serializer, 'requested_fields', None) or ()),
+        tuple(getattr(serializer, 'omitted_fields', None) or ()),
+        tuple(getattr(serializer, 'expanded_fields', None) or ()),
+    )
+    try:
+        return _plans[key]
+    except KeyError:
+        pass
+    plan = compile_steps(serializer)
+    with _plans_lock:
+        if len(_plans) >= MAX_PLANS:
+            _plans.clear()
+        _plans[key] = plan
+    return plan
@@ -0,0 +1,252 @@
+"""полнотекстовый поиск по задачам (title/description) и комментариям (text).
+
+индекс - отдельная таблица tasks_search, которую держат в актуальном
+состоянии триггеры БД (поэтому bulk_create/update() тоже индексируются):
+на SQLite это виртуальная таблица FTS5, на PostgreSQL - обычная таблица
+с tsvector-колонкой и GIN-индексом. rowid/id строки индекса: id*2 для
+задачи и id*2+1 для комментария, так что обновление и удаление идут по ключу.
+
+миграция 0019 держит свою копию этого SQL: правки здесь ее не меняют,
+для существующих баз нужна новая миграция"""
+import html
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+from .models import Task
+
+START, STOP = "\x02", "\x03"
+
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS tasks_search USING fts5(
+        kind UNINDEXED, object_id UNINDEXED, task_id UNINDEXED, title, body,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_search_task_ai AFTER INSERT ON tasks_task BEGIN
+        INSERT INTO tasks_search (rowid, kind, object_id, task_id, title, body)
+        VALUES (new.id * 2, 'task', new.id, new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_search_task_au AFTER UPDATE OF title, description ON tasks_task BEGIN
+        DELETE FROM tasks_search WHERE rowid = old.id * 2;
+        INSERT INTO tasks_search (rowid, kind, object_id, task_id, title, body)
+        VALUES (new.id * 2, 'task', new.id, new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_search_task_ad AFTER DELETE ON tasks_task BEGIN
+        DELETE FROM tasks_search WHERE rowid = old.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_search_comment_ai AFTER INSERT ON tasks_comment BEGIN
+        INSERT INTO tasks_search (rowid, kind, object_id, task_id, title, body)
+        VALUES (new.id * 2 + 1, 'comment', new.id, new.task_id, '', new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_search_comment_au AFTER UPDATE OF text, task_id ON tasks_comment BEGIN
+        DELETE FROM tasks_search WHERE rowid = old.id * 2 + 1;
+        INSERT INTO tasks_search (rowid, kind, object_id, task_id, title, body)
+        VALUES (new.id * 2 + 1, 'comment', new.id, new.task_id, '', new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_search_comment_ad AFTER DELETE ON tasks_comment BEGIN
+        DELETE FROM tasks_search WHERE rowid = old.id * 2 + 1;
+    END
+    """,
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS tasks_search_task_ai",
+    "DROP TRIGGER IF EXISTS tasks_search_task_au",
+    "DROP TRIGGER IF EXISTS tasks_search_task_ad",
+    "DROP TRIGGER IF EXISTS tasks_search_comment_ai",
+    "DROP TRIGGER IF EXISTS tasks_search_comment_au",
+    "DROP TRIGGER IF EXISTS tasks_search_comment_ad",
+    "DROP TABLE IF EXISTS tasks_search",
+]
+
+POSTGRES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS tasks_search (
+        id bigint PRIMARY KEY,
+        kind varchar(10) NOT NULL,
+        object_id bigint NOT NULL,
+        task_id bigint NOT NULL,
+        title text NOT NULL DEFAULT '',
+        body text NOT NULL DEFAULT '',
+        document tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')
+        ) STORED
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS tasks_search_document_idx ON tasks_search USING GIN (document)",
+    """
+    CREATE OR REPLACE FUNCTION tasks_search_task_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM tasks_search WHERE id = OLD.id * 2;
+            RETURN OLD;
+        END IF;
+        INSERT INTO tasks_search (id, kind, object_id, task_id, title, body)
+        VALUES (NEW.id * 2, 'task', NEW.id, NEW.id, NEW.title, NEW.description)
+        ON CONFLICT (id) DO UPDATE SET title = EXCLUDED.title, body = EXCLUDED.body;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION tasks_search_comment_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM tasks_search WHERE id = OLD.id * 2 + 1;
+            RETURN OLD;
+        END IF;
+        INSERT INTO tasks_search (id, kind, object_id, task_id, title, body)
+        VALUES (NEW.id * 2 + 1, 'comment', NEW.id, NEW.task_id, '', NEW.text)
+        ON CONFLICT (id) DO UPDATE SET task_id = EXCLUDED.task_id, body = EXCLUDED.body;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS tasks_search_task ON tasks_task",
+    """
+    CREATE TRIGGER tasks_search_task AFTER INSERT OR UPDATE OF title, description OR DELETE ON tasks_task
+    FOR EACH ROW EXECUTE FUNCTION tasks_search_task_sync()
+    """,
+    "DROP TRIGGER IF EXISTS tasks_search_comment ON tasks_comment",
+    """
+    CREATE TRIGGER tasks_search_comment AFTER INSERT OR UPDATE OF text, task_id OR DELETE ON tasks_comment
+    FOR EACH ROW EXECUTE FUNCTION tasks_search_comment_sync()
+    """,
+]
+
+POSTGRES_DROP = [
+    "DROP TRIGGER IF EXISTS tasks_search_task ON tasks_task",
+    "DROP TRIGGER IF EXISTS tasks_search_comment ON tasks_comment",
+    "DROP FUNCTION IF EXISTS tasks_search_task_sync()",
+    "DROP FUNCTION IF EXISTS tasks_search_comment_sync()",
+    "DROP TABLE IF EXISTS tasks_search",
+]
+
+BACKFILL = [
+    """
+    INSERT INTO tasks_search ({key}, kind, object_id, task_id, title, body)
+    SELECT id * 2, 'task', id, id, title, description FROM tasks_task
+    """,
+    """
+    INSERT INTO tasks_search ({key}, kind, object_id, task_id, title, body)
+    SELECT id * 2 + 1, 'comment', id, task_id, '', text FROM tasks_comment
+    """,
+]
+
+
+def install_search_schema(conn=connection, backfill=True):
+    """создает индекс и триггеры (повторный вызов ничего не ломает) и заполняет индекс"""
+    if conn.vendor == 'sqlite':
+        statements, key = SQLITE_SCHEMA, 'rowid'
+    elif conn.vendor == 'postgresql':
+        statements, key = POSTGRES_SCHEMA, 'id'
+    else:
+        return
+
+    with conn.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+        if backfill:
+            cursor.execute("DELETE FROM tasks_search")
+            for sql in BACKFILL:
+                cursor.execute(sql.format(key=key))
+
+
+def uninstall_search_schema(conn=connection):
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(conn.vendor, [])
+    with conn.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def query_terms(query):
+    """слова запроса без операторов движка: все слова обязательны, последнее - по префиксу"""
+    return re.findall(r"\w+", query.lower())
+
+
+def sqlite_search(terms, kind, project_id, limit):
+    match = " ".join(f'"{term}"' for term in terms) + "*"
+    sql = f"""
+        SELECT kind, object_id, task_id, -bm25(tasks_search, 0, 0, 0, 10.0, 1.0) AS score,
+               highlight(tasks_search, 3, char(2), char(3)),
+               snippet(tasks_search, 4, char(2), char(3), '…', 24)
+        FROM tasks_search
+        WHERE tasks_search MATCH %s
+        {"AND kind = %s" if kind else ""}
+        {"AND task_id IN (SELECT t.id FROM tasks_task t JOIN tasks_column c ON c.id = t.column_id WHERE c.project_id = %s)" if project_id else ""}
+        ORDER BY bm25(tasks_search, 0, 0, 0, 10.0, 1.0)
+        LIMIT %s
+    """
+    params = [match] + ([kind] if kind else []) + ([project_id] if project_id else []) + [limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def postgres_search(terms, kind, project_id, limit):
+    tsquery = " & ".join(terms) + ":*"
+    # ts_headline дорогой, поэтому считаем его только для уже отобранных limit строк
+    sql = f"""
+        SELECT kind, object_id, task_id, score,
+               ts_headline('simple', title, q, 'HighlightAll=true, StartSel=' || chr(2) || ', StopSel=' || chr(3)),
+               ts_headline('simple', body, q, 'MaxWords=30, MinWords=10, StartSel=' || chr(2) || ', StopSel=' || chr(3))
+        FROM (
+            SELECT s.kind, s.object_id, s.task_id, s.title, s.body, q, ts_rank_cd(s.document, q) AS score
+            FROM tasks_search s, to_tsquery('simple', %s) q
+            WHERE s.document @@ q
+            {"AND s.kind = %s" if kind else ""}
+            {"AND s.task_id IN (SELECT t.id FROM tasks_task t JOIN tasks_column c ON c.id = t.column_id WHERE c.project_id = %s)" if project_id else ""}
+            ORDER BY score DESC
+            LIMIT %s
+        ) hits
+        ORDER BY score DESC
+    """
+    params = [tsquery] + ([kind] if kind else []) + ([project_id] if project_id else []) + [limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def mark(text):
+    """экранируем текст и только потом превращаем служебные символы в <mark>"""
+    return html.escape(text or "").replace(START, "<mark>").replace(STOP, "</mark>")
+
+
+def search(query, kind=None, project_id=None, limit=20):
+    terms = query_terms(query)
+    if not terms:
+        return []
+
+    backends = {'sqlite': sqlite_search, 'postgresql': postgres_search}
+    if connection.vendor not in backends:
+        raise ImproperlyConfigured(f"полнотекстовый поиск есть только для SQLite и PostgreSQL, а не {connection.vendor}")
+    backend = backends[connection.vendor]
+    rows = backend(terms, kind, project_id, limit)
+
+    titles = dict(Task.objects.filter(pk__in={row[2] for row in rows}).values_list('id', 'title'))
+    return [
+        {
+            "kind": kind,
+            "id": object_id,
+            "task_id": task_id,
+            "task_title": titles.get(task_id, ""),
+            "score": round(float(score), 6),
+            "title": mark(title),
+            "snippet": mark(snippet),
+        }
+        for kind, object_id, task_id, score, title, snippet in rows
+    ]
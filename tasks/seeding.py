@@ -0,0 +1,115 @@
+"""генерация строк для generate_data. здесь нет Django - функции выполняются
+в пуле процессов и возвращают кортежи, а в БД их пишет основной процесс.
+
+Faker медленный, поэтому тексты генерируются заранее пулами (text_pool_part),
+а строки собираются случайным выбором из пулов. у каждого куска свой
+генератор случайных чисел, засеянный (seed, этап, номер куска), так что при
+одном --seed результат не зависит от числа воркеров"""
+import random
+from datetime import timedelta
+
+from faker import Faker
+
+LOCALE = 'ru_RU'
+
+POOL_SIZES = {
+    "titles": 5000,
+    "descriptions": 2000,
+    "comments": 3000,
+    "worklog": 1000,
+}
+POOL_PART = 500
+
+PRIORITIES = ('low', 'medium', 'high')
+STATUSES = ('todo', 'in_progress', 'review', 'done')
+YEAR_SECONDS = 365 * 24 * 3600
+
+_context = {}
+
+
+def init_worker(context):
+    """context: seed, now, пулы текстов, id колонок и пользователей"""
+    _context.clear()
+    _context.update(context)
+
+
+def chunk_random(seed, stage, index):
+    if seed is None:
+        return random.Random()
+    return random.Random(f"{seed}:{stage}:{index}")
+
+
+def text_pool_jobs(seed):
+    jobs = []
+    for kind, size in POOL_SIZES.items():
+        for start in range(0, size, POOL_PART):
+            jobs.append((kind, min(POOL_PART, size - start), seed, start))
+    return jobs
+
+
+def text_pool_part(job):
+    kind, count, seed, start = job
+    fake = Faker([LOCALE])
+    rnd = chunk_random(seed, kind, start)
+    fake.seed_instance(rnd.random())
+
+    if kind == "titles":
+        return kind, [fake.sentence(nb_words=6) for _ in range(count)]
+    lengths = {"descriptions": (100, 1000), "comments": (50, 500), "worklog": (50, 200)}[kind]
+    return kind, [fake.text(max_nb_chars=rnd.randint(*lengths)) for _ in range(count)]
+
+
+def task_rows(job):
+    """(title, description, column_id, priority, status, due_date, created_at, creator_id, assignee_id)"""
+    index, count = job
+    c = _context
+    rnd = chunk_random(c['seed'], "tasks", index)
+    rows = []
+    for _ in range(count):
+        created_at = c['now'] - timedelta(seconds=rnd.randint(0, YEAR_SECONDS))
+        due_date = (created_at + timedelta(days=rnd.randint(1, 30))).date() if rnd.random() > 0.3 else None
+        rows.append((
+            rnd.choice(c['titles']),
+            rnd.choice(c['descriptions']),
+            rnd.choice(c['column_ids']),
+            rnd.choice(PRIORITIES),
+            rnd.choice(STATUSES),
+            due_date,
+            created_at,
+            rnd.choice(c['user_ids']),
+            rnd.choice(c['user_ids']) if rnd.random() > 0.2 else None,
+        ))
+    return rows
+
+
+def after(rnd, start, now):
+    """случайный момент между start и now"""
+    return start + (now - start) * rnd.random()
+
+
+def comment_rows(job):
+    """job: (номер куска, [(task_id, created_at)], сколько комментариев) ->
+    (task_id, text, created_at, user_id)"""
+    index, tasks, count = job
+    c = _context
+    rnd = chunk_random(c['seed'], "comments", index)
+    rows = []
+    for _ in range(count):
+        task_id, task_created = rnd.choice(tasks)
+        rows.append((task_id, rnd.choice(c['comments']), after(rnd, task_created, c['now']), rnd.choice(c['user_ids'])))
+    return rows
+
+
+def time_rows(job):
+    """(task_id, user_id, start_time, end_time, description)"""
+    index, tasks, count = job
+    c = _context
+    rnd = chunk_random(c['seed'], "timetracking", index)
+    rows = []
+    for _ in range(count):
+        task_id, task_created = rnd.choice(tasks)
+        start_time = after(rnd, task_created, c['now'])
+        end_time = start_time + timedelta(hours=rnd.randint(1, 8)) if rnd.random() > 0.2 else None
+        description = rnd.choice(c['worklog']) if rnd.random() > 0.3 else ''
+        rows.append((task_id, rnd.choice(c['user_ids']), start_time, end_time, description))
+    return rows
@@ -1,7 +1,97 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Project, Column, Task, Comment, TimeTracking, User, UserProfile
+from rest_framework.reverse import reverse
+from .models import Project, Column, Task, Comment, TimeTracking, User, UserProfile, ProjectStats, Job
+from .thumbnails import variant_names
+
+
+class SparseFieldsMixin:
+    """выборка полей ответа: fields - только эти, omit - все, кроме этих, expand - связи
+    из Meta.expandable, которые отдаются вложенным объектом вместо id. плоские поля,
+    читающие ту же связь (column_name при expand=column), тогда не нужны и убираются,
+    если их не попросили в fields явно. вложенное раскрытие пишется через точку: column.project.
+    из ?fields=/?omit=/?expand= их передает QueryPlanMixin, он же по ним строит only()"""
+
+    def __init__(self, *args, fields=None, omit=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requested_fields = fields
+        self.omitted_fields = omit
+        self.expanded_fields = expand
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expandable = getattr(self.Meta, 'expandable', {})
+
+        for param, names, known in (
+            ('fields', self.requested_fields, fields),
+            ('omit', self.omitted_fields, fields),
+            ('expand', [name.split('.', 1)[0] for name in self.expanded_fields or ()], expandable),
+        ):
+            unknown = sorted(set(names or ()) - set(known))
+            if unknown:
+                raise serializers.ValidationError(
+                    {param: f"неизвестные поля: {', '.join(unknown)}. доступны: {', '.join(known)}"}
+                )
+
+        if self.requested_fields:
+            fields = {name: field for name, field in fields.items() if name in self.requested_fields}
+        for name in self.omitted_fields or ():
+            fields.pop(name, None)
+
+        nested = {}
+        for name in self.expanded_fields or ():
+            head, _, rest = name.partition('.')
+            nested.setdefault(head, [])
+            if rest:
+                nested[head].append(rest)
+
+        for name, expand in nested.items():
+            if name not in fields:
+                continue
+            source = fields[name].source or name
+            kwargs = {'source': source} if source != name else {}
+            fields[name] = expandable[name](read_only=True, expand=expand, **kwargs)
+            for other, field in list(fields.items()):
+                flat = field.read_only and (field.source or '').startswith(f"{source}.")
+                if other != name and flat and other not in (self.requested_fields or ()):
+                    del fields[other]
+
+        return fields
+
+
+class ThumbnailsField(serializers.Field):
+    """ссылки на превью картинки по ее хешу: {размер: {формат: url}}, null - превью еще нет"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        kwargs.setdefault('source', 'picture_digest')
+        super().__init__(**kwargs)
 
-class UserProfileSerializer(serializers.ModelSerializer):
+    def to_representation(self, digest):
+        if not digest:
+            return None
+        request = self.context.get('request')
+        url = request.build_absolute_uri if request is not None else (lambda path: path)
+        return {
+            size: {fmt: url(default_storage.url(name)) for fmt, name in formats.items()}
+            for size, formats in variant_names(digest).items()
+        }
+
+
+class UserBriefSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """пользователь внутри ?expand=creator, ?expand=user и т.п. - только то, что API
+    и так отдает в creator_name/assignee_name, без имени и фамилии"""
+
+    class Meta:
+        model = User
+        fields = ['id', 'username']
+
+
+class UserProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False)
     
     username = serializers.CharField(source='user.username')
@@ -11,6 +101,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
         model = UserProfile
         fields = ['id', 'username', 'email', 'password', 'name', 'birthday', 'type', 'created_at', 'user']
         read_only_fields = ['user', 'created_at']
+        expandable = {'user': UserBriefSerializer}
 
     def create(self, validated_data):
         user_data = validated_data.pop('user', {})
@@ -49,7 +140,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     def create(self, validated_data):
         if 'request' in self.context:
             validated_data['user'] = self.context['request'].user
@@ -58,16 +149,19 @@ class ProjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Project
         fields = ['id', 'name', 'description', 'created_at', 'user']
+        expandable = {'user': UserBriefSerializer}
 
-class ColumnSerializer(serializers.ModelSerializer):
+class ColumnSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     project_name = serializers.CharField(source='project.name', read_only=True)
     
     class Meta:
         model = Column
         fields = ['id', 'name', 'project', 'project_name', 'order']
+        expandable = {'project': ProjectSerializer}
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     column_name = serializers.CharField(source='column.name', read_only=True)
+    picture_thumbnails = ThumbnailsField()
     creator_name = serializers.CharField(source='creator.username', read_only=True)
     assignee_name = serializers.CharField(source='assignee.username', read_only=True, allow_null=True)
     
@@ -80,14 +174,42 @@ class TaskSerializer(serializers.ModelSerializer):
         model = Task
         fields = [
             'id', 'title', 'description', 'column', 'column_name', 
-            'priority', 'status', 'due_date', 'created_at', 
-            'picture', 'creator', 'creator_name', 'assignee', 'assignee_name'
+            'priority', 'status', 'due_date', 'position', 'created_at', 
+            'picture', 'picture_thumbnails', 'creator', 'creator_name', 'assignee', 'assignee_name'
         ]
-        read_only_fields = ['creator']
+        read_only_fields = ['creator', 'position']
+        expandable = {'column': ColumnSerializer, 'creator': UserBriefSerializer, 'assignee': UserBriefSerializer}
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """берет объект из context['prefetched'][модель], а не делает SELECT на каждый элемент пачки"""
+
+    def to_internal_value(self, data):
+        prefetched = self.context.get('prefetched', {}).get(self.get_queryset().model)
+        if prefetched is None:
+            return super().to_internal_value(data)
+
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return prefetched[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class TaskBulkSerializer(TaskSerializer):
+    """TaskSerializer для /api/tasks/bulk/: колонки и исполнители берутся из заранее загруженной пачки"""
+    column = PrefetchedPrimaryKeyRelatedField(queryset=Column.objects.all())
+    assignee = PrefetchedPrimaryKeyRelatedField(queryset=User.objects.all(), allow_null=True, required=False)
+
+    class Meta(TaskSerializer.Meta):
+        read_only_fields = ['creator', 'position', 'picture']
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     task_title = serializers.CharField(source='task.title', read_only=True)
     user_name = serializers.CharField(source='user.username', read_only=True, allow_null=True)
+    picture_thumbnails = ThumbnailsField()
     
     def create(self, validated_data):
         if 'request' in self.context:
@@ -96,10 +218,11 @@ class CommentSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Comment
-        fields = ['id', 'task', 'task_title', 'text', 'created_at', 'picture', 'user', 'user_name']
+        fields = ['id', 'task', 'task_title', 'text', 'created_at', 'picture', 'picture_thumbnails', 'user', 'user_name']
         read_only_fields = ['user']
+        expandable = {'task': TaskSerializer, 'user': UserBriefSerializer}
 
-class TimeTrackingSerializer(serializers.ModelSerializer):
+class TimeTrackingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     task_title = serializers.CharField(source='task.title', read_only=True)
     user_name = serializers.CharField(source='user.username', read_only=True, allow_null=True)
     
@@ -114,4 +237,91 @@ class TimeTrackingSerializer(serializers.ModelSerializer):
             'id', 'task', 'task_title', 'user', 'user_name',
             'start_time', 'end_time', 'description'
         ]
-        read_only_fields = ['user']
\ No newline at end of file
+        read_only_fields = ['user']
+        expandable = {'task': TaskSerializer, 'user': UserBriefSerializer}
+
+class ProjectStatsSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ProjectStats
+        fields = [
+            'project', 'column_count', 'task_count',
+            'status_todo', 'status_in_progress', 'status_review', 'status_done',
+            'priority_low', 'priority_medium', 'priority_high',
+            'comment_count', 'time_entry_count', 'open_time_entries', 'tracked_seconds'
+        ]
+        expandable = {'project': ProjectSerializer}
+
+
+class MoveSerializer(serializers.Serializer):
+    """куда переместить: после элемента after (null - в начало), для задач еще и в колонку column"""
+    after = serializers.IntegerField(allow_null=True, required=False, default=None)
+    column = serializers.IntegerField(required=False)
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    """параметры /api/search/: kind ограничивает поиск задачами или комментариями"""
+    q = serializers.CharField(max_length=200)
+    kind = serializers.ChoiceField(choices=['task', 'comment'], required=False, default=None)
+    project_id = serializers.IntegerField(required=False, default=None)
+    limit = serializers.IntegerField(min_value=1, max_value=100, required=False, default=20)
+
+
+class FeedQuerySerializer(serializers.Serializer):
+    """на какие проекты подписаться: ?project=1&project=2"""
+    project = serializers.ListField(child=serializers.IntegerField(), min_length=1, max_length=50)
+
+
+class SyncQuerySerializer(serializers.Serializer):
+    """since - version из прошлого ответа /api/sync/ (без него - reset), project - фильтр по доскам"""
+    since = serializers.IntegerField(min_value=0, required=False, default=None)
+    project = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=50)
+
+
+class TimeReportQuerySerializer(serializers.Serializer):
+    """параметры /api/timetracking/report/: group_by можно повторять (?group_by=user&group_by=project),
+    period - по дням/неделям/месяцам (без него - итоги за весь срок), start/end - даты включительно"""
+    group_by = serializers.ListField(
+        child=serializers.ChoiceField(choices=['user', 'task', 'project']), required=False, default=list, max_length=3
+    )
+    period = serializers.ChoiceField(choices=['day', 'week', 'month'], required=False, default=None)
+    start = serializers.DateField(required=False, default=None)
+    end = serializers.DateField(required=False, default=None)
+    user_id = serializers.IntegerField(required=False, default=None)
+    task_id = serializers.IntegerField(required=False, default=None)
+    project_id = serializers.IntegerField(required=False, default=None)
+
+    def validate(self, attrs):
+        end = attrs['end'] or timezone.localdate()
+        start = attrs['start'] or end - timedelta(days=30)
+        if start > end:
+            raise serializers.ValidationError({"start": "start позже end"})
+        if (end - start).days >= settings.TIME_REPORT_MAX_DAYS:
+            raise serializers.ValidationError({"start": f"период не больше {settings.TIME_REPORT_MAX_DAYS} дней"})
+        attrs['group_by'] = list(dict.fromkeys(attrs['group_by']))
+        return {**attrs, 'start': start, 'end': end}
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """фоновая задача: статус для опроса и ссылка на результат, когда он готов"""
+    result_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'params', 'created_at', 'started_at', 'finished_at', 'expires_at',
+                  'attempts', 'summary', 'error', 'result_url']
+        read_only_fields = fields
+
+    def get_result_url(self, job):
+        if job.status != Job.Status.DONE or not job.result:
+            return None
+        return reverse('jobs-result', args=[job.pk], request=self.context.get('request'))
+
+
+class ExportJobSerializer(serializers.Serializer):
+    """тело POST /api/<список>/export-job/. фильтры - те же параметры строки запроса, что у списка"""
+    format = serializers.ChoiceField(choices=['xlsx', 'csv', 'jsonl'], required=False, default='xlsx')
+
+
+class ThumbnailJobSerializer(serializers.Serializer):
+    """тело POST /api/jobs/thumbnails/: all - пересчитать превью и там, где они уже есть"""
+    all = serializers.BooleanField(required=False, default=False)
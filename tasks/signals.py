@@ -0,0 +1,171 @@
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .caching import bump_version_on_commit
+from .feed import FEED_SERIALIZERS, publish_change, publish_resync
+from .models import Column, Comment, Project, ProjectStats, Task, TimeTracking, Tombstone, UserProfile, next_version
+from .stats import apply_project_stats, diff_contributions, rebuild_project_stats, stats_contribution
+from .thumbnails import reset_digest, schedule_on_save
+from .timereport import defer_invalidation, deferred_days, invalidate_days, invalidate_on_delete, invalidate_on_save, remember_day
+
+COUNTED_MODELS = (Column, Task, Comment, TimeTracking)
+PICTURE_MODELS = (Task, Comment)
+VERSIONED_MODELS = (Project, Column, Task, Comment, TimeTracking, UserProfile, User)
+SYNCED_MODELS = (Project, Column, Task, Comment, TimeTracking)
+# путь до проекта у моделей, которые удаляются вместе с каскадом (delete_cascade)
+CASCADE_ROOTS = {Project: "pk", Column: "project_id", Task: "column__project_id"}
+
+_bulk = threading.local()
+
+
+def in_bulk_write():
+    return getattr(_bulk, "active", False)
+
+
+@contextmanager
+def bulk_write(models, project_ids, resync=True):
+    """массовая запись: построчные обработчики молчат, а после блока статистика
+    затронутых проектов пересчитывается одним проходом, итоги времени сбрасываются
+    за все задетые дни разом и версии моделей сдвигаются один раз.
+    project_ids - множество, которое можно дополнять внутри блока.
+    отдает номер изменения для /api/sync/ - один на весь блок, его же получают надгробия.
+    resync=False - ленту вызывающий код обновит сам.
+    должен стоять внутри transaction.atomic()"""
+    version = next_version()
+    _bulk.active = True
+    _bulk.tombstones = []
+    defer_invalidation()
+    try:
+        yield version
+    finally:
+        _bulk.active = False
+        tombstones, _bulk.tombstones = _bulk.tombstones, []
+        days = deferred_days()
+    for tombstone in tombstones:
+        tombstone.version = version
+    Tombstone.objects.bulk_create(tombstones, batch_size=500)
+    rebuild_project_stats(list(project_ids))
+    invalidate_days(days)
+    for model in models:
+        bump_version_on_commit(model)
+    if resync:
+        publish_resync(project_ids)
+
+
+def delete_cascade(queryset):
+    """удаление проектов, колонок или задач вместе со всем, что на них ссылается.
+    построчные обработчики на каждую строку каскада стоили бы несколько запросов,
+    поэтому удаление идет внутри bulk_write. в ленту уходит <модель>.deleted на сами
+    удаленные колонки/задачи, как при обычном delete(), для проектов - resync"""
+    model = queryset.model
+    published = model in FEED_SERIALIZERS
+    with transaction.atomic():
+        rows = list(queryset.values_list("pk", CASCADE_ROOTS[model]))
+        project_ids = {project_id for _, project_id in rows}
+        with bulk_write(SYNCED_MODELS, project_ids, resync=not published):
+            deleted = queryset.delete()
+        if published:
+            for pk, project_id in rows:
+                publish_change(model(pk=pk), "deleted", [project_id])
+    return deleted
+
+
+def bump_model_version(sender, **kwargs):
+    if in_bulk_write():
+        return
+    bump_version_on_commit(sender)
+
+
+@receiver(post_save, sender=Project)
+def create_project_stats(sender, instance, created, **kwargs):
+    if created:
+        ProjectStats.objects.get_or_create(project=instance)
+
+
+def remember_contribution(sender, instance, **kwargs):
+    """вклад строки в счетчики до изменения (на pre_save/pre_delete)"""
+    if in_bulk_write():
+        return
+    if kwargs.get("raw") or instance.pk is None or instance._state.adding:
+        instance._stats_contribution = {}
+    else:
+        instance._stats_contribution = stats_contribution(sender, instance.pk)
+
+
+def update_on_save(sender, instance, raw=False, **kwargs):
+    if raw or in_bulk_write():
+        return
+    old = getattr(instance, "_stats_contribution", {})
+    new = stats_contribution(sender, instance.pk)
+    instance._stats_projects = {*old, *new}
+    if sender in (Column, Task) and old and old.keys() != new.keys():
+        # колонку/задачу перенесли в другой проект - вместе с ней уехали задачи,
+        # комментарии и учет времени, проще пересчитать оба проекта
+        rebuild_project_stats([*old, *new])
+        return
+    apply_project_stats(diff_contributions(new, old))
+
+
+def update_on_delete(sender, instance, **kwargs):
+    if in_bulk_write():
+        return
+    old = getattr(instance, "_stats_contribution", {})
+    instance._stats_projects = set(old)
+    # при каскадном удалении проекта его строки статистики уже может не быть,
+    # тогда ничего не пересчитываем
+    apply_project_stats(diff_contributions({}, old), rebuild_missing=False)
+
+
+def leave_tombstone(sender, instance, **kwargs):
+    """удаление тоже изменение: /api/sync/ отдаст id в deleted"""
+    tombstone = Tombstone(model=sender._meta.model_name, object_id=instance.pk)
+    if in_bulk_write():
+        _bulk.tombstones.append(tombstone)
+        return
+    tombstone.version = next_version()
+    tombstone.save()
+
+
+def publish_on_save(sender, instance, created, raw=False, **kwargs):
+    """проекты берутся из вклада в счетчики, который update_on_save уже посчитал"""
+    if raw or in_bulk_write():
+        return
+    publish_change(instance, "created" if created else "updated", getattr(instance, "_stats_projects", ()))
+
+
+def publish_on_delete(sender, instance, **kwargs):
+    if in_bulk_write():
+        return
+    publish_change(instance, "deleted", getattr(instance, "_stats_projects", ()))
+
+
+for model in COUNTED_MODELS:
+    pre_save.connect(remember_contribution, sender=model)
+    pre_delete.connect(remember_contribution, sender=model)
+    post_save.connect(update_on_save, sender=model)
+    post_delete.connect(update_on_delete, sender=model)
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_model_version, sender=model)
+    post_delete.connect(bump_model_version, sender=model)
+
+for model in SYNCED_MODELS:
+    post_delete.connect(leave_tombstone, sender=model)
+
+# после update_on_save/update_on_delete, чтобы _stats_projects уже был посчитан
+for model in FEED_SERIALIZERS:
+    post_save.connect(publish_on_save, sender=model)
+    post_delete.connect(publish_on_delete, sender=model)
+
+for model in PICTURE_MODELS:
+    pre_save.connect(reset_digest, sender=model)
+    post_save.connect(schedule_on_save, sender=model)
+
+pre_save.connect(remember_day, sender=TimeTracking)
+post_save.connect(invalidate_on_save, sender=TimeTracking)
+post_delete.connect(invalidate_on_delete, sender=TimeTracking)
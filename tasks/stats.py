@@ -0,0 +1,199 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .caching import amodel_versions, model_versions
+from .models import Column, Comment, Project, ProjectStats, Task, TimeTracking
+
+OPEN_STATUSES = ['todo', 'in_progress', 'review']
+
+
+def task_stats_cache_key(params, versions=None):
+    """в ключе версии Task и Column: любое их изменение делает старые stats невидимыми"""
+    if versions is None:
+        versions = model_versions([Task, Column])
+    versions = ":".join(str(version) for version in versions)
+    scope = ":".join(f"{name}={params.get(name, '')}" for name in ('project_id', 'user_id', 'column_id'))
+    return f"task_stats:{versions}:{scope}"
+
+
+def task_stats_aggregates():
+    now = timezone.now()
+    week_ago = now - timedelta(days=7)
+
+    aggregates = {
+        "total": Count("id"),
+        "overdue": Count("id", filter=Q(due_date__lt=now.date(), status__in=OPEN_STATUSES)),
+        "created_week": Count("id", filter=Q(created_at__gte=week_ago)),
+    }
+    for status, _ in Task.STATUS_CHOICES:
+        aggregates[f"status_{status}"] = Count("id", filter=Q(status=status))
+    for priority, _ in Task.PRIORITY_CHOICES:
+        aggregates[f"priority_{priority}"] = Count("id", filter=Q(priority=priority))
+    return aggregates
+
+
+def task_stats(row):
+    return {
+        "total": row["total"],
+        "by_status": {
+            status: row[f"status_{status}"]
+            for status, _ in Task.STATUS_CHOICES if row[f"status_{status}"]
+        },
+        "by_priority": {
+            priority: row[f"priority_{priority}"]
+            for priority, _ in Task.PRIORITY_CHOICES if row[f"priority_{priority}"]
+        },
+        "overdue": row["overdue"],
+        "created_week": row["created_week"],
+    }
+
+
+def compute_task_stats(qs):
+    """вся статистика по задачам за один проход (условная агрегация)"""
+    return task_stats(qs.order_by().aggregate(**task_stats_aggregates()))
+
+
+def cached_task_stats(qs, params):
+    key = task_stats_cache_key(params)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_task_stats(qs)
+        cache.set(key, stats, timeout=getattr(settings, 'TASK_STATS_CACHE_TTL', 30))
+    return stats
+
+
+async def acached_task_stats(qs, params):
+    key = task_stats_cache_key(params, await amodel_versions([Task, Column]))
+    stats = await cache.aget(key)
+    if stats is None:
+        stats = task_stats(await qs.order_by().aaggregate(**task_stats_aggregates()))
+        await cache.aset(key, stats, timeout=getattr(settings, 'TASK_STATS_CACHE_TTL', 30))
+    return stats
+
+
+# --- материализованные счетчики проекта (ProjectStats) ---
+#
+# каждая строка Column/Task/Comment/TimeTracking "вкладывает" в счетчики своего
+# проекта набор дельт. при сохранении применяем (новый вклад - старый вклад),
+# при удалении - минус старый вклад
+
+def _task_deltas(status, priority):
+    return {"task_count": 1, f"status_{status}": 1, f"priority_{priority}": 1}
+
+
+def _time_deltas(start_time, end_time):
+    if end_time is None:
+        return {"time_entry_count": 1, "open_time_entries": 1}
+    return {"time_entry_count": 1, "tracked_seconds": int((end_time - start_time).total_seconds())}
+
+
+CONTRIBUTIONS = {
+    Column: (("project_id",), lambda row: {"column_count": 1}),
+    Task: (("column__project_id", "status", "priority"), lambda row: _task_deltas(row[1], row[2])),
+    Comment: (("task__column__project_id",), lambda row: {"comment_count": 1}),
+    TimeTracking: (("task__column__project_id", "start_time", "end_time"), lambda row: _time_deltas(row[1], row[2])),
+}
+
+
+def stats_contribution(model, pk):
+    """вклад строки в счетчики по текущему состоянию в БД: {project_id: {поле: дельта}}"""
+    fields, deltas = CONTRIBUTIONS[model]
+    row = model.objects.filter(pk=pk).values_list(*fields).first()
+    if row is None or row[0] is None:
+        return {}
+    return {row[0]: deltas(row)}
+
+
+def diff_contributions(new, old):
+    result = defaultdict(lambda: defaultdict(int))
+    for sign, contribution in ((1, new), (-1, old)):
+        for project_id, deltas in contribution.items():
+            for name, value in deltas.items():
+                result[project_id][name] += sign * value
+    return result
+
+
+def apply_project_stats(changes, rebuild_missing=True):
+    for project_id, deltas in changes.items():
+        deltas = {name: F(name) + value for name, value in deltas.items() if value}
+        if not deltas:
+            continue
+        updated = ProjectStats.objects.filter(project_id=project_id).update(**deltas)
+        if not updated and rebuild_missing:
+            # строки еще нет (проект до миграции или после дрейфа) - считаем с нуля,
+            # в БД уже новое состояние, поэтому дельта не нужна
+            rebuild_project_stats([project_id])
+
+
+def rebuild_project_stats(project_ids=None):
+    """пересчет счетчиков с нуля: по одному GROUP BY на таблицу"""
+    projects = Project.objects.all()
+    if project_ids is not None:
+        projects = projects.filter(pk__in=project_ids)
+    rows = {pk: ProjectStats(project_id=pk) for pk in projects.values_list("pk", flat=True)}
+
+    def scoped(qs, field):
+        if project_ids is not None:
+            qs = qs.filter(**{f"{field}__in": project_ids})
+        return qs.values(field).order_by()
+
+    for item in scoped(Column.objects, "project_id").annotate(n=Count("id")):
+        if item["project_id"] in rows:
+            rows[item["project_id"]].column_count = item["n"]
+
+    task_aggregates = {"task_count": Count("id")}
+    for status, _ in Task.STATUS_CHOICES:
+        task_aggregates[f"status_{status}"] = Count("id", filter=Q(status=status))
+    for priority, _ in Task.PRIORITY_CHOICES:
+        task_aggregates[f"priority_{priority}"] = Count("id", filter=Q(priority=priority))
+    for item in scoped(Task.objects, "column__project_id").annotate(**task_aggregates):
+        stats = rows.get(item.pop("column__project_id"))
+        if stats:
+            for name, value in item.items():
+                setattr(stats, name, value)
+
+    for item in scoped(Comment.objects, "task__column__project_id").annotate(n=Count("id")):
+        stats = rows.get(item["task__column__project_id"])
+        if stats:
+            stats.comment_count = item["n"]
+
+    duration = ExpressionWrapper(F("end_time") - F("start_time"), output_field=DurationField())
+    time_rows = scoped(TimeTracking.objects, "task__column__project_id").annotate(
+        n=Count("id"),
+        open=Count("id", filter=Q(end_time__isnull=True)),
+        tracked=Sum(duration, filter=Q(end_time__isnull=False)),
+    )
+    for item in time_rows:
+        stats = rows.get(item["task__column__project_id"])
+        if stats:
+            stats.time_entry_count = item["n"]
+            stats.open_time_entries = item["open"]
+            stats.tracked_seconds = int(item["tracked"].total_seconds()) if item["tracked"] else 0
+
+    with transaction.atomic():
+        ProjectStats.objects.filter(project_id__in=rows.keys()).delete()
+        ProjectStats.objects.bulk_create(rows.values(), batch_size=1000)
+    return len(rows)
+
+
+def project_counter_queryset(project_id=None):
+    qs = ProjectStats.objects.all()
+    if project_id:
+        qs = qs.filter(project_id=project_id)
+    return qs
+
+
+def project_counter(name, project_id=None):
+    """сумма счетчика по проектам (или значение одного проекта) без COUNT(*) по таблице"""
+    return project_counter_queryset(project_id).aggregate(count=Coalesce(Sum(name), 0))["count"]
+
+
+async def aproject_counter(name, project_id=None):
+    return (await project_counter_queryset(project_id).aaggregate(count=Coalesce(Sum(name), 0)))["count"]
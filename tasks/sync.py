@@ -0,0 +1,90 @@
+"""инкрементальная синхронизация: /api/sync/?since=<version>.
+
+каждая запись Project/Column/Task/Comment/TimeTracking получает номер изменения
+(next_version: id транзакции на PostgreSQL, счетчик SyncState на SQLite), удаления
+оставляют надгробия (Tombstone). клиенту отдается committed_version() - номер,
+ниже которого незавершенных транзакций нет, и только строки не новее него.
+клиент запоминает version из ответа и в следующий раз получает только то,
+что изменилось после него. если since не передан, старше горизонта вычищенных
+надгробий или изменений слишком много - в ответе reset, и клиент перечитывает
+списки целиком (version для следующего раза берет из этого же ответа)"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Column, Comment, Project, SyncState, Task, TimeTracking, Tombstone, committed_version, next_version
+from .serializers import (
+    ColumnSerializer, CommentSerializer, ProjectSerializer, TaskSerializer, TimeTrackingSerializer
+)
+
+# ключ ответа, модель, сериализатор, select_related, путь до проекта
+SOURCES = [
+    ("projects", Project, ProjectSerializer, ('user',), 'pk'),
+    ("columns", Column, ColumnSerializer, ('project',), 'project_id'),
+    ("tasks", Task, TaskSerializer, ('column', 'creator', 'assignee'), 'column__project_id'),
+    ("comments", Comment, CommentSerializer, ('task', 'user'), 'task__column__project_id'),
+    ("timetracking", TimeTracking, TimeTrackingSerializer, ('task', 'user'), 'task__column__project_id'),
+]
+
+
+def sync_state():
+    horizon = SyncState.objects.filter(pk=1).values_list('horizon', flat=True).first() or 0
+    return {'version': committed_version(), 'horizon': horizon}
+
+
+def reset(version):
+    return {"version": version, "reset": True, "changes": {}, "deleted": {}}
+
+
+def changes_since(since, project_ids=None, context=None):
+    # номер читаем до выборки строк: все, что не больше него, уже закоммичено.
+    # строки новее него клиент получит в следующий раз, вместе с теми, что еще пишутся
+    state = sync_state()
+    if since is None or since < state['horizon']:
+        return reset(state['version'])
+
+    limit = settings.SYNC_MAX_CHANGES
+    changes, total = {}, 0
+    for key, model, serializer_class, related, project_path in SOURCES:
+        qs = model.objects.filter(version__gt=since, version__lte=state['version']).select_related(*related).order_by('version', 'pk')
+        if project_ids:
+            qs = qs.filter(**{f"{project_path}__in": project_ids})
+        rows = list(qs[:limit - total + 1])
+        total += len(rows)
+        if total > limit:
+            return reset(state['version'])
+        changes[key] = serializer_class(rows, many=True, context=context).data
+
+    # надгробия не привязаны к проекту: это только id, чужие клиент просто не найдет у себя
+    keys = {model._meta.model_name: key for key, model, *_ in SOURCES}
+    deleted = defaultdict(list)
+    tombstones = Tombstone.objects.filter(version__gt=since, version__lte=state['version']).order_by('version').values_list('model', 'object_id')
+    for model_name, object_id in tombstones[:limit + 1]:
+        deleted[keys[model_name]].append(object_id)
+    if sum(map(len, deleted.values())) > limit:
+        return reset(state['version'])
+
+    return {"version": state['version'], "reset": False, "changes": changes, "deleted": dict(deleted)}
+
+
+def purge_tombstones(before):
+    """удаляет надгробия старше before и сдвигает горизонт: клиентам,
+    которые синхронизировались раньше, придется перечитать все целиком"""
+    old = Tombstone.objects.filter(deleted_at__lt=before)
+    horizon = old.order_by('-version').values_list('version', flat=True).first()
+    if horizon is None:
+        return 0
+    SyncState.objects.get_or_create(pk=1)
+    SyncState.objects.filter(pk=1, horizon__lt=horizon).update(horizon=horizon)
+    count, _ = Tombstone.objects.filter(version__lte=horizon).delete()
+    return count
+
+
+def reset_clients():
+    """сдвигает горизонт на текущий номер: все клиенты в следующий раз получат reset.
+    для записи, которая идет мимо номеров изменений (generate_data пишет во многих транзакциях)"""
+    with transaction.atomic():
+        version = next_version()
+        SyncState.objects.get_or_create(pk=1)
+        SyncState.objects.filter(pk=1, horizon__lt=version).update(horizon=version)
@@ -1,10 +1,12 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.contrib.auth.models import User
 from model_bakery import baker
-from .models import Project, Column, Task, Comment, TimeTracking
+from .models import Project, Column, Task, Comment, TimeTracking, ProjectStats
 from django.utils import timezone
+from datetime import timedelta
+from pathlib import Path
 import json
 """2 задание джабы с тестами"""
 class APIDiscoveryTests(TestCase):
@@ -182,4 +184,1318 @@ class DataTests(TestCase):
         if response.status_code == 400:
             print(f"TimeTracking errors: {json.dumps(response.data, indent=2, ensure_ascii=False)}")
         elif response.status_code == 201:
-            print(f"TimeTracking created: {response.data}")
\ No newline at end of file
+            print(f"TimeTracking created: {response.data}")
+
+class PaginationTests(TestCase):
+    """курсорная пагинация списков"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(name="Project", user=self.user)
+        self.column = Column.objects.create(name="Column", project=self.project, order=1)
+        for i in range(5):
+            Task.objects.create(title=f"Task {i}", column=self.column)
+
+    def test_cursor_walks_all_tasks(self):
+        """проход по next отдает все задачи ровно один раз"""
+        ids = []
+        url = '/api/tasks/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids += [t['id'] for t in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(sorted(ids), sorted(Task.objects.values_list('id', flat=True)))
+
+    def test_page_size_is_capped(self):
+        """page_size больше потолка обрезается до API_MAX_PAGE_SIZE"""
+        with self.settings(API_MAX_PAGE_SIZE=3):
+            response = self.client.get('/api/tasks/?page_size=100000')
+
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNotNone(response.data['next'])
+
+
+class QueryCountTests(TestCase):
+    """количество запросов на список не зависит от числа строк"""
+
+    endpoints = ['/api/columns/', '/api/tasks/', '/api/comments/', '/api/timetracking/', '/api/projects/']
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.seed(3)
+
+    def seed(self, n):
+        for i in range(n):
+            project = Project.objects.create(name=f"Project {i}", user=self.user)
+            column = Column.objects.create(name="Column", project=project)
+            assignee = User.objects.create_user(username=f'assignee{Task.objects.count()}')
+            task = Task.objects.create(title=f"Task {i}", column=column, creator=self.user, assignee=assignee)
+            Comment.objects.create(task=task, text="Comment", user=assignee)
+            TimeTracking.objects.create(task=task, user=assignee, start_time=timezone.now())
+
+    def test_list_query_count_is_constant(self):
+        """один SELECT на список и при 3, и при 13 строках"""
+        for endpoint in self.endpoints:
+            with self.assertNumQueries(1):
+                response = self.client.get(endpoint)
+            self.assertEqual(response.status_code, 200)
+
+        self.seed(10)
+
+        for endpoint in self.endpoints:
+            with self.assertNumQueries(1):
+                response = self.client.get(endpoint)
+            self.assertEqual(len(response.data['results']), 13)
+
+    def test_retrieve_reads_related_names(self):
+        """only() не отрезает поля, которые читает сериализатор"""
+        task = Task.objects.select_related('column', 'assignee').first()
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/tasks/{task.id}/')
+
+        self.assertEqual(response.data['column_name'], task.column.name)
+        self.assertEqual(response.data['assignee_name'], task.assignee.username)
+        self.assertEqual(response.data['creator_name'], self.user.username)
+
+
+class SparseFieldsTests(TestCase):
+    """?fields=, ?omit= и ?expand=: в ответе и в SELECT только то, что попросили"""
+
+    def setUp(self):
+        from django.test.utils import CaptureQueriesContext
+        from django.db import connection
+
+        self.capture = lambda: CaptureQueriesContext(connection)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(name="Project", user=self.user)
+        self.column = Column.objects.create(name="Column", project=self.project)
+        self.task = Task.objects.create(title="Task", description="x" * 1000, column=self.column, creator=self.user)
+
+    def test_fields_and_omit_reach_the_query(self):
+        with self.capture() as queries:
+            response = self.client.get('/api/tasks/', {'fields': 'id,title,status,column'})
+        self.assertEqual(list(response.data['results'][0]), ['id', 'title', 'column', 'status'])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('description', queries[0]['sql'])
+        self.assertNotIn('JOIN', queries[0]['sql'])
+
+        with self.capture() as queries:
+            response = self.client.get(f'/api/tasks/{self.task.id}/', {'omit': 'description,picture'})
+        self.assertNotIn('description', response.data)
+        self.assertEqual(response.data['column_name'], "Column")
+        self.assertNotIn('"tasks_task"."description"', queries[0]['sql'])
+
+        response = self.client.get('/api/tasks/', {'fields': 'id,nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nope', str(response.data['fields']))
+
+    def test_expand_replaces_flat_names(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/tasks/', {'expand': 'column.project,creator'})
+        task = response.data['results'][0]
+        self.assertEqual(task['column']['project']['name'], "Project")
+        self.assertEqual(task['creator'], {'id': self.user.id, 'username': "testuser"})
+        self.assertNotIn('column_name', task)
+        self.assertNotIn('creator_name', task)
+        self.assertNotIn('project_name', task['column'])
+        self.assertEqual(task['assignee'], None)
+
+        response = self.client.get('/api/tasks/', {'expand': 'description'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_expand_requires_login(self):
+        """аноним читает задачи, но не раскрывает их проекты и пользователей"""
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get('/api/tasks/').status_code, 200)
+        for url in ('/api/tasks/?expand=column.project', f'/api/tasks/{self.task.id}/?expand=creator'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 403)
+            self.assertNotIn('Project', response.content.decode())
+
+
+class ExportTests(TestCase):
+    """потоковые выгрузки"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(name="Project", user=self.user)
+        self.column = Column.objects.create(name="Column", project=self.project)
+        for i in range(3):
+            Task.objects.create(title=f"Task {i}", column=self.column, creator=self.user)
+
+    def test_export_excel(self):
+        """xlsx открывается и содержит заголовок и все строки"""
+        import io
+        import openpyxl
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/projects/export-excel/')
+        self.assertEqual(response.status_code, 200)
+
+        wb = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        rows = list(wb.active.values)
+        self.assertEqual(rows[0][0], "ID")
+        self.assertEqual(rows[1][4], self.user.username)
+
+    def test_export_csv_and_jsonl(self):
+        """csv и jsonl отдаются потоком с теми же фильтрами, что и список"""
+        response = self.client.get(f'/api/tasks/export-csv/?project_id={self.project.id}')
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), 4)
+
+        response = self.client.get('/api/tasks/export-jsonl/?project_id=0')
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+        response = self.client.get('/api/tasks/export-jsonl/')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0]['column_name'], "Column")
+        self.assertEqual(records[0]['creator_username'], self.user.username)
+
+
+class TaskStatsTests(TestCase):
+    """статистика по задачам"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.project = Project.objects.create(name="Project", user=self.user)
+        self.other = Project.objects.create(name="Other", user=self.user)
+        self.column = Column.objects.create(name="Column", project=self.project)
+        other_column = Column.objects.create(name="Column", project=self.other)
+
+        yesterday = timezone.now().date() - timedelta(days=1)
+        Task.objects.create(title="A", column=self.column, status='todo', priority='high', due_date=yesterday)
+        Task.objects.create(title="B", column=self.column, status='done', priority='high', due_date=yesterday)
+        Task.objects.create(title="C", column=other_column, status='todo', priority='low')
+
+    def test_stats_single_query_and_filters(self):
+        """одна агрегация, учитываются фильтры списка"""
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/tasks/stats/?project_id={self.project.id}')
+
+        self.assertEqual(response.data, {
+            "total": 2,
+            "by_status": {"todo": 1, "done": 1},
+            "by_priority": {"high": 2},
+            "overdue": 1,
+            "created_week": 2,
+        })
+        self.assertEqual(self.client.get('/api/tasks/stats/').data['total'], 3)
+
+    def test_stats_cached_until_task_changes(self):
+        """повторный запрос из кеша, сохранение задачи сбрасывает кеш"""
+        self.client.get('/api/tasks/stats/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tasks/stats/')
+        self.assertEqual(response.data['total'], 3)
+
+        Task.objects.create(title="D", column=self.column)
+        self.assertEqual(self.client.get('/api/tasks/stats/').data['total'], 4)
+
+        Task.objects.filter(title="D").first().delete()
+        self.assertEqual(self.client.get('/api/tasks/stats/').data['total'], 3)
+
+
+class ProjectStatsTests(TestCase):
+    """инкрементальные счетчики проекта"""
+
+    fields = [
+        'column_count', 'task_count', 'status_todo', 'status_done', 'priority_high', 'priority_low',
+        'comment_count', 'time_entry_count', 'open_time_entries', 'tracked_seconds',
+    ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(name="Project", user=self.user)
+        self.other = Project.objects.create(name="Other", user=self.user)
+        self.column = Column.objects.create(name="Column", project=self.project)
+        self.other_column = Column.objects.create(name="Column", project=self.other)
+
+    def snapshot(self):
+        return {
+            stats.project_id: {name: getattr(stats, name) for name in self.fields}
+            for stats in ProjectStats.objects.all()
+        }
+
+    def test_incremental_matches_rebuild(self):
+        """после правок и удалений счетчики совпадают с пересчетом с нуля"""
+        from django.core.management import call_command
+
+        start = timezone.now()
+        task = Task.objects.create(title="A", column=self.column, status='todo', priority='high')
+        moved = Task.objects.create(title="B", column=self.column, status='done', priority='low')
+        Comment.objects.create(task=task, text="Comment")
+        Comment.objects.create(task=moved, text="Comment")
+        entry = TimeTracking.objects.create(task=task, start_time=start)
+        TimeTracking.objects.create(task=moved, start_time=start, end_time=start + timedelta(hours=1))
+
+        entry.end_time = start + timedelta(minutes=30)
+        entry.save()
+        task.status = 'done'
+        task.save()
+        moved.column = self.other_column
+        moved.save()
+        Comment.objects.filter(task=task).first().delete()
+
+        stats = ProjectStats.objects.get(project=self.project)
+        self.assertEqual(stats.task_count, 1)
+        self.assertEqual(stats.status_done, 1)
+        self.assertEqual(stats.tracked_seconds, 1800)
+        self.assertEqual(ProjectStats.objects.get(project=self.other).tracked_seconds, 3600)
+
+        incremental = self.snapshot()
+        call_command('rebuild_project_stats', stdout=open('/dev/null', 'w'))
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_cascade_delete_is_set_based(self):
+        """DELETE задачи и проекта: число запросов не растет с размером каскада,
+        надгробия есть на каждую строку, счетчики совпадают с пересчетом"""
+        from django.core.management import call_command
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import Tombstone
+
+        grant_second_factor(self.client)
+        yesterday = timezone.now() - timedelta(days=1)
+
+        def task_with(rows):
+            task = Task.objects.create(title="Task", column=self.column)
+            for _ in range(rows):
+                Comment.objects.create(task=task, text="Comment")
+                TimeTracking.objects.create(task=task, start_time=yesterday, end_time=yesterday + timedelta(minutes=10))
+            return task
+
+        counts = []
+        for rows in (1, 10):
+            task = task_with(rows)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.delete(f'/api/tasks/{task.id}/')
+            self.assertEqual(response.status_code, 204)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+        task = task_with(3)
+        Task.objects.create(title="Other", column=self.other_column)
+        self.assertEqual(self.client.delete(f'/api/projects/{self.project.id}/').status_code, 204)
+        self.assertEqual(Tombstone.objects.filter(model='comment').count(), 1 + 10 + 3)
+        self.assertEqual(Tombstone.objects.filter(model='task').count(), 3)
+        self.assertTrue(Tombstone.objects.filter(model='project', object_id=self.project.id).exists())
+
+        incremental = self.snapshot()
+        call_command('rebuild_project_stats', stdout=open('/dev/null', 'w'))
+        self.assertEqual(incremental, self.snapshot())
+        self.assertEqual(list(incremental), [self.other.id])
+
+    def test_project_stats_endpoint(self):
+        """детальная статистика проекта и счетчики в /stats"""
+        Task.objects.create(title="A", column=self.column)
+        ProjectStats.objects.all().delete()
+
+        response = self.client.get(f'/api/projects/{self.project.id}/stats/')
+        self.assertEqual(response.data['task_count'], 1)
+        self.assertEqual(response.data['column_count'], 1)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/columns/stats/?project_id={self.project.id}')
+        self.assertEqual(response.data['count'], 1)
+
+
+@override_settings(API_CACHE=True)
+class CachedReadTests(TestCase):
+    """кеш ответов и условные GET"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(name="Project", user=self.user)
+        self.column = Column.objects.create(name="Column", project=self.project)
+        self.task = Task.objects.create(title="Task", column=self.column)
+
+    def test_etag_and_not_modified(self):
+        """повтор с If-None-Match дает 304 без запросов в БД, правка задачи меняет ETag"""
+        response = self.client.get('/api/tasks/')
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tasks/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tasks/')
+        self.assertEqual(response.data['results'][0]['title'], "Task")
+
+        self.task.title = "Renamed"
+        self.task.save()
+
+        response = self.client.get('/api/tasks/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['title'], "Renamed")
+
+    def test_cache_varies_by_params_and_user(self):
+        """разные параметры и разные пользователи - разные записи кеша"""
+        first = self.client.get(f'/api/tasks/?column_id={self.column.id}')
+        second = self.client.get('/api/tasks/?column_id=0')
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual(len(second.data['results']), 0)
+
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(user=other)
+        self.assertNotEqual(self.client.get(f'/api/tasks/?column_id={self.column.id}')['ETag'], first['ETag'])
+
+    def test_expand_tracks_nested_models(self):
+        """?expand= добавляет в ключ модели вложенных сериализаторов: правка проекта меняет ответ задач"""
+        url = '/api/tasks/?expand=column.project'
+        etag = self.client.get(url)['ETag']
+
+        self.project.name = "Renamed"
+        self.project.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['column']['project']['name'], "Renamed")
+
+
+class ConditionalGetTests(TestCase):
+    """настройки по умолчанию (locmem, API_CACHE выключен): ответы не кешируются,
+    но ETag по телу и 304 работают"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(name="Project", user=self.user)
+        self.task = Task.objects.create(title="Task", column=Column.objects.create(name="Column", project=self.project))
+
+    def test_etag_from_body(self):
+        from django.conf import settings
+
+        self.assertFalse(settings.API_CACHE)
+        for url in ('/api/tasks/', f'/api/tasks/{self.task.id}/', f'/api/projects/{self.project.id}/board/'):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        etag = self.client.get('/api/tasks/')['ETag']
+        # правка мимо сигналов, как из другого процесса: метки версий о ней не знают
+        Task.objects.filter(pk=self.task.pk).update(title="Renamed")
+        response = self.client.get('/api/tasks/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['title'], "Renamed")
+
+
+def grant_second_factor(client):
+    """проходит /api/users/second-login/ с текущим TOTP-кодом пользователя"""
+    import pyotp
+
+    client.session  # у тестового клиента должна быть сессия, кука к ней привязана
+    me = client.get('/api/users/me/').wsgi_request.user
+    code = pyotp.TOTP(me.userprofile.totp_key).now()
+    response = client.post('/api/users/second-login/', {'key': code}, format='json')
+    assert response.status_code == 200, response.content
+
+
+class BulkTaskTests(TestCase):
+    """массовые операции /api/tasks/bulk/"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        grant_second_factor(self.client)
+
+        self.project = Project.objects.create(name="Project", user=self.user)
+        self.column = Column.objects.create(name="Column", project=self.project)
+        self.done = Column.objects.create(name="Done", project=self.project, order=1)
+        foreign = Project.objects.create(name="Foreign", user=User.objects.create_user(username='other'))
+        self.foreign_column = Column.objects.create(name="Column", project=foreign)
+
+    def test_bulk_create_query_count_is_constant(self):
+        """пачка из 2 и из 20 задач стоит одинаковое число запросов"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        counts = []
+        for size in (2, 20):
+            items = [{'title': f"Task {i}", 'column': self.column.id} for i in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/api/tasks/bulk/', items, format='json')
+            self.assertEqual([r['status'] for r in response.data], ['created'] * size)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(ProjectStats.objects.get(project=self.project).task_count, 22)
+
+    def test_bulk_create_per_item_results(self):
+        """чужая колонка и невалидный элемент не мешают остальным"""
+        response = self.client.post('/api/tasks/bulk/', [
+            {'title': "Mine", 'column': self.column.id},
+            {'title': "Foreign", 'column': self.foreign_column.id},
+            {'column': self.column.id},
+        ], format='json')
+
+        self.assertEqual([r['status'] for r in response.data], ['created', 'error', 'error'])
+        self.assertIn('column', response.data[1]['errors'])
+        self.assertIn('title', response.data[2]['errors'])
+        self.assertEqual(response.data[0]['data']['creator'], self.user.id)
+
+    def test_bulk_update_and_delete(self):
+        """перенос пачки в другую колонку и удаление с проверкой владельца"""
+        tasks = [Task.objects.create(title=f"Task {i}", column=self.column) for i in range(3)]
+        foreign_task = Task.objects.create(title="Foreign", column=self.foreign_column)
+
+        response = self.client.patch('/api/tasks/bulk/', [
+            {'id': task.id, 'column': self.done.id, 'status': 'done'} for task in tasks
+        ] + [{'id': foreign_task.id, 'status': 'done'}], format='json')
+
+        self.assertEqual([r['status'] for r in response.data], ['updated'] * 3 + ['error'])
+        self.assertEqual(Task.objects.filter(column=self.done, status='done').count(), 3)
+        self.assertEqual(ProjectStats.objects.get(project=self.project).status_done, 3)
+
+        response = self.client.delete('/api/tasks/bulk/', [tasks[0].id, foreign_task.id, 0], format='json')
+        self.assertEqual([r['status'] for r in response.data], ['deleted', 'error', 'error'])
+        self.assertTrue(Task.objects.filter(pk=foreign_task.id).exists())
+        self.assertEqual(ProjectStats.objects.get(project=self.project).task_count, 2)
+
+    def test_bulk_update_writes_only_item_fields(self):
+        """элемент пишет только свои поля - остальные (в том числе position) не перезаписываются"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        first, second = [Task.objects.create(title=f"Task {i}", column=self.column) for i in range(2)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch('/api/tasks/bulk/', [
+                {'id': first.id, 'title': "Renamed"},
+                {'id': second.id, 'column': self.done.id, 'status': 'done'},
+            ], format='json')
+        self.assertEqual([r['status'] for r in response.data], ['updated', 'updated'])
+
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "tasks_task"')]
+        self.assertEqual(len(updates), 2)
+        renamed = next(sql for sql in updates if '"title"' in sql)
+        for column in ('"status"', '"column_id"', '"position"'):
+            self.assertNotIn(column, renamed)
+        self.assertEqual(Task.objects.get(pk=second.id).column, self.done)
+
+    def test_bulk_requires_second_factor(self):
+        """без второго фактора массовые операции запрещены"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post('/api/tasks/bulk/', [{'title': "Task", 'column': self.column.id}], format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class MoveTests(TestCase):
+    """перетаскивание колонок и задач"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        grant_second_factor(self.client)
+
+        self.project = Project.objects.create(name="Project", user=self.user)
+        self.columns = [Column.objects.create(name=f"Column {i}", project=self.project, order=(i + 1) * 1024) for i in range(3)]
+
+    def board(self):
+        return list(Column.objects.filter(project=self.project).order_by('order', 'id').values_list('id', flat=True))
+
+    def test_column_move_is_single_update(self):
+        """перенос колонки в середину - одна UPDATE-строка"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        first, second, third = self.columns
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/api/columns/{third.id}/move/', {'after': first.id}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['renumbered'])
+        self.assertEqual(self.board(), [first.id, third.id, second.id])
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "tasks_column"')]
+        self.assertEqual(len(updates), 1)
+
+        self.client.post(f'/api/columns/{second.id}/move/', {'after': None}, format='json')
+        self.assertEqual(self.board(), [second.id, first.id, third.id])
+
+    def test_column_list_in_board_order(self):
+        """/api/columns/ отдает колонки в порядке доски, в том числе постранично"""
+        first, second, third = self.columns
+        self.client.post(f'/api/columns/{third.id}/move/', {'after': None}, format='json')
+
+        response = self.client.get(f'/api/columns/?project_id={self.project.id}&page_size=2')
+        ids = [column['id'] for column in response.data['results']]
+        response = self.client.get(response.data['next'])
+        ids += [column['id'] for column in response.data['results']]
+        self.assertEqual(ids, [third.id, first.id, second.id])
+
+    def test_renumber_when_gap_is_exhausted(self):
+        """без места между соседями колонки перенумеровываются"""
+        first, second, third = self.columns
+        Column.objects.filter(pk=second.pk).update(order=first.order + 1)
+
+        response = self.client.post(f'/api/columns/{third.id}/move/', {'after': first.id}, format='json')
+        self.assertTrue(response.data['renumbered'])
+        self.assertEqual(self.board(), [first.id, third.id, second.id])
+
+    def test_task_move_between_columns(self):
+        """задача встает в другую колонку после указанной задачи"""
+        source, target, _ = self.columns
+        created = self.client.post('/api/tasks/', {'title': "Moved", 'column': source.id}, format='json')
+        self.assertEqual(created.status_code, 201)
+        task = Task.objects.get(pk=created.data['id'])
+        top = Task.objects.create(title="Top", column=target, position=1024)
+        bottom = Task.objects.create(title="Bottom", column=target, position=2048)
+
+        response = self.client.post(f'/api/tasks/{task.id}/move/', {'column': target.id, 'after': top.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['column'], target.id)
+
+        order = list(Task.objects.filter(column=target).order_by('position').values_list('id', flat=True))
+        self.assertEqual(order, [top.id, task.id, bottom.id])
+
+        foreign = Project.objects.create(name="Foreign", user=self.user)
+        foreign_column = Column.objects.create(name="Column", project=foreign)
+        response = self.client.post(f'/api/tasks/{task.id}/move/', {'column': foreign_column.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchTests(TestCase):
+    """полнотекстовый поиск по задачам и комментариям"""
+
+    def setUp(self):
+        from tasks.search import install_search_schema
+        # тесты идут без миграций, поэтому индекс и триггеры ставим сами
+        install_search_schema()
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        project = Project.objects.create(name="Project", user=self.user)
+        other = Project.objects.create(name="Other", user=self.user)
+        column = Column.objects.create(name="Column", project=project)
+        other_column = Column.objects.create(name="Column", project=other)
+
+        self.title_hit = Task.objects.create(title="Deploy <b>release</b>", description="notes", column=column)
+        self.body_hit = Task.objects.create(title="Notes", description="prepare the release checklist", column=column)
+        self.foreign = Task.objects.create(title="Release elsewhere", column=other_column)
+        self.comment = Comment.objects.create(task=self.body_hit, user=self.user, text="release is blocked")
+
+    def test_ranked_and_highlighted(self):
+        response = self.client.get('/api/search/', {'q': 'releas'})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+
+        self.assertEqual(len(results), 4)
+        # совпадение в заголовке весит больше, чем в тексте
+        self.assertIn(results[0]['id'], {self.title_hit.id, self.foreign.id})
+        self.assertEqual(results[0]['kind'], 'task')
+        hit = next(r for r in results if r['kind'] == 'task' and r['id'] == self.title_hit.id)
+        self.assertEqual(hit['title'], "Deploy &lt;b&gt;<mark>release</mark>&lt;/b&gt;")
+
+        comment = next(r for r in results if r['kind'] == 'comment')
+        self.assertEqual(comment['task_id'], self.body_hit.id)
+        self.assertEqual(comment['task_title'], "Notes")
+        self.assertIn("<mark>release</mark>", comment['snippet'])
+
+    def test_filters_and_sync(self):
+        project_id = self.title_hit.column.project_id
+        response = self.client.get('/api/search/', {'q': 'release', 'project_id': project_id, 'kind': 'task'})
+        self.assertEqual({r['id'] for r in response.data['results']}, {self.title_hit.id, self.body_hit.id})
+
+        # индекс обновляют триггеры, в том числе для update() мимо сигналов
+        Task.objects.filter(pk=self.title_hit.pk).update(title="Deploy build")
+        self.comment.delete()
+        response = self.client.get('/api/search/', {'q': 'release', 'project_id': project_id})
+        self.assertEqual([r['id'] for r in response.data['results']], [self.body_hit.id])
+
+        self.assertEqual(self.client.get('/api/search/', {'q': ''}).status_code, 400)
+
+
+class FeedTests(TestCase):
+    """лента изменений: дельты доходят только до подписчиков своего проекта"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(name="Project", user=self.user)
+        self.other = Project.objects.create(name="Other", user=self.user)
+        self.column = Column.objects.create(name="Column", project=self.project)
+
+    def test_changes_reach_project_subscribers(self):
+        import asyncio
+        from tasks.feed import broker
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        async def subscribe(project_ids):
+            return broker.subscribe(project_ids)
+
+        mine = loop.run_until_complete(subscribe([self.project.id]))
+        foreign = loop.run_until_complete(subscribe([self.other.id]))
+        self.addCleanup(broker.unsubscribe, [self.project.id], mine)
+        self.addCleanup(broker.unsubscribe, [self.other.id], foreign)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.create(title="Live", column=self.column)
+        with self.captureOnCommitCallbacks(execute=True):
+            task.delete()
+        # кадры кладутся через call_soon_threadsafe, даем loop их разобрать
+        loop.run_until_complete(asyncio.sleep(0))
+
+        frames = [mine[1].get_nowait(), mine[1].get_nowait()]
+        self.assertIn("event: task.created", frames[0])
+        self.assertIn('"title": "Live"', frames[0])
+        self.assertIn("event: task.deleted", frames[1])
+        self.assertTrue(foreign[1].empty())
+
+    def test_requires_asgi(self):
+        response = self.client.get('/api/feed/', {'project': self.project.id})
+        self.assertEqual(response.status_code, 501)
+        self.assertEqual(self.client.get('/api/feed/', {'project': 999999}).status_code, 400)
+
+
+class SyncTests(TransactionTestCase):
+    """/api/sync/ отдает только изменения после версии и id удаленных строк.
+    без общей транзакции теста: на PostgreSQL номер изменения - id транзакции"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        grant_second_factor(self.client)
+        self.project = Project.objects.create(name="Project", user=self.user)
+        self.column = Column.objects.create(name="Column", project=self.project)
+        self.task = Task.objects.create(title="Old", column=self.column)
+
+    def sync(self, **params):
+        response = self.client.get('/api/sync/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_changes_since(self):
+        start = self.sync()
+        self.assertTrue(start['reset'])
+
+        fresh = Task.objects.create(title="Fresh", column=self.column)
+        self.client.patch(f'/api/tasks/{self.task.id}/', {'title': "Renamed"}, format='json')
+        Comment.objects.create(task=fresh, user=self.user, text="hi")
+        doomed = Task.objects.create(title="Doomed", column=self.column)
+        doomed_id = doomed.id
+        doomed.delete()
+
+        delta = self.sync(since=start['version'])
+        self.assertFalse(delta['reset'])
+        self.assertGreater(delta['version'], start['version'])
+        self.assertEqual([t['title'] for t in delta['changes']['tasks']], ["Fresh", "Renamed"])
+        self.assertEqual(len(delta['changes']['comments']), 1)
+        self.assertEqual(delta['changes']['projects'], [])
+        self.assertEqual(delta['deleted'], {'tasks': [doomed_id]})
+
+        # перемещение и bulk-запись идут мимо save(), но версию тоже двигают
+        self.client.post(f'/api/tasks/{fresh.id}/move/', {'after': None}, format='json')
+        self.client.patch('/api/tasks/bulk/', [{'id': self.task.id, 'status': 'done'}], format='json')
+        moved = self.sync(since=delta['version'])
+        self.assertEqual({t['id'] for t in moved['changes']['tasks']}, {fresh.id, self.task.id})
+
+        self.assertEqual(self.sync(since=moved['version'])['changes']['tasks'], [])
+
+        comment_id = fresh.comment_set.get().id
+        self.client.delete('/api/tasks/bulk/', [fresh.id], format='json')
+        removed = self.sync(since=moved['version'])
+        self.assertEqual(removed['deleted'], {'tasks': [fresh.id], 'comments': [comment_id]})
+
+    def test_version_waits_for_open_transaction(self):
+        """номер не уходит дальше незакоммиченной транзакции, даже если более поздняя уже закоммичена"""
+        import threading
+        from django.db import connection, transaction
+
+        if connection.vendor != 'postgresql':
+            self.skipTest("на SQLite запись и так идет по одной")
+        # другой проект: счетчики проекта - общая строка, которую держала бы медленная транзакция
+        other = Column.objects.create(name="Column", project=Project.objects.create(name="Other", user=self.user))
+        start = self.sync()
+        began, release = threading.Event(), threading.Event()
+
+        def slow_writer():
+            try:
+                with transaction.atomic():
+                    Task.objects.create(title="Slow", column=other)
+                    began.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=slow_writer)
+        thread.start()
+        began.wait(10)
+        Task.objects.create(title="Fast", column=self.column)
+        blocked = self.sync(since=start['version'])
+        release.set()
+        thread.join()
+
+        self.assertEqual(blocked['changes']['tasks'], [])
+        delta = self.sync(since=blocked['version'])
+        self.assertEqual(sorted(t['title'] for t in delta['changes']['tasks']), ["Fast", "Slow"])
+
+    def test_reset_after_purge(self):
+        from tasks.sync import purge_tombstones
+
+        version = self.sync()['version']
+        self.task.delete()
+        purge_tombstones(timezone.now() + timedelta(seconds=1))
+        self.assertTrue(self.sync(since=version)['reset'])
+
+
+class SecondFactorTests(TestCase):
+    """вторая ступень - подписанная кука с тем же сроком в 10 минут"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(name="Project", user=self.user)
+
+    def test_grant_expire_and_logout(self):
+        from django.conf import settings
+
+        self.assertEqual(self.client.patch(f'/api/projects/{self.project.id}/', {'name': "X"}).status_code, 403)
+
+        grant_second_factor(self.client)
+        me = self.client.get('/api/users/me/').data
+        self.assertTrue(me['second'])
+        self.assertAlmostEqual(me['second_expire'], timezone.now().timestamp() + 600, delta=5)
+        self.assertEqual(self.client.patch(f'/api/projects/{self.project.id}/', {'name': "X"}).status_code, 200)
+
+        token = self.client.cookies[settings.SECOND_FACTOR_COOKIE].value
+        self.client.cookies[settings.SECOND_FACTOR_COOKIE] = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+        self.assertFalse(self.client.get('/api/users/me/').data['second'])
+        self.client.cookies[settings.SECOND_FACTOR_COOKIE] = token
+
+        with self.settings(SECOND_FACTOR_TTL=0):
+            self.assertEqual(self.client.patch(f'/api/projects/{self.project.id}/', {'name': "Y"}).status_code, 403)
+
+        self.client.post('/api/users/logout/')
+        self.assertEqual(self.client.cookies[settings.SECOND_FACTOR_COOKIE].value, '')
+
+
+class MetricsTests(TestCase):
+    """Server-Timing, гистограммы на /metrics и лог запросов с лишними обращениями к БД"""
+
+    def setUp(self):
+        from tasks.metrics import registry
+
+        registry.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        project = Project.objects.create(name="Project", user=self.user)
+        Column.objects.create(name="Column", project=project)
+
+    def test_server_timing_and_histograms(self):
+        response = self.client.get('/api/columns/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="[1-9]\d* queries"$')
+
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            metrics = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', metrics)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="column-list",status="200"} 1', metrics)
+        self.assertIn('http_request_db_queries_bucket{method="GET",route="column-list",le="+Inf"} 1', metrics)
+        self.assertIn(f'http_response_size_bytes_sum{{method="GET",route="column-list"}} {len(response.content)}', metrics)
+
+    def test_logs_requests_over_query_threshold(self):
+        from django.test import override_settings
+
+        with override_settings(METRICS_QUERY_THRESHOLD=0), self.assertLogs('tasks.metrics', 'WARNING') as logs:
+            self.client.get('/api/columns/')
+        self.assertIn('/api/columns/ (column-list)', logs.output[0])
+
+        with self.assertNoLogs('tasks.metrics', 'WARNING'):
+            self.client.get('/api/columns/')
+
+
+class ThumbnailTests(TestCase):
+    """превью картинок: делаются после commit, лежат по хешу и отдаются с долгим кешем"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test import override_settings
+
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=Path(media), THUMBNAIL_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        grant_second_factor(self.client)
+        project = Project.objects.create(name="Project", user=self.user)
+        self.column = Column.objects.create(name="Column", project=project)
+        self.media = Path(media)
+
+    def image(self, name):
+        import io
+        from PIL import Image
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 1200), (200, 40, 40)).save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_upload_generates_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/tasks/', {
+                'title': "Task", 'column': self.column.id, 'picture': self.image('a.png'),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertIsNone(response.data['picture_thumbnails'])
+
+        task = self.client.get(f"/api/tasks/{response.data['id']}/").data
+        thumbnails = task['picture_thumbnails']
+        self.assertEqual(set(thumbnails), {'small', 'medium'})
+        self.assertTrue(thumbnails['small']['webp'].endswith('/small.webp'))
+
+        path = thumbnails['medium']['webp'].split('/media/', 1)[1]
+        response = self.client.get(f"/media/{path}")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+        from PIL import Image
+        with Image.open(self.media / path) as image:
+            self.assertEqual(image.size, (640, 480))
+
+    def test_same_content_shares_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.create(title="Task", column=self.column, picture=self.image('a.png'))
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = Comment.objects.create(task=task, text="Comment", picture=self.image('b.png'))
+        task.refresh_from_db()
+        comment.refresh_from_db()
+
+        self.assertTrue(task.picture_digest)
+        self.assertEqual(task.picture_digest, comment.picture_digest)
+        self.assertEqual(len(list((self.media / 'thumbs').rglob('*.*'))), 4)
+
+        task.picture = None
+        task.save()
+        self.assertEqual(task.picture_digest, "")
+
+
+class MediaTests(TestCase):
+    """раздача MEDIA_ROOT: условный GET, Range и передача файла прокси"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test import override_settings
+
+        media = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        (media / 'tasks').mkdir()
+        (media / 'tasks' / 'file.png').write_bytes(bytes(range(256)) * 4)
+
+    def test_etag_and_range(self):
+        response = self.client.get('/media/tasks/file.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(256)) * 4)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        etag = response['ETag']
+
+        response = self.client.get('/media/tasks/file.png', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/media/tasks/file.png', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+        response = self.client.get('/media/tasks/file.png', HTTP_RANGE='bytes=-6')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(250, 256)))
+
+        # If-Range со старой версией - весь файл
+        response = self.client.get('/media/tasks/file.png', HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/media/tasks/file.png', HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(self.client.get('/media/../app/settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/tasks/missing.png').status_code, 404)
+
+    def test_accel_redirect(self):
+        from django.test import override_settings
+
+        with override_settings(MEDIA_ACCEL='nginx'):
+            response = self.client.get('/media/tasks/file.png')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/tasks/file.png')
+        self.assertEqual(response.content, b'')
+        self.assertIn('ETag', response)
+
+        with override_settings(MEDIA_ACCEL='apache'):
+            response = self.client.get('/media/tasks/file.png')
+        self.assertTrue(response['X-Sendfile'].endswith('tasks/file.png'))
+
+
+class TimeReportTests(TestCase):
+    """отчет по учету времени: итоги прошедших дней + вживую сегодняшние и незакрытые"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other = User.objects.create_user(username='other')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(name="Project", user=self.user)
+        column = Column.objects.create(name="Column", project=self.project)
+        self.task = Task.objects.create(title="Task", column=column)
+        self.second = Task.objects.create(title="Second", column=column)
+
+        today = timezone.localdate()
+        self.today = today
+        at = lambda days_ago, hour: timezone.make_aware(
+            timezone.datetime.combine(today - timedelta(days=days_ago), timezone.datetime.min.time())
+        ) + timedelta(hours=hour)
+        TimeTracking.objects.create(task=self.task, user=self.user, start_time=at(3, 9), end_time=at(3, 11))
+        TimeTracking.objects.create(task=self.task, user=self.other, start_time=at(3, 12), end_time=at(3, 13))
+        self.entry = TimeTracking.objects.create(task=self.second, user=self.user, start_time=at(1, 9), end_time=at(1, 10))
+        # незакрытая запись: считается до текущего момента
+        TimeTracking.objects.create(task=self.second, user=self.user, start_time=timezone.now() - timedelta(hours=1))
+
+    def report(self, **params):
+        response = self.client.get('/api/timetracking/report/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_groups_and_open_entries(self):
+        from .models import TimeRollup
+
+        data = self.report(group_by=['user'])
+        rows = {row['user_name']: row for row in data['rows']}
+        self.assertEqual(rows['other']['seconds'], 3600)
+        self.assertAlmostEqual(rows['testuser']['seconds'], 4 * 3600, delta=5)
+        self.assertEqual(data['entries'], 4)
+        # закрытые прошедшие дни свернуты в итоги
+        self.assertEqual(TimeRollup.objects.count(), 3)
+
+        data = self.report(group_by=['project', 'task'], period='day')
+        by_day = {(row['period'], row['task_title']): row['seconds'] for row in data['rows']}
+        self.assertEqual(by_day[(self.today - timedelta(days=3), "Task")], 3 * 3600)
+        self.assertEqual(by_day[(self.today - timedelta(days=1), "Second")], 3600)
+        self.assertEqual({row['project_name'] for row in data['rows']}, {"Project"})
+
+        data = self.report(user_id=self.other.id)
+        self.assertEqual(data['rows'], [{'seconds': 3600, 'entries': 1}])
+
+    def test_edit_invalidates_rollup(self):
+        self.report()
+        self.entry.end_time = self.entry.start_time + timedelta(hours=5)
+        self.entry.save()
+        data = self.report(task_id=self.second.id, start=self.today - timedelta(days=1), end=self.today - timedelta(days=1))
+        self.assertEqual(data['total_seconds'], 5 * 3600)
+
+        self.entry.delete()
+        data = self.report(task_id=self.second.id, start=self.today - timedelta(days=1), end=self.today - timedelta(days=1))
+        self.assertEqual(data['total_seconds'], 0)
+
+        response = self.client.get('/api/timetracking/report/', {'start': '2020-01-01', 'end': '2026-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(API_CACHE=True)
+class BoardTests(TestCase):
+    """/api/projects/<id>/board/: колонки с задачами за фиксированное число запросов"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(name="Project", user=self.user)
+        self.seed(2)
+
+    def seed(self, n):
+        for i in range(n):
+            column = Column.objects.create(name=f"Column {i}", project=self.project, order=i)
+            assignee = User.objects.create_user(username=f'assignee{Task.objects.count()}')
+            task = Task.objects.create(title=f"Task {i}", column=column, creator=self.user, assignee=assignee, due_date=timezone.localdate())
+            Task.objects.create(title=f"Empty {i}", column=column)
+            Comment.objects.create(task=task, text="Comment", user=assignee)
+            Comment.objects.create(task=task, text="Comment", user=self.user)
+        Task.objects.filter(title="Task 0").update(picture='tasks/board.png', picture_digest='ab' * 32)
+
+    def board(self, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(f'/api/projects/{self.project.id}/board/')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_and_task_format(self):
+        """проект, колонки, задачи, счетчики комментариев - и при 2, и при 12 колонках"""
+        data = self.board(4).json()
+        self.assertEqual([column['name'] for column in data['columns']], ["Column 0", "Column 1"])
+        self.assertEqual([len(column['tasks']) for column in data['columns']], [2, 2])
+
+        # задача на доске - то же, что отдает /api/tasks/<id>/, плюс число комментариев
+        for task in data['columns'][0]['tasks']:
+            expected = self.client.get(f"/api/tasks/{task['id']}/").json()
+            del expected['column_name']
+            self.assertEqual({**expected, 'comment_count': 2 if task['title'] == "Task 0" else 0}, task)
+
+        self.seed(10)
+        data = self.board(4).json()
+        self.assertEqual(len(data['columns']), 12)
+
+    def test_not_modified(self):
+        response = self.board(4)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/projects/{self.project.id}/board/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Comment.objects.create(task=Task.objects.first(), text="New", user=self.user)
+        response = self.board(4)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class FastPathTests(TestCase):
+    """списки из values() (rows.py) и FastJSONRenderer отдают то же, что сериализаторы и JSONRenderer"""
+
+    endpoints = [
+        '/api/tasks/', '/api/tasks/?fields=id,title,creator_name', '/api/tasks/?omit=description,picture',
+        '/api/comments/', '/api/timetracking/', '/api/columns/', '/api/projects/', '/api/users/',
+        '/api/tasks/?expand=column',
+    ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        project = Project.objects.create(name="Проект", user=self.user)
+        column = Column.objects.create(name="Колонка", project=project)
+        task = Task.objects.create(title="Задача\u2028", column=column, creator=self.user, assignee=self.user, due_date=timezone.localdate())
+        Task.objects.create(title="Без создателя", column=column)
+        Task.objects.filter(pk=task.pk).update(picture='tasks/fast.png', picture_digest='cd' * 32)
+        Comment.objects.create(task=task, text="Комментарий", user=self.user)
+        TimeTracking.objects.create(task=task, user=self.user, start_time=timezone.now() - timedelta(hours=1), end_time=timezone.now())
+        TimeTracking.objects.create(task=task, user=self.user, start_time=timezone.now())
+
+    def test_lists_match_serializers(self):
+        from unittest import mock
+        from django.core.cache import cache
+        from .rows import compile_rows
+        from .serializers import TaskSerializer, CommentSerializer, TimeTrackingSerializer, ColumnSerializer, ProjectSerializer, UserProfileSerializer
+
+        for serializer in (TaskSerializer, CommentSerializer, TimeTrackingSerializer, ColumnSerializer, ProjectSerializer, UserProfileSerializer):
+            self.assertIsNotNone(compile_rows(serializer()), serializer.__name__)
+        self.assertIsNone(compile_rows(TaskSerializer(expand=['column'])))
+
+        for endpoint in self.endpoints:
+            cache.clear()
+            fast = self.client.get(endpoint)
+            cache.clear()
+            with mock.patch('tasks.mixins.compile_rows', return_value=None):
+                slow = self.client.get(endpoint)
+            self.assertEqual(fast.status_code, 200, endpoint)
+            self.assertEqual(fast.content, slow.content, endpoint)
+
+    def test_renderer_matches_drf(self):
+        from decimal import Decimal
+        from unittest import mock
+        from django.utils.translation import gettext_lazy
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import FastJSONRenderer
+
+        data = {
+            'now': timezone.now(), 'today': timezone.localdate(), 'spent': timedelta(minutes=5),
+            'price': Decimal('1.50'), 'lazy': gettext_lazy("Задача"), 'text': "строка\u2028\u2029",
+            'big': 2 ** 70, 'nested': [{1: None, 'ok': True}, (1.5, 'x')],
+        }
+        expected = JSONRenderer().render(data)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        with mock.patch('tasks.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+
+        indented = FastJSONRenderer().render(data, 'application/json; indent=2')
+        self.assertEqual(indented, JSONRenderer().render(data, 'application/json; indent=2'))
+
+
+def async_urlconf():
+    """маршруты API с вьюсетами, собранными как под ASGI (ASYNC_API = True)"""
+    from types import ModuleType
+    from django.test import override_settings
+    from django.urls import include, path
+    from rest_framework.routers import DefaultRouter
+    from app.urls import router
+
+    async_router = DefaultRouter()
+    with override_settings(ASYNC_API=True):
+        for prefix, viewset, basename in router.registry:
+            async_router.register(prefix, viewset, basename=basename)
+        patterns = async_router.urls
+    urlconf = ModuleType('async_urls')
+    urlconf.urlpatterns = [path('api/', include(patterns))]
+    return urlconf
+
+
+class AsyncApiTests(TestCase):
+    """корутины вьюсетов (alist, aretrieve, aget_stats, aboard...) отдают то же, что обычные действия DRF"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.project = Project.objects.create(name="Проект", user=self.user)
+        self.column = Column.objects.create(name="Колонка", project=self.project)
+        self.task = Task.objects.create(title="Задача", column=self.column, creator=self.user, priority='high')
+        Task.objects.create(title="Без создателя", column=self.column, status='done')
+        Comment.objects.create(task=self.task, text="Комментарий", user=self.user)
+        self.urlconf = async_urlconf()
+
+    async def test_matches_sync_views(self):
+        from asgiref.sync import sync_to_async
+        from django.core.cache import cache
+        from django.test import override_settings
+
+        endpoints = [
+            '/api/tasks/', f'/api/tasks/{self.task.pk}/', '/api/tasks/?expand=column', '/api/tasks/stats/',
+            f'/api/projects/{self.project.pk}/board/', f'/api/projects/{self.project.pk}/stats/',
+            '/api/columns/stats/', '/api/tasks/999999/',
+        ]
+        await self.async_client.aforce_login(self.user)
+        await sync_to_async(self.client.force_login)(self.user)
+        for endpoint in endpoints:
+            await sync_to_async(cache.clear)()
+            with override_settings(ROOT_URLCONF=self.urlconf):
+                fast = await self.async_client.get(endpoint)
+            await sync_to_async(cache.clear)()
+            slow = await sync_to_async(self.client.get)(endpoint)
+            self.assertEqual(fast.status_code, slow.status_code, endpoint)
+            self.assertEqual(fast.content, slow.content, endpoint)
+
+    async def test_export_streams_asynchronously(self):
+        from asgiref.sync import sync_to_async
+        from django.test import override_settings
+
+        await self.async_client.aforce_login(self.user)
+        with override_settings(ROOT_URLCONF=self.urlconf):
+            response = await self.async_client.get('/api/tasks/export-jsonl/')
+            self.assertTrue(response.is_async)
+            content = b''.join([chunk async for chunk in response.streaming_content])
+
+        await sync_to_async(self.client.force_login)(self.user)
+        sync = await sync_to_async(self.client.get)('/api/tasks/export-jsonl/')
+        self.assertFalse(sync.is_async)
+        self.assertEqual(content, await sync_to_async(b''.join)(sync.streaming_content))
+        self.assertEqual(len(content.splitlines()), 2)
+
+
+class JobTests(TestCase):
+    """фоновые задачи: постановка, воркер, результат и его срок хранения"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test import override_settings
+
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings = override_settings(JOB_RESULTS_ROOT=Path(root))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.project = Project.objects.create(name="Project", user=self.user)
+        column = Column.objects.create(name="Column", project=self.project)
+        task = Task.objects.create(title="Задача", column=column, creator=self.user)
+        Task.objects.create(title="Другой проект", column=Column.objects.create(
+            name="Column", project=Project.objects.create(name="Other", user=self.user)))
+        start = timezone.now() - timedelta(days=2)
+        TimeTracking.objects.create(task=task, user=self.user, start_time=start, end_time=start + timedelta(hours=2))
+
+    def run_job(self, response):
+        import io
+        from django.core.management import call_command
+
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertTrue(response['Location'].endswith(f"/api/jobs/{response.data['id']}/"))
+        self.assertEqual(response.data['status'], 'queued')
+        call_command('run_jobs', once=True, processes=0, stdout=io.StringIO())
+
+        job = self.client.get(response['Location']).data
+        self.assertEqual(job['status'], 'done', job['error'])
+        return job
+
+    def test_export_job(self):
+        """выгрузка воркером совпадает с потоковой, результат видит только владелец"""
+        response = self.client.post(f'/api/tasks/export-job/?project_id={self.project.id}', {'format': 'csv'})
+        job = self.run_job(response)
+
+        result = self.client.get(job['result_url'])
+        self.assertEqual(result.status_code, 200)
+        self.assertIn('tasks.csv', result['Content-Disposition'])
+        expected = self.client.get(f'/api/tasks/export-csv/?project_id={self.project.id}')
+        self.assertEqual(b''.join(result.streaming_content), b''.join(expected.streaming_content))
+
+        self.client.force_authenticate(user=User.objects.create_user(username='other'))
+        self.assertEqual(self.client.get(job['result_url']).status_code, 404)
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.post('/api/tasks/export-job/').status_code, 403)
+
+    def test_time_report_job(self):
+        """отчет воркером - те же байты, что и /api/timetracking/report/"""
+        params = f'group_by=project&start={timezone.localdate() - timedelta(days=7)}'
+        job = self.run_job(self.client.post(f'/api/timetracking/report-job/?{params}'))
+        self.assertEqual(job['summary']['total_seconds'], 2 * 3600)
+
+        result = self.client.get(job['result_url'])
+        expected = self.client.get(f'/api/timetracking/report/?{params}')
+        self.assertEqual(b''.join(result.streaming_content), expected.content)
+
+    def test_expired_jobs_purged(self):
+        """после срока хранения результат не отдается, а purge удаляет и строку, и файл"""
+        from . import jobs
+        from .models import Job
+
+        job = self.run_job(self.client.post('/api/projects/export-job/', {'format': 'jsonl'}))
+        row = Job.objects.get(pk=job['id'])
+        path = Path(row.result.path)
+        self.assertTrue(path.exists())
+
+        Job.objects.filter(pk=row.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.client.get(job['result_url']).status_code, 410)
+        self.assertEqual(jobs.purge_expired(), 1)
+        self.assertFalse(Job.objects.exists())
+        self.assertFalse(path.parent.exists())
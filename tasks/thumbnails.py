@@ -0,0 +1,160 @@
+"""превью для Task.picture и Comment.picture.
+
+после сохранения новой картинки (на commit) задача уходит в пул потоков: оригинал
+читается один раз, для каждого размера из THUMBNAIL_SIZES пишутся варианты во всех
+THUMBNAIL_FORMATS. варианты лежат по хешу содержимого, thumbs/ab/<sha256>/<размер>.<формат>,
+поэтому одинаковые загрузки делят одни и те же файлы, а уже готовые не пересчитываются.
+когда все готово, хеш записывается в picture_digest - до этого сериализатор отдает
+picture_thumbnails = null. по этому же хешу файлы неизменяемы и отдаются с долгим кешем.
+
+Pillow сжимает и кодирует без GIL, поэтому хватает потоков. THUMBNAIL_WORKERS = 0 -
+без пула, прямо в потоке запроса (для тестов). команда generate_thumbnails и фоновая
+задача thumbnails (jobs.py) проходят по необработанным картинкам сами - process_pending"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .caching import bump_version
+from .models import Comment, Task, next_version
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = "thumbs"
+
+SAVE_OPTIONS = {
+    "webp": {"format": "WEBP", "method": 4},
+    "jpeg": {"format": "JPEG", "optimize": True, "progressive": True},
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def variant_name(digest, size, fmt):
+    return f"{THUMBNAIL_DIR}/{digest[:2]}/{digest}/{size}.{fmt}"
+
+
+def variant_names(digest):
+    """{размер: {формат: путь в хранилище}}"""
+    return {
+        size: {fmt: variant_name(digest, size, fmt) for fmt in settings.THUMBNAIL_FORMATS}
+        for size in settings.THUMBNAIL_SIZES
+    }
+
+
+def render(image, side, fmt):
+    variant = image.copy()
+    variant.thumbnail((side, side), Image.Resampling.LANCZOS)
+    if fmt == "jpeg" and variant.mode not in ("RGB", "L"):
+        variant = variant.convert("RGB")
+    buffer = io.BytesIO()
+    variant.save(buffer, quality=settings.THUMBNAIL_QUALITY, **SAVE_OPTIONS[fmt])
+    return buffer.getvalue()
+
+
+def generate_variants(content):
+    """пишет недостающие варианты для байтов оригинала, возвращает хеш"""
+    digest = hashlib.sha256(content).hexdigest()
+    missing = [
+        (side, fmt, variant_name(digest, size, fmt))
+        for size, side in settings.THUMBNAIL_SIZES.items()
+        for fmt in settings.THUMBNAIL_FORMATS
+        if not default_storage.exists(variant_name(digest, size, fmt))
+    ]
+    if not missing:
+        return digest
+
+    with Image.open(io.BytesIO(content)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.load()
+        for side, fmt, name in missing:
+            # при гонке двух одинаковых загрузок storage.save даст второму файлу
+            # другое имя - лишний файл, но ссылки по хешу ведут на первый
+            default_storage.save(name, ContentFile(render(image, side, fmt)))
+    return digest
+
+
+def process(model, pk, name):
+    """превью для картинки name строки pk. если картинку успели заменить, хеш не пишется -
+    новая картинка поставит свою задачу"""
+    try:
+        with default_storage.open(name, "rb") as f:
+            content = f.read()
+        digest = generate_variants(content)
+        with transaction.atomic():
+            updated = model.objects.filter(pk=pk, picture=name).update(
+                picture_digest=digest, version=next_version()
+            )
+        if updated:
+            bump_version(model)
+    except Exception:
+        logger.exception("не удалось сделать превью для %s %s (%s)", model._meta.model_name, pk, name)
+
+
+def process_in_pool(model, pk, name):
+    try:
+        process(model, pk, name)
+    finally:
+        close_old_connections()
+
+
+def process_pending(everything=False):
+    """превью для картинок без них (everything - для всех картинок) прямо в этом потоке,
+    для команды generate_thumbnails и фоновой задачи. {модель: сколько обработано}"""
+    counts = {}
+    for model in (Task, Comment):
+        qs = model.objects.exclude(picture='').exclude(picture=None)
+        if not everything:
+            qs = qs.filter(picture_digest='')
+        count = 0
+        for pk, name in qs.order_by('pk').values_list('pk', 'picture').iterator():
+            process(model, pk, name)
+            count += 1
+        counts[model._meta.model_name] = count
+    return counts
+
+
+def pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(settings.THUMBNAIL_WORKERS, thread_name_prefix="thumbnails")
+        return _pool
+
+
+def schedule(model, pk, name):
+    if settings.THUMBNAIL_WORKERS:
+        pool().submit(process_in_pool, model, pk, name)
+    else:
+        process(model, pk, name)
+
+
+def picture_uploaded(instance):
+    """новый файл, еще не записанный в хранилище (загрузка из формы/DRF или присвоение File)"""
+    value = instance.__dict__.get("picture")
+    return isinstance(value, File) and not getattr(value, "_committed", False)
+
+
+def reset_digest(sender, instance, raw=False, **kwargs):
+    """pre_save: превью старой картинки к новой не подходят"""
+    if raw:
+        return
+    instance._picture_uploaded = picture_uploaded(instance)
+    if instance._picture_uploaded or ("picture" in instance.__dict__ and not instance.picture):
+        instance.picture_digest = ""
+
+
+def schedule_on_save(sender, instance, raw=False, **kwargs):
+    if raw or not getattr(instance, "_picture_uploaded", False):
+        return
+    instance._picture_uploaded = False
+    name = instance.picture.name
+    transaction.on_commit(lambda: schedule(sender, instance.pk, name))
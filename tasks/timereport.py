@@ -0,0 +1,230 @@
+"""отчет по учету времени: /api/timetracking/report/.
+
+длительность считается в БД (end_time - start_time) и относится ко дню начала
+записи. незакрытая запись (end_time = null) считается до текущего момента.
+
+прошедшие дни не меняются, поэтому закрытые записи за них сворачиваются в
+TimeRollup - итог за (день, задача, пользователь) - при первом отчете, которому
+этот день нужен. готовые дни отмечены в TimeRollupDay, и отчет за год читает
+несколько тысяч строк итогов, а не все записи. вживую по сырым записям
+считаются только сегодняшние и незакрытые.
+
+изменение или удаление записи за прошедший день сбрасывает итоги этого дня
+(invalidate_on_save/invalidate_on_delete), следующий отчет посчитает его заново.
+сброс и подсчет берут одну блокировку (lock_rollups): иначе на Postgres отчет мог
+прочитать записи до коммита правки и сохранить итог уже после ее сброса.
+итоги по проекту берутся через задачу в момент отчета, так что перенос задачи
+в другой проект итогов не портит. удаление задачи или пользователя удаляет
+их итоги каскадом"""
+import threading
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, DateField, DateTimeField, DurationField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, Trunc, TruncDate
+from django.utils import timezone
+
+from .models import TimeRollup, TimeRollupDay, TimeTracking
+
+GROUPS = {
+    # ключ группировки -> (поле id, поле названия) относительно строки TimeTracking/TimeRollup
+    "user": ("user_id", "user__username"),
+    "task": ("task_id", "task__title"),
+    "project": ("task__column__project_id", "task__column__project__name"),
+}
+GROUP_LABELS = {"user": ("user_id", "user_name"), "task": ("task_id", "task_title"), "project": ("project_id", "project_name")}
+
+# номер для pg_advisory_xact_lock: два отчета не считают один и тот же день одновременно,
+# а сброс итогов ждет, пока идущий подсчет закоммитится
+ROLLUP_LOCK = 0x71_6D_65_72
+
+# дни, сброс которых отложен до конца массовой записи (defer_invalidation)
+_deferred = threading.local()
+
+
+def lock_rollups():
+    """держится до конца текущей транзакции. на SQLite запись и так идет по одной"""
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [ROLLUP_LOCK])
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def seconds(duration):
+    return int(duration.total_seconds()) if duration else 0
+
+
+def build_rollups(start, end, today):
+    """итоги за прошедшие дни [start, end], которых еще нет. возвращает, сколько дней посчитано"""
+    last = min(end, today - timedelta(days=1))
+    if start > last:
+        return 0
+
+    def missing_days():
+        built = set(TimeRollupDay.objects.filter(day__range=(start, last)).values_list("day", flat=True))
+        return [start + timedelta(days=i) for i in range((last - start).days + 1) if start + timedelta(days=i) not in built]
+
+    if not missing_days():
+        return 0
+
+    with transaction.atomic():
+        lock_rollups()
+        missing = missing_days()
+        if not missing:
+            return 0
+
+        duration = ExpressionWrapper(F("end_time") - F("start_time"), output_field=DurationField())
+        rows = (
+            TimeTracking.objects
+            .filter(end_time__isnull=False, start_time__gte=day_start(missing[0]), start_time__lt=day_start(missing[-1] + timedelta(days=1)))
+            .annotate(day=TruncDate("start_time"))
+            .values("day", "task_id", "user_id")
+            .annotate(total=Sum(duration), entries=Count("id"))
+            .order_by()
+        )
+        wanted = set(missing)
+        rollups = [
+            TimeRollup(day=row["day"], task_id=row["task_id"], user_id=row["user_id"], seconds=seconds(row["total"]), entries=row["entries"])
+            for row in rows if row["day"] in wanted
+        ]
+        TimeRollup.objects.bulk_create(rollups, batch_size=1000)
+        TimeRollupDay.objects.bulk_create([TimeRollupDay(day=day) for day in missing], batch_size=1000)
+    return len(missing)
+
+
+def defer_invalidation():
+    """дальше invalidate_days только копит дни - до deferred_days() (bulk_write)"""
+    _deferred.days = set()
+
+
+def deferred_days():
+    """накопленные дни; откладывать больше не нужно"""
+    days, _deferred.days = getattr(_deferred, "days", None), None
+    return days or set()
+
+
+def invalidate_days(days):
+    # итоги бывают только у прошедших дней
+    today = timezone.localdate()
+    days = {day for day in days if day is not None and day < today}
+    pending = getattr(_deferred, "days", None)
+    if pending is not None:
+        pending |= days
+        return
+    if days:
+        # блокировка держится до коммита правки: подсчет, начатый после сброса,
+        # дождется его и увидит новые записи, а начатый раньше успеет закоммититься и будет сброшен
+        with transaction.atomic():
+            lock_rollups()
+            TimeRollup.objects.filter(day__in=days).delete()
+            TimeRollupDay.objects.filter(day__in=days).delete()
+
+
+def invalidate_all():
+    """после записи мимо сигналов (bulk_create в generate_data и т.п.)"""
+    with transaction.atomic():
+        lock_rollups()
+        TimeRollup.objects.all().delete()
+        TimeRollupDay.objects.all().delete()
+
+
+def entry_day(start_time):
+    return timezone.localdate(start_time) if start_time else None
+
+
+def remember_day(sender, instance, raw=False, **kwargs):
+    """pre_save: день начала до изменения - запись могли перенести на другой день"""
+    if raw or instance._state.adding or instance.pk is None:
+        instance._rollup_day = None
+        return
+    old = TimeTracking.objects.filter(pk=instance.pk).values_list("start_time", flat=True).first()
+    instance._rollup_day = entry_day(old)
+
+
+def invalidate_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_days([getattr(instance, "_rollup_day", None), entry_day(instance.start_time)])
+
+
+def invalidate_on_delete(sender, instance, **kwargs):
+    invalidate_days([entry_day(instance.start_time)])
+
+
+def scoped(qs, filters):
+    if filters.get("user_id"):
+        qs = qs.filter(user_id=filters["user_id"])
+    if filters.get("task_id"):
+        qs = qs.filter(task_id=filters["task_id"])
+    if filters.get("project_id"):
+        qs = qs.filter(task__column__project_id=filters["project_id"])
+    return qs
+
+
+def grouped(qs, period_expression, group_by):
+    """values() по периоду и группам. возвращает выборку и (поле выборки, поле ответа)"""
+    fields = [
+        (source, label)
+        for key in group_by
+        for source, label in zip(GROUPS[key], GROUP_LABELS[key])
+    ]
+    if period_expression is not None:
+        qs = qs.annotate(period=period_expression)
+        fields.insert(0, ("period", "period"))
+    return qs.values(*[source for source, _ in fields]).order_by(), fields
+
+
+def sort_key(row):
+    """по периоду и id групп, строки без пользователя - в конце своей группы"""
+    return tuple(
+        (value is None, value if value is not None else 0)
+        for field, value in row.items() if field == "period" or field.endswith("_id")
+    )
+
+
+def report(start, end, group_by, period=None, filters=None):
+    """строки {period?, <группы>, seconds, entries} и итоги за [start, end] (даты включительно)"""
+    filters = filters or {}
+    now = timezone.now()
+    today = timezone.localdate(now)
+    build_rollups(start, end, today)
+
+    # прошедшие дни - из итогов
+    rollups = scoped(TimeRollup.objects.filter(day__range=(start, end)), filters)
+    rollups, fields = grouped(rollups, Trunc("day", period, output_field=DateField()) if period else None, group_by)
+    rollups = rollups.annotate(total_seconds=Sum("seconds"), total_entries=Sum("entries"))
+
+    # вживую: незакрытые записи за весь период и все записи с сегодняшнего дня
+    clamped = ExpressionWrapper(
+        Coalesce(F("end_time"), Value(now, output_field=DateTimeField())) - F("start_time"),
+        output_field=DurationField(),
+    )
+    live = TimeTracking.objects.filter(start_time__gte=day_start(start), start_time__lt=day_start(end + timedelta(days=1)))
+    live = scoped(live.filter(Q(end_time__isnull=True) | Q(start_time__gte=day_start(today))), filters)
+    live, _ = grouped(live, Trunc("start_time", period, output_field=DateField()) if period else None, group_by)
+    live = live.annotate(total=Sum(clamped), total_entries=Count("id"))
+
+    rows = defaultdict(lambda: {"seconds": 0, "entries": 0})
+    for items, get_seconds in ((rollups, lambda item: item["total_seconds"] or 0), (live, lambda item: seconds(item["total"]))):
+        for item in items:
+            key = tuple(item[source] for source, _ in fields)
+            row = rows[key]
+            row["seconds"] += get_seconds(item)
+            row["entries"] += item["total_entries"]
+
+    labels = [label for _, label in fields]
+    result = sorted(({**dict(zip(labels, key)), **totals} for key, totals in rows.items()), key=sort_key)
+
+    return {
+        "start": start,
+        "end": end,
+        "period": period,
+        "group_by": group_by,
+        "total_seconds": sum(row["seconds"] for row in result),
+        "entries": sum(row["entries"] for row in result),
+        "rows": result,
+    }
@@ -1,5 +1,12 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_safe
+from django.views import View
 from django.views.generic import TemplateView
 from typing import Any
+from tasks.metrics import registry
+from tasks import media as media_files
 from tasks.models import Task, Project
 
 class ShowTaskView(TemplateView):
@@ -10,4 +17,27 @@ class ShowTaskView(TemplateView):
         context["tasks"] = Task.objects.all()
         context["projects"] = Project.objects.all()
         return context
-""" здесь находится мини-страница (1 зад-е джабы)"""
\ No newline at end of file
+""" здесь находится мини-страница (1 зад-е джабы)"""
+
+
+class MetricsView(View):
+    """гистограммы MetricsMiddleware в формате Prometheus. только для своих, см. METRICS_TOKEN"""
+
+    def allowed(self, request):
+        token = settings.METRICS_TOKEN
+        if token and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return True
+        if request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS:
+            return True
+        return request.user.is_staff
+
+    def get(self, request):
+        if not self.allowed(request):
+            return HttpResponseForbidden()
+        return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@require_safe
+def media(request, path):
+    """загруженные файлы: ETag, Range, а за прокси - X-Accel-Redirect/X-Sendfile"""
+    return media_files.serve(request, path)